@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from collections import OrderedDict
+from typing import Callable
+
+from follower_ids import FollowerIdSet
+
+logger = logging.getLogger(__name__)
+
+# Файл выгруженного аккаунта: заголовок (метка, версия набора в базе, число ID),
+# затем отсортированные ID uint64 little-endian
+SPILL_HEADER = struct.Struct("<8sQQ")
+SPILL_MAGIC = b"SMFIDS1\0"
+
+
+class AccountState:
+    """Состояние аккаунта в памяти: известные подписчики (профили — в общем ProfileCache)"""
+
+    __slots__ = ("known", "version", "spilled_version", "pins")
+
+    def __init__(self, known: FollowerIdSet, version: int, spilled_version: int):
+        self.known = known
+        # Версия набора подписчиков в базе и версия, записанная в файл выгрузки
+        self.version = version
+        self.spilled_version = spilled_version
+        # Сколько проверок сейчас используют состояние: такое не вытесняется
+        self.pins = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self.known.nbytes
+
+
+class AccountStateCache:
+    """Состояние аккаунтов с загрузкой по требованию и вытеснением давно не проверявшихся.
+
+    Аккаунт загружается при первой проверке, а не при запуске. В памяти
+    держатся до max_accounts последних проверенных аккаунтов в пределах
+    max_bytes; остальные вытесняются. Перед вытеснением набор ID
+    записывается в файл directory/<аккаунт>.ids, и при следующей загрузке
+    файл отображается в память (mmap) вместо чтения и сортировки строк из
+    базы: страницы подгружает ОС по мере обращения. Файл годен, только пока
+    его версия совпадает с версией набора в базе, иначе набор читается из
+    базы заново. Профили подписчиков при загрузке не читаются: общий
+    ProfileCache подгружает их из базы по мере надобности, и своей памятью
+    он ограничен отдельно.
+
+    Данные аккаунта вне кэша (кэш страниц) учитываются через extra_bytes
+    в том же бюджете max_bytes и сбрасываются через on_evict, когда
+    состояние аккаунта вытесняется.
+    """
+
+    def __init__(self, store, directory: str, max_accounts: int, max_bytes: int,
+                 extra_bytes: Callable[[str], int] | None = None,
+                 on_evict: Callable[[str], None] | None = None):
+        self.store = store
+        self.directory = directory
+        self.max_accounts = max(1, max_accounts)
+        self.max_bytes = max_bytes
+        self.extra_bytes = extra_bytes
+        self.on_evict = on_evict
+        self.hot: OrderedDict[str, AccountState] = OrderedDict()
+        self._loading: dict[str, asyncio.Future] = {}
+        self.stats = dict.fromkeys(("hits", "loads_mmap", "loads_db", "evictions", "spills"), 0)
+        os.makedirs(directory, exist_ok=True)
+
+    def __contains__(self, account_id: str) -> bool:
+        return account_id in self.hot
+
+    def __getitem__(self, account_id: str) -> AccountState:
+        return self.hot[account_id]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(self._account_bytes(account_id, state) for account_id, state in self.hot.items())
+
+    def _account_bytes(self, account_id: str, state: AccountState) -> int:
+        extra = self.extra_bytes(account_id) if self.extra_bytes else 0
+        return state.nbytes + extra
+
+    def _path(self, account_id: str) -> str:
+        return os.path.join(self.directory, f"{account_id}.ids")
+
+    # ───────────────────────────────────────────────
+    # Загрузка
+    # ───────────────────────────────────────────────
+    async def acquire(self, account_id: str) -> AccountState:
+        """Состояние аккаунта для проверки; до release() оно не вытесняется"""
+        state = self.hot.get(account_id)
+        if state is not None:
+            self.stats["hits"] += 1
+            self.hot.move_to_end(account_id)
+        else:
+            loading = self._loading.get(account_id)
+            if loading is None:
+                loading = self._loading[account_id] = asyncio.ensure_future(asyncio.to_thread(self._read, account_id))
+                try:
+                    state = await loading
+                finally:
+                    del self._loading[account_id]
+                self.hot[account_id] = state
+            else:
+                await loading
+                state = self.hot[account_id]
+        state.pins += 1
+        return state
+
+    def _read(self, account_id: str) -> AccountState:
+        started = time.monotonic()
+        version = self.store.follower_version(account_id)
+        known, spilled_version = self._map_spill(account_id, version), version
+        if known is None:
+            ids, version = self.store.load_follower_ids(account_id)
+            known, spilled_version = FollowerIdSet(ids), -1
+            self.stats["loads_db"] += 1
+            source = "база"
+        else:
+            self.stats["loads_mmap"] += 1
+            source = "mmap"
+        logger.info(f"Загружено состояние аккаунта {account_id} ({source}): {len(known)} подписчиков "
+                    f"за {time.monotonic() - started:.2f} секунд")
+        return AccountState(known, version, spilled_version)
+
+    def _map_spill(self, account_id: str, version: int) -> FollowerIdSet | None:
+        """Набор ID из файла выгрузки, если его версия совпадает с базой"""
+        try:
+            with open(self._path(account_id), "rb") as f:
+                header = f.read(SPILL_HEADER.size)
+                if len(header) < SPILL_HEADER.size:
+                    return None
+                magic, spilled, count = SPILL_HEADER.unpack(header)
+                if magic != SPILL_MAGIC or spilled != version:
+                    return None
+                if count == 0:
+                    return FollowerIdSet()
+                if sys.byteorder != "little":
+                    ids = array("Q")
+                    ids.frombytes(f.read(count * 8))
+                    ids.byteswap()
+                    return FollowerIdSet(ids)
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Файл выгрузки аккаунта {account_id} не прочитан: {e}")
+            return None
+        if len(mm) < SPILL_HEADER.size + count * 8:
+            mm.close()
+            return None
+        # memoryview держит отображение открытым, пока набор используется
+        return FollowerIdSet(memoryview(mm)[SPILL_HEADER.size:SPILL_HEADER.size + count * 8].cast("Q"))
+
+    # ───────────────────────────────────────────────
+    # Обновление и вытеснение
+    # ───────────────────────────────────────────────
+    def update(self, account_id: str, known: FollowerIdSet, version: int) -> None:
+        """Новый набор подписчиков после проверки и его версия в базе"""
+        state = self.hot[account_id]
+        state.known = known
+        state.version = version
+
+    async def release(self, account_id: str) -> None:
+        state = self.hot.get(account_id)
+        if state is not None:
+            state.pins = max(0, state.pins - 1)
+        await self._evict()
+
+    async def _evict(self) -> None:
+        total = self.nbytes
+        for account_id in list(self.hot):
+            if len(self.hot) <= self.max_accounts and total <= self.max_bytes:
+                break
+            state = self.hot.get(account_id)
+            if state is None or state.pins:
+                continue
+            total -= self._account_bytes(account_id, state)
+            del self.hot[account_id]
+            if self.on_evict:
+                self.on_evict(account_id)
+            self.stats["evictions"] += 1
+            if state.spilled_version != state.version:
+                await asyncio.to_thread(self._spill, account_id, state)
+
+    def _spill(self, account_id: str, state: AccountState) -> None:
+        ids = state.known.to_array()
+        if sys.byteorder != "little":
+            ids = array("Q", ids)
+            ids.byteswap()
+        path = self._path(account_id)
+        tmp = path + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(SPILL_HEADER.pack(SPILL_MAGIC, state.version, len(ids)))
+                ids.tofile(f)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.error(f"Ошибка выгрузки состояния аккаунта {account_id}: {e}")
+            return
+        state.spilled_version = state.version
+        self.stats["spills"] += 1
+
+    def discard(self, account_id: str) -> None:
+        """Забыть состояние в памяти (аккаунт перешёл к другой реплике); файл остаётся"""
+        self.hot.pop(account_id, None)
+
+    def spill_all(self) -> None:
+        """Выгрузка изменённых наборов при остановке, чтобы следующий запуск отобразил их из файлов"""
+        for account_id, state in self.hot.items():
+            if state.spilled_version != state.version:
+                self._spill(account_id, state)
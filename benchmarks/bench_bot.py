@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Сквозной бенчмарк бота без сети: настоящий SmuleFollowersBot против
+локальных заменителей Smule и Telegram (benchmarks/fake_services.py).
+
+Для каждого сценария (число аккаунтов × подписчиков на аккаунт) бот
+делает первый проход (исходные списки), затем несколько циклов: отток
+подписчиков, инкрементальный проход (находит подписки) и полная сверка
+(FULL_SYNC_EVERY=1, находит отписки). В конце — полная сверка без оттока:
+все страницы не изменились, и она проверяет условные запросы (ответы 304).
+Уведомления первого прохода отбрасываются, остальные отправляет фоновый
+воркер в заменитель Telegram, который отвечает 429 при превышении лимитов.
+Замеряются:
+
+  - время прохода и число запросов к API (первого, инкрементального,
+    полной сверки после оттока и без него, с числом ответов 304);
+  - пиковая память процесса бота (ru_maxrss);
+  - задержка уведомления от события в Smule до приёма сообщения Telegram,
+    отдельно для подписок и отписок;
+  - отказы 429 и недоставленные за отведённое время события.
+
+Каждый сценарий запускается в отдельном процессе, чтобы пиковая память
+не накапливалась между сценариями.
+
+    python benchmarks/bench_bot.py                       # small, wide, large
+    python benchmarks/bench_bot.py huge --cycles 2        # 1M подписчиков
+    python benchmarks/bench_bot.py --accounts 50 --followers 5000 --error-rate 0.05
+    python benchmarks/bench_bot.py --save baseline.json
+    python benchmarks/bench_bot.py --compare baseline.json --tolerance 0.25
+
+С --compare код выхода 1, если время прохода, число запросов, память или
+p95 задержки хуже сохранённых больше чем на tolerance.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import socket
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Сценарий -> (аккаунтов, подписчиков на аккаунт)
+SCENARIOS = {
+    "small": (10, 1_000),
+    "wide": (500, 1_000),
+    "large": (1, 100_000),
+    "huge": (1, 1_000_000),
+    "many": (100, 10_000),
+}
+DEFAULT_SCENARIOS = ("small", "wide", "large")
+
+# Метрики для --compare: меньше — лучше
+COMPARED = ("initial_cycle_s", "churn_cycle_s", "full_cycle_s", "quiet_full_cycle_s",
+            "initial_requests", "churn_requests", "full_requests", "quiet_full_requests",
+            "peak_rss_mb", "follow_latency_p95_s", "unfollow_latency_p95_s")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def get_json(session, url: str, method: str = "GET", payload: dict | None = None) -> dict:
+    async with session.request(method, url, json=payload) as resp:
+        return await resp.json()
+
+
+async def timed_pass(bot, admin, base: str) -> tuple[float, int, int]:
+    """Проход check_new_followers: (секунд, запросов к Smule, из них 304)"""
+    await get_json(admin, f"{base}/_smule_reset", "POST")
+    started = time.perf_counter()
+    await bot.check_new_followers()
+    elapsed = time.perf_counter() - started
+    stats = await get_json(admin, f"{base}/_smule_stats")
+    return elapsed, stats["requests"], stats["not_modified"]
+
+
+def summarize(result: dict, prefix: str, passes: list[tuple[float, int, int]]) -> None:
+    if passes:
+        result[f"{prefix}_cycle_s"] = statistics.mean(p[0] for p in passes)
+        result[f"{prefix}_requests"] = statistics.mean(p[1] for p in passes)
+        result[f"{prefix}_not_modified"] = statistics.mean(p[2] for p in passes)
+
+
+async def run_bot(args: argparse.Namespace, accounts: int, port: int) -> dict:
+    import aiohttp
+    from telegram import Bot
+
+    import smule_bot
+
+    logging.getLogger().setLevel(logging.WARNING)
+    base = f"http://127.0.0.1:{port}"
+    smule_bot.SMULE_API_URL = f"{base}/api/profile/followers"
+    smule_bot.SMULE_PROFILE_API_URL = f"{base}/api/profile/batch"
+
+    bot = smule_bot.SmuleFollowersBot("1:bench", "1", [str(a + 1) for a in range(accounts)])
+    bot.bot = Bot("1:bench", base_url=f"{base}/bot")
+    bot.rate_limiter = smule_bot.TelegramRateLimiter(args.bot_per_second, args.bot_per_minute)
+    result: dict = {}
+
+    async with aiohttp.ClientSession() as admin:
+        try:
+            # Первый проход: исходные списки подписчиков
+            started = time.perf_counter()
+            await bot.check_new_followers()
+            result["initial_cycle_s"] = time.perf_counter() - started
+            result["initial_requests"] = (await get_json(admin, f"{base}/_smule_stats"))["requests"]
+            result["rss_after_initial_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+            # Сводки первого прохода о «новых» подписчиках в замер не входят
+            while due := bot.store.due_notifications(time.time() + 1, 1000):
+                for notification_id, *_ in due:
+                    bot.store.mark_sent(notification_id, 0)
+            bot.start_delivery()
+
+            # FULL_SYNC_EVERY=1: после каждого инкрементального прохода идёт полная сверка
+            incremental, full = [], []
+            for _ in range(args.cycles):
+                await get_json(admin, f"{base}/_churn", "POST",
+                               {"follows": args.follows, "unfollows": args.unfollows})
+                incremental.append(await timed_pass(bot, admin, base))
+                full.append(await timed_pass(bot, admin, base))
+                if args.interval:
+                    await asyncio.sleep(args.interval)
+            summarize(result, "churn", incremental)
+            summarize(result, "full", full)
+            if args.cycles:
+                # Ещё одна пара проходов без оттока: полная сверка по неизменившимся страницам
+                await timed_pass(bot, admin, base)
+                summarize(result, "quiet_full", [await timed_pass(bot, admin, base)])
+
+            # Дожидаемся отправки очереди уведомлений
+            deadline = time.monotonic() + args.drain_timeout
+            while bot.store.pending_notifications() and time.monotonic() < deadline:
+                await asyncio.sleep(0.2)
+            result["undelivered_notifications"] = bot.store.pending_notifications()
+        finally:
+            await bot.close()
+
+        telegram = await get_json(admin, f"{base}/_telegram_stats")
+
+    result.update({
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "telegram_messages": telegram["messages"],
+        "telegram_429": telegram["rejected_429"],
+    })
+    for kind, per_cycle in (("follow", args.follows), ("unfollow", args.unfollows)):
+        latencies = telegram["latencies"][kind]
+        result.update({
+            f"{kind}_events": args.cycles * accounts * per_cycle,
+            f"{kind}_events_notified": len(latencies),
+            f"{kind}_latency_p50_s": percentile(latencies, 0.5),
+            f"{kind}_latency_p95_s": percentile(latencies, 0.95),
+            f"{kind}_latency_max_s": max(latencies) if latencies else None,
+        })
+    return result
+
+
+def run_scenario(args: argparse.Namespace, name: str, accounts: int, followers: int, out) -> None:
+    """Тело процесса сценария: заменители, чистый DATA_DIR и один бот"""
+    import fake_services
+
+    data_dir = tempfile.mkdtemp(prefix="smule_bench_")
+    os.environ.update({
+        "DATA_DIR": data_dir,
+        "HEALTH_PORT": "0",
+        "SMULE_MIN_REQUEST_INTERVAL": str(args.pace),
+        "ACCOUNT_RETRY_DELAY": "0.5",
+        "ACCOUNT_BACKOFF_BASE": "1",
+        "ACCOUNT_BACKOFF_MAX": "5",
+        "FULL_SYNC_EVERY": "1",
+    })
+    port = free_port()
+    services = fake_services.run_in_process({
+        "accounts": accounts, "followers": followers, "latency": args.latency,
+        "error_rate": args.error_rate, "max_page": args.max_page,
+        "tg_per_second": args.tg_per_second, "tg_per_minute": args.tg_per_minute,
+    }, port)
+    try:
+        result = asyncio.run(run_bot(args, accounts, port))
+    finally:
+        services.terminate()
+    out.put({"scenario": name, "accounts": accounts, "followers": followers, **result})
+
+
+def run_isolated(args: argparse.Namespace, name: str, accounts: int, followers: int) -> dict:
+    ctx = multiprocessing.get_context("spawn")
+    out = ctx.Queue()
+    process = ctx.Process(target=run_scenario, args=(args, name, accounts, followers, out))
+    process.start()
+    process.join()
+    if process.exitcode != 0 or out.empty():
+        raise RuntimeError(f"Сценарий {name} завершился с кодом {process.exitcode}")
+    return out.get()
+
+
+def fmt(value, digits: int = 2) -> str:
+    if value is None:
+        return "—"
+    return f"{value:.{digits}f}" if isinstance(value, float) else str(value)
+
+
+def print_result(r: dict) -> None:
+    print(f"\n{r['scenario']}: {r['accounts']} аккаунтов × {r['followers']} подписчиков")
+    print(f"  первый проход        {fmt(r['initial_cycle_s'])} с, запросов {r['initial_requests']}")
+    for prefix, title in (("churn", "инкрементальный     "), ("full", "полная сверка       "),
+                          ("quiet_full", "сверка без оттока   ")):
+        if f"{prefix}_cycle_s" in r:
+            print(f"  {title} {fmt(r[f'{prefix}_cycle_s'])} с, запросов {fmt(r[f'{prefix}_requests'], 1)} "
+                  f"(из них 304: {fmt(r[f'{prefix}_not_modified'], 1)})")
+    print(f"  пиковая память       {fmt(r['peak_rss_mb'], 1)} МБ "
+          f"(после первого прохода {fmt(r['rss_after_initial_mb'], 1)} МБ)")
+    print(f"  Telegram             сообщений {r['telegram_messages']}, отказов 429 {r['telegram_429']}, "
+          f"в очереди осталось {r['undelivered_notifications']}")
+    for kind, title in (("follow", "подписки"), ("unfollow", "отписки ")):
+        print(f"  задержка ({title})   p50 {fmt(r[f'{kind}_latency_p50_s'])} с, "
+              f"p95 {fmt(r[f'{kind}_latency_p95_s'])} с, max {fmt(r[f'{kind}_latency_max_s'])} с "
+              f"({r[f'{kind}_events_notified']} из {r[f'{kind}_events']} событий)")
+
+
+def compare(results: list[dict], baseline_path: str, tolerance: float) -> list[str]:
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {r["scenario"]: r for r in json.load(f)}
+    regressions = []
+    for r in results:
+        old = baseline.get(r["scenario"])
+        if old is None:
+            continue
+        for key in COMPARED:
+            before, after = old.get(key), r.get(key)
+            if before is None or after is None:
+                continue
+            if after > before * (1 + tolerance) and after - before > 1e-3:
+                regressions.append(f"{r['scenario']}.{key}: {fmt(before)} → {fmt(after)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сквозной бенчмарк бота против заменителей Smule и Telegram")
+    parser.add_argument("scenarios", nargs="*", help=f"сценарии: {', '.join(SCENARIOS)}")
+    parser.add_argument("--accounts", type=int, help="свой сценарий: число аккаунтов")
+    parser.add_argument("--followers", type=int, default=1000, help="свой сценарий: подписчиков на аккаунт")
+    parser.add_argument("--cycles", type=int, default=3,
+                        help="циклов оттока (инкрементальный проход и полная сверка на каждый)")
+    parser.add_argument("--follows", type=int, default=3, help="новых подписчиков на аккаунт за проход")
+    parser.add_argument("--unfollows", type=int, default=1, help="отписок на аккаунт за проход")
+    parser.add_argument("--interval", type=float, default=0.0, help="пауза между проходами, секунд")
+    parser.add_argument("--latency", type=float, default=0.0, help="средняя задержка ответа Smule, секунд")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503 от Smule")
+    parser.add_argument("--max-page", type=int, default=100, help="наибольший размер страницы у Smule")
+    parser.add_argument("--pace", type=float, default=0.0, help="SMULE_MIN_REQUEST_INTERVAL бота")
+    parser.add_argument("--tg-per-second", type=float, default=1.0, help="лимит Telegram на чат в секунду")
+    parser.add_argument("--tg-per-minute", type=int, default=20, help="лимит Telegram на чат в минуту")
+    parser.add_argument("--bot-per-second", type=float, default=1.0, help="ограничитель бота в секунду")
+    parser.add_argument("--bot-per-minute", type=int, default=20, help="ограничитель бота в минуту")
+    parser.add_argument("--drain-timeout", type=float, default=300.0, help="ожидание отправки очереди, секунд")
+    parser.add_argument("--json", action="store_true", help="результат в JSON")
+    parser.add_argument("--save", help="сохранить результат как базовый")
+    parser.add_argument("--compare", help="сравнить с сохранённым базовым результатом")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимое ухудшение для --compare")
+    args = parser.parse_args()
+
+    runs = []
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"неизвестный сценарий {name!r}")
+        runs.append((name, *SCENARIOS[name]))
+    if args.accounts:
+        runs.append((f"custom-{args.accounts}x{args.followers}", args.accounts, args.followers))
+    if not runs:
+        runs = [(name, *SCENARIOS[name]) for name in DEFAULT_SCENARIOS]
+
+    results = []
+    for name, accounts, followers in runs:
+        r = run_isolated(args, name, accounts, followers)
+        results.append(r)
+        if not args.json:
+            print_result(r)
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        if regressions:
+            print("\nУхудшения относительно базового результата:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nУхудшений больше {args.tolerance:.0%} нет")
+
+
+if __name__ == "__main__":
+    main()
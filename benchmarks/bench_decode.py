@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Скорость разбора страницы подписчиков: прежний путь (json + словарь на
+подписчика в _extract_info) против follower_decode с каждым из
+установленных разборщиков. Результат — страниц в секунду.
+
+    python benchmarks/bench_decode.py [подписчиков на странице] [секунд на замер]
+"""
+
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from follower_decode import available_backends, make_decoder  # noqa: E402
+
+
+def make_page(n: int) -> bytes:
+    """Страница в формате Smule: кроме нужных боту полей в ответе много лишних"""
+    followers = []
+    for i in range(n):
+        fid = 3_000_000_000 + i * 7
+        followers.append({
+            "account_id": fid,
+            "handle": f"singer_{fid}",
+            "name": f"Singer Name {i}" if i % 3 == 0 else "",
+            "pic_url": f"https://c-cdnet.cdn.smule.com/pic/{fid}.jpg",
+            "url": f"/singer_{fid}",
+            "verified": i % 50 == 0,
+            "is_vip": i % 10 == 0,
+            "is_following": False,
+            "installed_apps": [{"app_uid": "sing", "platform": "android"}],
+            "first_name": "", "last_name": "",
+            "blurb": "Love singing duets! " * 3,
+            "picture_type": "custom",
+        })
+    return json.dumps({"list": followers, "next_offset": n}).encode()
+
+
+def legacy(body: bytes) -> list:
+    """Разбор до появления follower_decode"""
+    data = json.loads(body)
+    result = []
+    for f in data["list"]:
+        result.append({
+            "account_id": str(f.get("account_id") or ""),
+            "handle": f.get("handle") or "Unknown",
+            "name": f.get("name") or f.get("handle") or "Unknown",
+            "pic_url": f.get("pic_url") or "",
+            "verified": bool(f.get("verified", False)),
+            "is_vip": bool(f.get("is_vip", False)),
+        })
+    return result
+
+
+def measure(decode, body: bytes, seconds: float) -> float:
+    pages = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        decode(body)
+        pages += 1
+    return pages / (time.perf_counter() - start)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+    body = make_page(n)
+
+    rows = [("json + dict (прежний путь)", measure(legacy, body, seconds))]
+    for backend in available_backends():
+        _, decode = make_decoder(backend)
+        rows.append((f"follower_decode: {backend}", measure(lambda b: decode(b)["list"], body, seconds)))
+
+    base = rows[0][1]
+    print(f"Подписчиков на странице: {n}, размер: {len(body)} байт")
+    for name, rate in rows:
+        print(f"{name:<30} {rate:10.0f} стр/с  x{rate / base:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Память на хранение подписчиков: set[str] + dict метаданных против
+FollowerIdSet + ProfileCache. Результат пересчитывается на 100k подписчиков.
+
+    python benchmarks/bench_memory.py [число подписчиков]
+"""
+
+import os
+import sys
+import tracemalloc
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from follower_ids import PROFILE_RECORD_BYTES, FollowerIdSet, ProfileCache  # noqa: E402
+
+DEFAULT_PIC = "https://c-cdnet.cdn.smule.com/smule-gg-uw1-s-7/arr/default_avatar.jpg"
+
+
+def make_infos(n: int) -> list[dict]:
+    infos = []
+    for i in range(n):
+        fid = 3_000_000_000 + i * 7
+        infos.append({
+            "account_id": str(fid),
+            "handle": f"singer_{fid}",
+            "name": f"singer_{fid}" if i % 3 else f"Singer Name {i}",
+            # Примерно у трети подписчиков стандартный аватар
+            "pic_url": DEFAULT_PIC if i % 3 == 0 else f"https://c-cdnet.cdn.smule.com/pic/{fid}.jpg",
+            "verified": i % 50 == 0,
+            "is_vip": i % 10 == 0,
+        })
+    return infos
+
+
+def measure(build) -> int:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    obj = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del obj
+    return after - before
+
+
+def fresh(info: dict) -> dict:
+    """Копия со своими строками, как после разбора JSON.
+
+    Без копирования замер не учёл бы строки, которые принадлежат infos.
+    """
+    return {k: (v + " ")[:-1] if isinstance(v, str) else v for k, v in info.items()}
+
+
+def legacy(infos: list[dict]):
+    ids = {(info["account_id"] + " ")[:-1] for info in infos}
+    meta = {}
+    for info in infos:
+        info = fresh(info)
+        meta[info["account_id"]] = info
+    return ids, meta
+
+
+def compact(infos: list[dict]):
+    ids = FollowerIdSet.from_unsorted(int(info["account_id"]) for info in infos)
+    meta = ProfileCache(len(infos) * PROFILE_RECORD_BYTES, ttl=0)
+    for info in infos:
+        meta.update(int(info["account_id"]), fresh(info), 0)
+    return ids, meta
+
+
+def compact_ids_only(infos: list[dict]):
+    return FollowerIdSet(array("Q", sorted(int(info["account_id"]) for info in infos)))
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    infos = make_infos(n)
+
+    scale = 100_000 / n
+    rows = [
+        ("set[str] + dict[str, dict]", measure(lambda: legacy(infos))),
+        ("FollowerIdSet + ProfileCache", measure(lambda: compact(infos))),
+        ("set[str] (только ID)", measure(lambda: {(info["account_id"] + " ")[:-1] for info in infos})),
+        ("FollowerIdSet (только ID)", measure(lambda: compact_ids_only(infos))),
+    ]
+
+    print(f"Подписчиков: {n}")
+    for name, size in rows:
+        print(f"{name:<36} {size * scale / 1024 / 1024:8.2f} МБ на 100k")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Локальные заменители Smule API и Telegram Bot API для бенчмарков.
+
+FakeSmule отдаёт /api/profile/followers по заданному числу аккаунтов и
+подписчиков, с задержкой, долей ошибок и ETag. Отток (подписки и отписки)
+создаётся по запросу POST /_churn; время и тип каждого события запоминаются,
+чтобы FakeTelegram мог посчитать задержку уведомления (отдельно для подписок
+и отписок), найдя в тексте сообщения ник подписчика (@u<ID>).
+
+FakeTelegram принимает sendMessage и, как настоящий Telegram, отвечает 429
+с retry_after при превышении лимитов на чат.
+
+Оба сервиса запускаются в отдельном процессе (run_in_process), чтобы их
+работа не влияла на время цикла и пиковую память бота.
+"""
+
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import random
+import re
+import time
+from array import array
+from collections import deque
+
+from aiohttp import web
+
+FIRST_ID = 3_000_000_000
+HANDLE_RE = re.compile(r"@u(\d+)")
+
+
+class FakeSmule:
+    def __init__(self, accounts: int, followers: int, latency: float = 0.0, error_rate: float = 0.0,
+                 max_page: int = 100, seed: int = 1):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.max_page = max_page
+        self.random = random.Random(seed)
+        # Подписчики аккаунта от новых к старым
+        self.followers: dict[str, array] = {}
+        for a in range(accounts):
+            start = FIRST_ID + a * 10_000_000
+            self.followers[str(a + 1)] = array("Q", range(start + followers - 1, start - 1, -1))
+        self.next_id = FIRST_ID + accounts * 10_000_000
+        # ID подписчика -> (время события, "follow" или "unfollow")
+        self.events: dict[int, tuple[float, str]] = {}
+        self.stats = {"requests": 0, "not_modified": 0, "errors": 0, "bytes": 0}
+
+    async def followers_page(self, request: web.Request) -> web.Response:
+        self.stats["requests"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency * (0.5 + self.random.random()))
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.stats["errors"] += 1
+            return web.Response(status=503, text="Service Unavailable")
+
+        ids = self.followers.get(request.query.get("accountId", ""))
+        if ids is None:
+            return web.Response(status=404, text="Not Found")
+        offset = int(request.query.get("offset", 0))
+        limit = min(int(request.query.get("limit", 20)), self.max_page)
+        page = [{"account_id": fid, "handle": f"u{fid}", "name": f"User {fid}", "pic_url": "",
+                 "verified": False, "is_vip": fid % 10 == 0} for fid in ids[offset:offset + limit]]
+        body = json.dumps({"list": page, "next_offset": offset + len(page)}).encode()
+
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if request.headers.get("If-None-Match") == etag:
+            self.stats["not_modified"] += 1
+            return web.Response(status=304, headers={"ETag": etag})
+        self.stats["bytes"] += len(body)
+        return web.Response(body=body, content_type="application/json", headers={"ETag": etag})
+
+    async def profiles_batch(self, request: web.Request) -> web.Response:
+        """Профили по списку accountIds в формате страницы подписчиков"""
+        self.stats["requests"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency * (0.5 + self.random.random()))
+        ids = [int(fid) for fid in request.query.get("accountIds", "").split(",") if fid.isdigit()]
+        page = [{"account_id": fid, "handle": f"u{fid}", "name": f"User {fid}", "pic_url": "",
+                 "verified": False, "is_vip": fid % 10 == 0} for fid in ids]
+        return web.json_response({"list": page})
+
+    async def churn(self, request: web.Request) -> web.Response:
+        """Новые подписчики в начало списка и отписки случайных старых"""
+        data = await request.json()
+        follows, unfollows = int(data.get("follows", 0)), int(data.get("unfollows", 0))
+        now = time.time()
+        for ids in self.followers.values():
+            for _ in range(min(unfollows, len(ids))):
+                i = self.random.randrange(len(ids))
+                self.events[ids[i]] = (now, "unfollow")
+                del ids[i]
+            new = array("Q", range(self.next_id + follows - 1, self.next_id - 1, -1))
+            self.next_id += follows
+            for fid in new:
+                self.events[fid] = (now, "follow")
+            ids[0:0] = new
+        return web.json_response({"ok": True})
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats)
+
+    async def reset_stats(self, request: web.Request) -> web.Response:
+        for key in self.stats:
+            self.stats[key] = 0
+        return web.json_response({"ok": True})
+
+
+class FakeTelegram:
+    def __init__(self, smule: FakeSmule, per_second: float = 1.0, per_minute: int = 20):
+        self.smule = smule
+        self.min_gap = 1.0 / per_second if per_second > 0 else 0.0
+        self.per_minute = per_minute
+        self.sent: dict[str, deque] = {}
+        self.latencies: dict[str, list[float]] = {"follow": [], "unfollow": []}
+        self.stats = {"messages": 0, "rejected_429": 0}
+        self.message_id = 0
+
+    async def send_message(self, request: web.Request) -> web.Response:
+        if request.content_type == "application/json":
+            data = await request.json()
+        else:
+            data = dict(await request.post())
+        chat_id = str(data.get("chat_id", ""))
+        text = str(data.get("text", ""))
+
+        now = time.time()
+        history = self.sent.setdefault(chat_id, deque())
+        while history and history[0] <= now - 60:
+            history.popleft()
+        retry_after = 0.0
+        if history and now - history[-1] < self.min_gap:
+            retry_after = self.min_gap - (now - history[-1])
+        if self.per_minute and len(history) >= self.per_minute:
+            retry_after = max(retry_after, history[0] + 60 - now)
+        if retry_after > 0:
+            self.stats["rejected_429"] += 1
+            seconds = max(1, int(retry_after + 0.999))
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {seconds}",
+                "parameters": {"retry_after": seconds},
+            }, status=429)
+
+        history.append(now)
+        self.stats["messages"] += 1
+        for match in HANDLE_RE.finditer(text):
+            event = self.smule.events.pop(int(match.group(1)), None)
+            if event is not None:
+                happened, kind = event
+                self.latencies[kind].append(now - happened)
+
+        self.message_id += 1
+        return web.json_response({"ok": True, "result": {
+            "message_id": self.message_id, "date": int(now),
+            "chat": {"id": int(chat_id) if chat_id.lstrip("-").isdigit() else 0, "type": "private"},
+            "text": text,
+        }})
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({**self.stats, "latencies": self.latencies})
+
+
+def build_app(options: dict) -> web.Application:
+    smule = FakeSmule(options["accounts"], options["followers"], options.get("latency", 0.0),
+                      options.get("error_rate", 0.0), options.get("max_page", 100))
+    telegram = FakeTelegram(smule, options.get("tg_per_second", 1.0), options.get("tg_per_minute", 20))
+    app = web.Application()
+    app.router.add_get("/api/profile/followers", smule.followers_page)
+    app.router.add_get("/api/profile/batch", smule.profiles_batch)
+    app.router.add_post("/_churn", smule.churn)
+    app.router.add_get("/_smule_stats", smule.get_stats)
+    app.router.add_post("/_smule_reset", smule.reset_stats)
+    app.router.add_get("/_telegram_stats", telegram.get_stats)
+    app.router.add_post("/bot{token}/sendMessage", telegram.send_message)
+    return app
+
+
+def _serve(options: dict, port: int, ready) -> None:
+    async def main():
+        runner = web.AppRunner(build_app(options), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        ready.set()
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+def run_in_process(options: dict, port: int) -> multiprocessing.Process:
+    """Запуск обоих заменителей в дочернем процессе; возвращается после готовности"""
+    ready = multiprocessing.Event()
+    process = multiprocessing.Process(target=_serve, args=(options, port, ready), daemon=True)
+    process.start()
+    if not ready.wait(120):
+        process.terminate()
+        raise RuntimeError("Заменители Smule и Telegram не запустились")
+    return process
@@ -0,0 +1,215 @@
+import bisect
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from datetime import date, datetime, timezone
+from typing import Iterable, Iterator, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+# Запись события: время (unix, секунды), ID подписчика, тип события
+RECORD = struct.Struct("<IQB")
+# Счётчики за сутки: номер дня (UTC, от эпохи), подписки, отписки
+DAY_RECORD = struct.Struct("<III")
+
+FOLLOW = 1
+UNFOLLOW = 2
+
+SEGMENT_SUFFIX = ".seg"
+DAILY_FILE = "daily.bin"
+
+
+class FollowerEvent(NamedTuple):
+    timestamp: int
+    follower_id: str
+    kind: int
+
+
+class _Timestamps:
+    """Последовательность времён записей сегмента для bisect без распаковки всего файла"""
+
+    def __init__(self, buf, record: struct.Struct):
+        self.buf = buf
+        self.record = record
+
+    def __len__(self) -> int:
+        return len(self.buf) // self.record.size
+
+    def __getitem__(self, i: int) -> int:
+        return self.record.unpack_from(self.buf, i * self.record.size)[0]
+
+
+class EventLog:
+    """Журнал подписок и отписок: append-only, по каталогу на аккаунт.
+
+    События хранятся в сегментах из записей фиксированной длины (13 байт),
+    упорядоченных по времени. Имя сегмента начинается со времени его первой
+    записи, поэтому нужные сегменты и позиция внутри них находятся двоичным
+    поиском. Сегмент закрывается, когда в нём набирается segment_records
+    записей. Отдельный файл daily.bin хранит счётчики за сутки (UTC), чтобы
+    статистика оттока не требовала чтения всей истории.
+
+    Каталоги создаются только при записи: запросы по аккаунту без журнала
+    возвращают пустой результат и ничего не создают (экспорт из копии
+    данных не меняет её).
+    """
+
+    def __init__(self, root: str, segment_records: int = 65536):
+        self.root = root
+        self.segment_records = segment_records
+        self._lock = threading.Lock()
+
+    def _account_dir(self, account_id: str) -> str:
+        return os.path.join(self.root, account_id)
+
+    def _segments(self, account_id: str) -> list[tuple[int, str]]:
+        """Сегменты аккаунта по возрастанию: (время первой записи, путь)"""
+        path = self._account_dir(account_id)
+        try:
+            names = sorted(os.listdir(path))
+        except FileNotFoundError:
+            return []
+        segments = []
+        for name in names:
+            if name.endswith(SEGMENT_SUFFIX):
+                segments.append((int(name.split("_", 1)[0]), os.path.join(path, name)))
+        return segments
+
+    # ───────────────────────────────────────────────
+    # Запись
+    # ───────────────────────────────────────────────
+    def append(self, account_id: str, followed: Iterable[str], unfollowed: Iterable[str],
+               timestamp: float | None = None) -> None:
+        events = [(fid, FOLLOW) for fid in followed] + [(fid, UNFOLLOW) for fid in unfollowed]
+        if not events:
+            return
+
+        with self._lock:
+            os.makedirs(self._account_dir(account_id), exist_ok=True)
+            segments = self._segments(account_id)
+            ts = int(timestamp if timestamp is not None else time.time())
+
+            path = None
+            if segments:
+                path = segments[-1][1]
+                size = self._repair_tail(path, RECORD)
+                if size:
+                    with open(path, "rb") as f:
+                        f.seek(size - RECORD.size)
+                        # Время в журнале не должно убывать, иначе сломается поиск
+                        ts = max(ts, RECORD.unpack(f.read(RECORD.size))[0])
+                if size >= self.segment_records * RECORD.size:
+                    path = None
+            if path is None:
+                name = f"{ts:010d}_{len(segments):06d}{SEGMENT_SUFFIX}"
+                path = os.path.join(self._account_dir(account_id), name)
+
+            chunks = []
+            follows = unfollows = 0
+            for fid, kind in events:
+                try:
+                    chunks.append(RECORD.pack(ts, int(fid), kind))
+                except (ValueError, struct.error):
+                    logger.warning(f"Пропущено событие с нечисловым ID подписчика {fid!r} ({account_id})")
+                    continue
+                if kind == FOLLOW:
+                    follows += 1
+                else:
+                    unfollows += 1
+
+            with open(path, "ab") as f:
+                f.write(b"".join(chunks))
+                f.flush()
+                os.fsync(f.fileno())
+
+            self._add_daily(account_id, ts, follows, unfollows)
+
+    def _add_daily(self, account_id: str, ts: int, follows: int, unfollows: int) -> None:
+        path = os.path.join(self._account_dir(account_id), DAILY_FILE)
+        day = ts // 86400
+        size = self._repair_tail(path, DAY_RECORD)
+        with open(path, "r+b" if size else "wb") as f:
+            if size:
+                f.seek(size - DAY_RECORD.size)
+                last_day, last_follows, last_unfollows = DAY_RECORD.unpack(f.read(DAY_RECORD.size))
+                if last_day == day:
+                    follows += last_follows
+                    unfollows += last_unfollows
+                    f.seek(size - DAY_RECORD.size)
+            f.write(DAY_RECORD.pack(day, follows, unfollows))
+            f.flush()
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def _repair_tail(path: str, record: struct.Struct) -> int:
+        """Обрезка недописанной последней записи после сбоя; возвращает размер файла"""
+        if not os.path.exists(path):
+            return 0
+        size = os.path.getsize(path)
+        if size % record.size:
+            size -= size % record.size
+            with open(path, "r+b") as f:
+                f.truncate(size)
+            logger.warning(f"Обрезана недописанная запись в {path}")
+        return size
+
+    # ───────────────────────────────────────────────
+    # Запросы
+    # ───────────────────────────────────────────────
+    def accounts(self) -> list[str]:
+        """Аккаунты, у которых есть журнал, по возрастанию ID"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+
+    def record_count(self, account_id: str) -> int:
+        """Число записей в журнале аккаунта (по размеру сегментов, без чтения)"""
+        return sum(os.path.getsize(path) // RECORD.size for _, path in self._segments(account_id))
+
+    def query(self, account_id: str, since: float, until: float,
+              kind: int | None = None) -> Iterator[FollowerEvent]:
+        """События аккаунта в интервале [since, until), по возрастанию времени"""
+        segments = self._segments(account_id)
+        starts = [start for start, _ in segments]
+        first = max(bisect.bisect_right(starts, since) - 1, 0)
+
+        for start, path in segments[first:]:
+            if start >= until:
+                break
+            for event in self._read_segment(path, since, until):
+                if kind is None or event.kind == kind:
+                    yield event
+
+    @staticmethod
+    def _read_segment(path: str, since: float, until: float) -> Iterator[FollowerEvent]:
+        size = os.path.getsize(path) // RECORD.size * RECORD.size
+        if not size:
+            return
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as buf:
+            timestamps = _Timestamps(buf, RECORD)
+            for i in range(bisect.bisect_left(timestamps, since), len(timestamps)):
+                ts, fid, kind = RECORD.unpack_from(buf, i * RECORD.size)
+                if ts >= until:
+                    break
+                yield FollowerEvent(ts, str(fid), kind)
+
+    def churn_by_day(self, account_id: str, since: float, until: float) -> list[tuple[date, int, int]]:
+        """Подписки и отписки по суткам (UTC) в интервале [since, until)"""
+        path = os.path.join(self._account_dir(account_id), DAILY_FILE)
+        if not os.path.exists(path):
+            return []
+        with open(path, "rb") as f:
+            data = f.read()
+        data = data[:len(data) // DAY_RECORD.size * DAY_RECORD.size]
+
+        days = _Timestamps(data, DAY_RECORD)
+        result = []
+        for i in range(bisect.bisect_left(days, int(since) // 86400), len(days)):
+            day, follows, unfollows = DAY_RECORD.unpack_from(data, i * DAY_RECORD.size)
+            if day * 86400 >= until:
+                break
+            result.append((datetime.fromtimestamp(day * 86400, tz=timezone.utc).date(), follows, unfollows))
+        return result
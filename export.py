@@ -0,0 +1,263 @@
+import csv
+import glob
+import io
+import logging
+import os
+import shutil
+import sys
+import tempfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import BinaryIO, Iterable, Iterator, TextIO
+
+from event_log import FOLLOW, EventLog
+from follower_store import FollowerStore
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+FOLLOWER_COLUMNS = ("account_id", "follower_id", "handle", "name", "pic_url", "verified", "is_vip")
+EVENT_COLUMNS = ("account_id", "time", "follower_id", "event")
+DIFF_COLUMNS = ("account_id", "follower_id", "change", "handle", "name")
+FORMATS = ("csv", "parquet")
+
+# Аккаунты группируются в части примерно по PART_ROWS строк: часть читает
+# и кодирует один процесс. Внутри части строки идут порциями по CHUNK_ROWS,
+# это же размер группы строк Parquet
+PART_ROWS = 200_000
+CHUNK_ROWS = 50_000
+
+
+def plan_parts(sizes: Iterable[tuple[str, int]], part_rows: int = PART_ROWS) -> list[list[str]]:
+    """Аккаунты по порядку, сгруппированные в части примерно по part_rows строк"""
+    parts: list[list[str]] = []
+    current: list[str] = []
+    rows = 0
+    for account_id, count in sizes:
+        if current and rows + count > part_rows:
+            parts.append(current)
+            current, rows = [], 0
+        current.append(account_id)
+        rows += count
+    if current:
+        parts.append(current)
+    return parts
+
+
+# ───────────────────────────────────────────────
+# Части экспорта (выполняются в процессах пула)
+# ───────────────────────────────────────────────
+def _follower_rows(db_path: str, accounts: list[str]) -> Iterator[list[tuple]]:
+    store = FollowerStore(db_path, readonly=True)
+    try:
+        for account_id in accounts:
+            for chunk in store.iter_followers(account_id, CHUNK_ROWS):
+                yield [(account_id, fid, handle, name, pic_url, bool(verified), bool(is_vip))
+                       for fid, handle, name, pic_url, verified, is_vip in chunk]
+    finally:
+        store.close()
+
+
+def _event_rows(log_dir: str, accounts: list[str], since: float, until: float) -> Iterator[list[tuple]]:
+    log = EventLog(log_dir)
+    for account_id in accounts:
+        chunk = []
+        for event in log.query(account_id, since, until):
+            chunk.append((account_id, event.timestamp, event.follower_id,
+                          "follow" if event.kind == FOLLOW else "unfollow"))
+            if len(chunk) >= CHUNK_ROWS:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def _iso(ts: int) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _write_csv(chunks: Iterator[list[tuple]], path: str, kind: str) -> int:
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        for chunk in chunks:
+            if kind == "events":
+                chunk = [(account_id, _iso(ts), fid, event) for account_id, ts, fid, event in chunk]
+            writer.writerows(chunk)
+            count += len(chunk)
+    return count
+
+
+def _schema(kind: str) -> "pyarrow.Schema":
+    pa = pyarrow
+    if kind == "followers":
+        return pa.schema([("account_id", pa.string()), ("follower_id", pa.string()), ("handle", pa.string()),
+                          ("name", pa.string()), ("pic_url", pa.string()), ("verified", pa.bool_()),
+                          ("is_vip", pa.bool_())])
+    return pa.schema([("account_id", pa.string()), ("time", pa.timestamp("s", tz="UTC")),
+                      ("follower_id", pa.string()), ("event", pa.string())])
+
+
+def _write_parquet(chunks: Iterator[list[tuple]], path: str, kind: str) -> int:
+    schema = _schema(kind)
+    count = 0
+    with pyarrow.parquet.ParquetWriter(path, schema, compression="zstd") as writer:
+        for chunk in chunks:
+            columns = [pyarrow.array(column, type=field.type) for column, field in zip(zip(*chunk), schema)]
+            writer.write_table(pyarrow.Table.from_arrays(columns, schema=schema))
+            count += len(chunk)
+    return count
+
+
+def _export_part(kind: str, fmt: str, source: str, accounts: list[str], path: str,
+                 since: float, until: float) -> int:
+    """Чтение аккаунтов части и кодирование в файл path; возвращает число строк"""
+    if kind == "followers":
+        chunks = _follower_rows(source, accounts)
+    else:
+        chunks = _event_rows(source, accounts, since, until)
+    write = _write_parquet if fmt == "parquet" else _write_csv
+    return write(chunks, path, kind)
+
+
+# ───────────────────────────────────────────────
+# Экспорт
+# ───────────────────────────────────────────────
+def export(kind: str, fmt: str, output: str, source: str, account_ids: Iterable[str] | None = None,
+           since: float = 0.0, until: float = float("inf"), jobs: int = 0) -> int:
+    """Потоковый экспорт подписчиков или журнала событий; возвращает число строк.
+
+    kind="followers" — текущие подписчики с профилями, source — файл базы;
+    kind="events" — подписки и отписки за [since, until), source — каталог журнала.
+    Аккаунты делятся на части (plan_parts), каждую часть читает и кодирует
+    отдельный процесс (jobs, 0 — по числу ядер). В работе не больше 2 × jobs
+    частей, поэтому ни память, ни временные файлы не растут с объёмом экспорта.
+    CSV собирается из частей по порядку в один файл (output "-" — stdout),
+    Parquet записывается каталогом output из файлов part-NNNNN.parquet —
+    pyarrow.dataset, pandas и DuckDB читают его как одну таблицу. Строки
+    упорядочены по аккаунту, затем по подписчику (события — по времени).
+    """
+    if fmt == "parquet" and pyarrow is None:
+        raise RuntimeError("Для экспорта в Parquet нужен pyarrow: pip install pyarrow")
+    if kind == "followers":
+        store = FollowerStore(source, readonly=True)
+        try:
+            sizes = store.follower_counts(account_ids)
+        finally:
+            store.close()
+    else:
+        log = EventLog(source)
+        accounts = sorted(set(account_ids)) if account_ids is not None else log.accounts()
+        sizes = [(account_id, log.record_count(account_id)) for account_id in accounts]
+    # Пустой экспорт — одна пустая часть: у файла остаются заголовок или схема
+    parts = plan_parts(sizes, PART_ROWS) or [[]]
+    jobs = max(1, jobs or os.cpu_count() or 1)
+
+    sink: BinaryIO | None = None
+    if fmt == "parquet":
+        os.makedirs(output, exist_ok=True)
+        for stale in glob.glob(os.path.join(output, "part-*.parquet")):
+            os.remove(stale)
+        workdir = output
+    else:
+        workdir = tempfile.mkdtemp(prefix=".export-",
+                                   dir=None if output == "-" else os.path.dirname(os.path.abspath(output)))
+        sink = sys.stdout.buffer if output == "-" else open(output, "wb")
+        header = io.StringIO()
+        csv.writer(header).writerow(FOLLOWER_COLUMNS if kind == "followers" else EVENT_COLUMNS)
+        sink.write(header.getvalue().encode())
+
+    total = 0
+    pending: deque[tuple[str, Future]] = deque()
+    try:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(parts))) as pool:
+            for i, accounts in enumerate(parts):
+                path = os.path.join(workdir, f"part-{i:05d}.{fmt}")
+                pending.append((path, pool.submit(_export_part, kind, fmt, source, accounts, path, since, until)))
+                if len(pending) >= 2 * jobs:
+                    total += _collect(*pending.popleft(), sink)
+            while pending:
+                total += _collect(*pending.popleft(), sink)
+    finally:
+        if sink is not None:
+            if sink is sys.stdout.buffer:
+                sink.flush()
+            else:
+                sink.close()
+            shutil.rmtree(workdir, ignore_errors=True)
+    logger.info(f"Экспорт {kind}: {total} строк, {len(sizes)} аккаунтов, {len(parts)} частей, процессов {jobs}")
+    return total
+
+
+def _collect(path: str, future: Future, sink: BinaryIO | None) -> int:
+    """Результат части; часть CSV дописывается в общий файл и удаляется"""
+    rows = future.result()
+    if sink is not None:
+        with open(path, "rb") as part:
+            shutil.copyfileobj(part, sink)
+        os.remove(path)
+    return rows
+
+
+# ───────────────────────────────────────────────
+# Сравнение снимков
+# ───────────────────────────────────────────────
+def read_snapshot(path: str) -> Iterator[tuple]:
+    """Строки снимка подписчиков (результата export followers, CSV или Parquet) в порядке файла"""
+    if os.path.isdir(path) or path.endswith(".parquet"):
+        if pyarrow is None:
+            raise RuntimeError("Для чтения Parquet нужен pyarrow: pip install pyarrow")
+        files = sorted(glob.glob(os.path.join(path, "*.parquet"))) if os.path.isdir(path) else [path]
+        for file in files:
+            for batch in pyarrow.parquet.ParquetFile(file).iter_batches(CHUNK_ROWS, columns=list(FOLLOWER_COLUMNS)):
+                yield from zip(*(batch.column(name).to_pylist() for name in FOLLOWER_COLUMNS))
+        return
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        if next(reader, None) != list(FOLLOWER_COLUMNS):
+            raise ValueError(f"{path}: не снимок подписчиков, ожидались столбцы {', '.join(FOLLOWER_COLUMNS)}")
+        yield from map(tuple, reader)
+
+
+def _ordered(rows: Iterator[tuple], path: str) -> Iterator[tuple]:
+    previous = None
+    for row in rows:
+        key = (row[0], row[1])
+        if previous is not None and key <= previous:
+            raise ValueError(f"{path}: строки не упорядочены по аккаунту и подписчику "
+                             f"(строка {row[0]},{row[1]} после {previous[0]},{previous[1]})")
+        previous = key
+        yield row
+
+
+def diff_snapshots(old: str, new: str, out: TextIO) -> tuple[int, int]:
+    """Подписки и отписки между двумя снимками подписчиков в CSV out; возвращает (подписок, отписок).
+
+    Снимки читаются потоково и сравниваются слиянием по (аккаунт, подписчик) —
+    в этом порядке их пишет export, поэтому память не зависит от размера
+    снимков. Аккаунт, которого нет в одном из снимков, целиком попадает в
+    подписки или отписки.
+    """
+    writer = csv.writer(out)
+    writer.writerow(DIFF_COLUMNS)
+    followed = unfollowed = 0
+    old_rows, new_rows = _ordered(read_snapshot(old), old), _ordered(read_snapshot(new), new)
+    a, b = next(old_rows, None), next(new_rows, None)
+    while a is not None or b is not None:
+        if b is None or (a is not None and a[:2] < b[:2]):
+            writer.writerow((a[0], a[1], "unfollowed", a[2], a[3]))
+            unfollowed += 1
+            a = next(old_rows, None)
+        elif a is None or b[:2] < a[:2]:
+            writer.writerow((b[0], b[1], "followed", b[2], b[3]))
+            followed += 1
+            b = next(new_rows, None)
+        else:
+            a, b = next(old_rows, None), next(new_rows, None)
+    return followed, unfollowed
@@ -0,0 +1,232 @@
+import asyncio
+import random
+import time
+from collections import deque
+
+# Состояния автомата: значения совпадают с метрикой smule_circuit_state
+CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+STATE_NAMES = {CLOSED: "closed", HALF_OPEN: "half-open", OPEN: "open"}
+
+# Исходы запроса для контроллера
+OK, THROTTLED, FAILED, NEUTRAL = "ok", "throttled", "failed", "neutral"
+
+
+def jittered_backoff(attempt: int, base: float, cap: float) -> float:
+    """Экспоненциальная пауза с разбросом: половина фиксирована, половина случайна.
+
+    Разброс не даёт параллельным повторам (аккаунтам, репликам) ударить
+    в API одновременно, фиксированная половина — повторить слишком рано.
+    """
+    delay = min(cap, base * 2 ** max(attempt, 0))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class CircuitOpenError(Exception):
+    """Эндпоинт временно отключён автоматом: запрос не отправлялся"""
+
+    def __init__(self, endpoint: str, retry_in: float):
+        super().__init__(f"Эндпоинт {endpoint} временно недоступен, повтор через {retry_in:.0f} секунд")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Автомат отключения одного эндпоинта.
+
+    После failure_threshold неудач подряд эндпоинт отключается на
+    reset_timeout секунд (с разбросом); затем пропускается один пробный
+    запрос. Успех пробы включает эндпоинт, неудача отключает его снова
+    на вдвое больший срок, но не больше max_reset_timeout.
+    """
+
+    def __init__(self, endpoint: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 max_reset_timeout: float = 600.0):
+        self.endpoint = endpoint
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max(max_reset_timeout, reset_timeout)
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = 0
+        self.open_until = 0.0
+        self._probing = False
+        self.trips = 0
+
+    def before_request(self, now: float) -> None:
+        """Разрешение на запрос; CircuitOpenError, если эндпоинт отключён"""
+        if self.state == CLOSED:
+            return
+        if self.state == OPEN and now >= self.open_until:
+            self.state = HALF_OPEN
+            self._probing = False
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return
+        raise CircuitOpenError(self.endpoint, max(self.open_until - now, 1.0))
+
+    def record(self, success: bool, now: float) -> None:
+        if success:
+            self.state = CLOSED
+            self.failures = 0
+            self.opened = 0
+            self._probing = False
+            return
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            timeout = min(self.reset_timeout * 2 ** self.opened, self.max_reset_timeout)
+            self.open_until = now + timeout / 2 + random.uniform(0, timeout / 2)
+            self.opened += 1
+            self.trips += 1
+            self.state = OPEN
+            self._probing = False
+
+    def abandon(self) -> None:
+        """Запрос отменён до ответа: пробу можно повторить"""
+        if self.state == HALF_OPEN:
+            self._probing = False
+
+    def retry_in(self, now: float) -> float:
+        return max(self.open_until - now, 0.0) if self.state == OPEN else 0.0
+
+
+class AimdController:
+    """Окно параллельных запросов и темп по AIMD (как управление перегрузкой в TCP).
+
+    Успешный ответ с задержкой не выше latency_target увеличивает окно
+    на increase / окно (около +increase за окно запросов), а темп — на
+    rate_increase / темп (около +rate_increase запросов/с за секунду).
+    Ответ 429 (или 503 с Retry-After) умножает окно и темп на decrease,
+    ошибки сервера и сети — только если их доля среди последних
+    error_window ответов не меньше error_threshold: единичные сбои не
+    должны обрушивать темп. Медленный ответ уменьшает только окно. Ответы на запросы,
+    допущенные до последнего уменьшения, повторно его не вызывают: они
+    описывают нагрузку, которой уже нет. Retry-After приостанавливает все
+    запросы на указанное время.
+
+    Темп 0 — без ограничения: тогда оно появляется при первом уменьшении,
+    от пропускной способности, измеренной за последнюю секунду.
+    """
+
+    def __init__(self, min_limit: int, max_limit: int, max_rate: float = 0.0, min_rate: float = 0.2,
+                 latency_target: float = 2.0, decrease: float = 0.5, increase: float = 1.0,
+                 rate_increase: float = 1.0, error_window: int = 20, error_threshold: float = 0.25):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.latency_target = latency_target
+        self.decrease = decrease
+        self.increase = increase
+        self.rate_increase = rate_increase
+        self.error_threshold = error_threshold
+        # Исходы последних ответов: True — ошибка сервера или сети
+        self._errors: deque[bool] = deque(maxlen=max(1, error_window))
+        self.limit = float(self.max_limit)
+        self.rate = max_rate
+        self.in_flight = 0
+        self.pause_until = 0.0
+        self.latency = 0.0
+        self._last_decrease = 0.0
+        # Время успешных ответов за последнюю секунду: измеренная пропускная способность
+        self._completions: deque[float] = deque()
+        self._started = time.monotonic()
+        self._waiters: deque[asyncio.Future] = deque()
+        self.stats = dict.fromkeys(("ok", "throttled", "failed", "decreases"), 0)
+
+    async def acquire(self) -> float:
+        """Место в окне; ждёт, пока число запросов в полёте не станет меньше окна.
+
+        Возвращает момент выдачи места — его нужно передать в release().
+        """
+        woken = False
+        while True:
+            pause = self.pause_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+            if self.in_flight < int(self.limit) and (woken or not self._waiters):
+                break
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                else:
+                    # Место уже передано этой задаче: отдаём его следующей
+                    self._wake()
+                raise
+            woken = True
+        self.in_flight += 1
+        return time.monotonic()
+
+    def _wake(self) -> None:
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def release(self, outcome: str, latency: float = 0.0, retry_after: float | None = None,
+                granted: float = 0.0) -> None:
+        """Завершение запроса: исход (OK, THROTTLED, FAILED, NEUTRAL), время ответа и результат acquire()"""
+        self.in_flight -= 1
+        now = time.monotonic()
+        if outcome != NEUTRAL:
+            self.stats[outcome] += 1
+        if latency > 0:
+            self.latency = latency if not self.latency else self.latency + 0.2 * (latency - self.latency)
+        if outcome in (OK, FAILED):
+            self._errors.append(outcome == FAILED)
+        if outcome == OK:
+            self._completions.append(now)
+            while self._completions[0] < now - 1.0:
+                self._completions.popleft()
+
+        stale = granted < self._last_decrease
+        if outcome == OK and latency <= self.latency_target:
+            self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+            if self.rate:
+                self.rate += self.rate_increase / self.rate
+                if self.max_rate:
+                    self.rate = min(self.rate, self.max_rate)
+        elif outcome == THROTTLED and not stale:
+            self._decrease(now, pace=True)
+        elif outcome == FAILED and not stale and self._failing():
+            self._decrease(now, pace=True)
+        elif outcome == OK and not stale:
+            # Медленный ответ: сервер ещё отвечает, но очередь у него растёт
+            self._decrease(now, pace=False)
+        if retry_after:
+            self.pause_until = max(self.pause_until, now + retry_after)
+        self._wake()
+
+    def _failing(self) -> bool:
+        """Не меньше error_threshold последних error_window ответов — ошибки"""
+        return sum(self._errors) >= self.error_threshold * self._errors.maxlen
+
+    def _decrease(self, now: float, pace: bool) -> None:
+        self._last_decrease = now
+        self.stats["decreases"] += 1
+        self.limit = max(self.min_limit, self.limit * self.decrease)
+        if pace:
+            current = self.rate or self.throughput(now)
+            self.rate = max(self.min_rate, current * self.decrease)
+
+    def throughput(self, now: float) -> float:
+        """Успешных ответов в секунду за последнюю секунду"""
+        while self._completions and self._completions[0] < now - 1.0:
+            self._completions.popleft()
+        return len(self._completions) / min(max(now - self._started, 0.1), 1.0)
+
+    def state(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "rate": self.rate,
+            "latency": self.latency,
+            "paused_for": max(self.pause_until - time.monotonic(), 0.0),
+            **self.stats,
+        }
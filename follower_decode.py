@@ -0,0 +1,150 @@
+import json
+import logging
+from typing import Callable
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Поля ответа, в которых API может сообщать общее число подписчиков
+TOTAL_COUNT_KEYS = ("total", "total_count", "followers_count", "count")
+
+FOLLOWER_FIELDS = ("account_id", "handle", "name", "pic_url", "verified", "is_vip")
+
+BACKENDS = ("msgspec", "orjson", "json")
+
+
+class _FollowerAccess:
+    """Доступ к полям подписчика как к словарю: info["handle"], info.get("name")"""
+
+    __slots__ = ()
+
+    def __getitem__(self, key: str):
+        if key not in FOLLOWER_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default=None):
+        return getattr(self, key) if key in FOLLOWER_FIELDS else default
+
+    def __contains__(self, key: str) -> bool:
+        return key in FOLLOWER_FIELDS
+
+    def keys(self) -> tuple[str, ...]:
+        return FOLLOWER_FIELDS
+
+
+def normalize_follower(f: dict) -> dict:
+    """Подписчик из словаря ответа: только используемые поля с подстановкой пустых"""
+    return {
+        "account_id": str(f.get("account_id") or ""),
+        "handle": f.get("handle") or "Unknown",
+        "name": f.get("name") or f.get("handle") or "Unknown",
+        "pic_url": f.get("pic_url") or "",
+        "verified": bool(f.get("verified", False)),
+        "is_vip": bool(f.get("is_vip", False)),
+    }
+
+
+if msgspec is not None:
+    class Follower(msgspec.Struct, _FollowerAccess, gc=False):
+        """Подписчик из ответа API: только используемые поля, без промежуточного dict"""
+
+        account_id: int | str | None = None
+        handle: str | None = None
+        name: str | None = None
+        pic_url: str | None = None
+        verified: bool | None = False
+        is_vip: bool | None = False
+
+        def __post_init__(self) -> None:
+            # Те же правила, что у normalize_follower
+            self.account_id = str(self.account_id or "")
+            self.handle = self.handle or "Unknown"
+            self.name = self.name or self.handle
+            self.pic_url = self.pic_url or ""
+            self.verified = bool(self.verified)
+            self.is_vip = bool(self.is_vip)
+
+    class _Page(msgspec.Struct, gc=False):
+        followers: list[Follower] | None = msgspec.field(default=None, name="list")
+        total: int | None = None
+        total_count: int | None = None
+        followers_count: int | None = None
+        count: int | None = None
+
+    _page_decoder = msgspec.json.Decoder(_Page, strict=False)
+
+    FollowerInfo = Follower | dict
+else:
+    FollowerInfo = dict
+
+
+def _convert(data):
+    """Нормализация подписчиков в уже разобранном ответе"""
+    if isinstance(data, dict):
+        batch = data.get("list")
+        if isinstance(batch, list):
+            data["list"] = [normalize_follower(f) for f in batch if isinstance(f, dict)]
+    return data
+
+
+def _decode_generic(loads: Callable[[bytes], object]) -> Callable[[bytes], object]:
+    def decode(body: bytes):
+        return _convert(loads(body))
+    return decode
+
+
+def _decode_msgspec(body: bytes):
+    try:
+        page = _page_decoder.decode(body)
+    except msgspec.ValidationError as e:
+        # Формат ответа не совпал со схемой: разбираем без неё
+        logger.debug(f"Ответ не совпал со схемой страницы ({e}), разбор без схемы")
+        return _convert(json.loads(body))
+    except msgspec.DecodeError:
+        return _convert(json.loads(body))
+    data = {"list": page.followers}
+    for key in TOTAL_COUNT_KEYS:
+        value = getattr(page, key)
+        if value is not None:
+            data[key] = value
+    return data
+
+
+def available_backends() -> list[str]:
+    return [b for b in BACKENDS if b == "json" or globals()[b] is not None]
+
+
+def make_decoder(backend: str = "auto") -> tuple[str, Callable[[bytes], object]]:
+    """Функция разбора страницы подписчиков из сырых байт ответа.
+
+    backend: msgspec (сразу в Follower по схеме), orjson, json или auto —
+    самый быстрый из установленных. Если выбранная библиотека не
+    установлена, используется стандартный json. Элементы "list" в результате
+    уже нормализованы (Follower или словарь normalize_follower).
+    Возвращает (имя, функция).
+    """
+    backend = backend.lower()
+    if backend == "auto":
+        backend = available_backends()[0]
+    elif backend not in BACKENDS:
+        logger.warning(f"Неизвестный разборщик JSON {backend!r}, используется json")
+        backend = "json"
+    elif backend not in available_backends():
+        logger.warning(f"Библиотека {backend} не установлена, используется json")
+        backend = "json"
+
+    if backend == "msgspec":
+        return backend, _decode_msgspec
+    if backend == "orjson":
+        return backend, _decode_generic(orjson.loads)
+    return backend, _decode_generic(json.loads)
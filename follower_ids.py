@@ -0,0 +1,206 @@
+import sys
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Iterable, Iterator
+
+
+class FollowerIdSet:
+    """Неизменяемый набор ID подписчиков в виде отсортированного массива uint64.
+
+    Занимает 8 байт на подписчика вместо ~100 байт у set[str].
+    Проверка вхождения — двоичный поиск, разность наборов — слияние
+    двух отсортированных массивов за O(n + m). Вместо массива может
+    использоваться memoryview формата "Q" (например, над mmap файла).
+    """
+
+    __slots__ = ("_ids",)
+
+    def __init__(self, ids: array | memoryview | None = None):
+        self._ids = ids if ids is not None else array("Q")
+
+    @classmethod
+    def from_unsorted(cls, ids: Iterable[int]) -> "FollowerIdSet":
+        """Набор из произвольной последовательности ID (с повторами)"""
+        return cls(array("Q", sorted(set(ids))))
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._ids)
+
+    def __contains__(self, fid: int) -> bool:
+        i = bisect_left(self._ids, fid)
+        return i < len(self._ids) and self._ids[i] == fid
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, FollowerIdSet) and self._ids == other._ids
+
+    @property
+    def nbytes(self) -> int:
+        return self._ids.itemsize * len(self._ids)
+
+    def to_array(self) -> array:
+        return self._ids if isinstance(self._ids, array) else array("Q", self._ids)
+
+    def difference(self, other: "FollowerIdSet") -> list[int]:
+        """ID, которые есть в этом наборе, но отсутствуют в other"""
+        a, b = self._ids, other._ids
+        if a == b:
+            return []
+        if len(b) < 64 or len(a) * 16 < len(b):
+            # Малый набор против большого: двоичный поиск дешевле слияния
+            return [fid for fid in a if fid not in other]
+
+        result = []
+        j, m = 0, len(b)
+        for fid in a:
+            while j < m and b[j] < fid:
+                j += 1
+            if j == m or b[j] != fid:
+                result.append(fid)
+        return result
+
+    def union(self, ids: Iterable[int]) -> "FollowerIdSet":
+        """Новый набор с добавленными ID"""
+        extra = sorted({fid for fid in ids if fid not in self})
+        if not extra:
+            return self
+
+        merged = array("Q")
+        a = self._ids
+        i, n = 0, len(a)
+        for fid in extra:
+            j = bisect_left(a, fid, i)
+            merged.extend(a[i:j])
+            merged.append(fid)
+            i = j
+        merged.extend(a[i:n])
+        return FollowerIdSet(merged)
+
+
+VERIFIED = 1
+VIP = 2
+
+
+# Оценка памяти на профиль в кэше (FollowerMeta со __slots__, ключ и узел OrderedDict)
+PROFILE_RECORD_BYTES = 200
+
+
+class FollowerMeta:
+    """Профиль одного подписчика; имя не хранится, если совпадает с ником"""
+
+    __slots__ = ("handle", "name", "pic_url", "flags", "updated_at")
+
+    def __init__(self, info: dict, updated_at: float = 0.0):
+        self.updated_at = updated_at
+        self.set(info)
+
+    def set(self, info: dict) -> None:
+        # Пустой ник — профиль неизвестен: замену подставляет форматирование уведомлений
+        self.handle = info.get("handle") or ""
+        name = info.get("name") or self.handle
+        self.name = None if name == self.handle else name
+        # Одинаковые аватары (например, стандартный) хранятся в одном экземпляре
+        self.pic_url = sys.intern(info.get("pic_url") or "")
+        self.flags = (VERIFIED if info.get("verified") else 0) | (VIP if info.get("is_vip") else 0)
+
+    def matches(self, info: dict) -> bool:
+        return (
+            self.handle == (info.get("handle") or "")
+            and (self.name or self.handle) == (info.get("name") or info.get("handle") or "")
+            and self.pic_url == (info.get("pic_url") or "")
+            and self.flags == (VERIFIED if info.get("verified") else 0) | (VIP if info.get("is_vip") else 0)
+        )
+
+    def to_info(self, fid: int) -> dict:
+        return {
+            "account_id": str(fid),
+            "handle": self.handle,
+            "name": self.name or self.handle,
+            "pic_url": self.pic_url,
+            "verified": bool(self.flags & VERIFIED),
+            "is_vip": bool(self.flags & VIP),
+        }
+
+
+class ProfileCache:
+    """Профили подписчиков, общие для всех отслеживаемых аккаунтов.
+
+    Подписчик нескольких аккаунтов хранится один раз. В памяти держатся
+    последние использованные профили в пределах max_bytes, остальные
+    остаются в базе. Профиль считается устаревшим через ttl секунд после
+    обновления: страница подписчиков с ним обновляет время (и запись в
+    базе) не чаще раза в ttl / 2, а не встретившиеся на страницах профили
+    обновляет фоновая загрузка. ID без профиля, нужные для уведомлений,
+    собираются в wanted для этой загрузки.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_entries = max(1, max_bytes // PROFILE_RECORD_BYTES)
+        self.ttl = ttl
+        self._records: OrderedDict[int, FollowerMeta] = OrderedDict()
+        self.wanted: set[int] = set()
+        self.stats = dict.fromkeys(("hits", "misses", "evictions"), 0)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, fid: int) -> bool:
+        return fid in self._records
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._records) * PROFILE_RECORD_BYTES
+
+    def get(self, fid: int) -> dict | None:
+        record = self._records.get(fid)
+        if record is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        self._records.move_to_end(fid)
+        return record.to_info(fid)
+
+    def update(self, fid: int, info: dict, now: float) -> bool:
+        """Профиль со страницы подписчиков; True, если его нужно записать в базу.
+
+        Отсутствующий в кэше профиль считается новым, поэтому сохранённые
+        в базе профили перед сравнением загружаются через warm().
+        """
+        record = self._records.get(fid)
+        if record is None:
+            self._records[fid] = FollowerMeta(info, now)
+            self.wanted.discard(fid)
+            self._evict()
+            return True
+        self._records.move_to_end(fid)
+        if record.matches(info) and now - record.updated_at < self.ttl / 2:
+            return False
+        record.set(info)
+        record.updated_at = now
+        return True
+
+    def warm(self, infos: dict[str, dict]) -> None:
+        """Профили из базы (с полем updated_at); уже загруженные не заменяются"""
+        for fid, info in infos.items():
+            if not fid.isdigit():
+                continue
+            key = int(fid)
+            if key not in self._records:
+                self._records[key] = FollowerMeta(info, info.get("updated_at", 0.0))
+            if info.get("handle"):
+                self.wanted.discard(key)
+        self._evict()
+
+    def want(self, fid: int) -> None:
+        """В очередь фоновой загрузки, если профиля нет или он ещё не загружен (пустой)"""
+        record = self._records.get(fid)
+        if record is None or not record.handle:
+            self.wanted.add(fid)
+
+    def _evict(self) -> None:
+        while len(self._records) > self.max_entries:
+            self._records.popitem(last=False)
+            self.stats["evictions"] += 1
@@ -0,0 +1,606 @@
+import glob
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+from typing import Iterable, Iterator
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS followers (
+    account_id  TEXT NOT NULL,
+    follower_id TEXT NOT NULL,
+    PRIMARY KEY (account_id, follower_id)
+) WITHOUT ROWID;
+
+-- Профили подписчиков, общие для всех аккаунтов (до версии с profiles
+-- хранились в follower_meta по одной копии на отслеживаемый аккаунт;
+-- таблица переносится и удаляется в _migrate_profiles). У каждого
+-- подписчика есть строка: ещё не загруженный профиль — пустой, с updated_at 0
+CREATE TABLE IF NOT EXISTS profiles (
+    follower_id TEXT PRIMARY KEY,
+    handle      TEXT NOT NULL,
+    name        TEXT NOT NULL,
+    pic_url     TEXT NOT NULL,
+    verified    INTEGER NOT NULL DEFAULT 0,
+    is_vip      INTEGER NOT NULL DEFAULT 0,
+    updated_at  REAL NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+-- Подписан ли ещё кто-то из отслеживаемых: для удаления ненужных профилей
+CREATE INDEX IF NOT EXISTS followers_by_follower ON followers (follower_id);
+-- Устаревшие и незагруженные профили без обхода всех подписчиков
+CREATE INDEX IF NOT EXISTS profiles_by_updated ON profiles (updated_at);
+
+CREATE TABLE IF NOT EXISTS outbox (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    dedup_key     TEXT NOT NULL UNIQUE,
+    chat_id       TEXT NOT NULL,
+    text          TEXT NOT NULL,
+    created_at    REAL NOT NULL,
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    next_attempt  REAL NOT NULL DEFAULT 0,
+    sent_at       REAL
+);
+CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (sent_at, next_attempt, id);
+
+CREATE TABLE IF NOT EXISTS replicas (
+    replica       INTEGER PRIMARY KEY,
+    heartbeat_at  REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS leases (
+    account_id  TEXT PRIMARY KEY,
+    replica     INTEGER NOT NULL,
+    expires_at  REAL NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS follower_versions (
+    account_id  TEXT PRIMARY KEY,
+    version     INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS scan_checkpoints (
+    account_id   TEXT PRIMARY KEY,
+    next_offset  INTEGER NOT NULL,
+    page_size    INTEGER NOT NULL,
+    chunks       INTEGER NOT NULL,
+    started_at   REAL NOT NULL,
+    updated_at   REAL NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS scan_chunks (
+    account_id  TEXT NOT NULL,
+    seq         INTEGER NOT NULL,
+    ids         BLOB NOT NULL,
+    PRIMARY KEY (account_id, seq)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS migrations (
+    name        TEXT PRIMARY KEY,
+    applied_at  TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+
+class LeaseLostError(Exception):
+    """Аккаунт больше не принадлежит этой реплике: изменения не записаны"""
+
+
+def _ids_to_blob(ids: array) -> bytes:
+    # Порядок байт фиксирован, чтобы базу могли читать реплики на другой архитектуре
+    if sys.byteorder == "big":
+        ids = array("Q", ids)
+        ids.byteswap()
+    return ids.tobytes()
+
+
+def _blob_to_ids(blob: bytes, into: array) -> None:
+    chunk = array("Q")
+    chunk.frombytes(blob)
+    if sys.byteorder == "big":
+        chunk.byteswap()
+    into.extend(chunk)
+
+
+class FollowerStore:
+    """Хранилище подписчиков в SQLite (WAL).
+
+    Ключ — пара (отслеживаемый аккаунт, подписчик). После проверки аккаунта
+    записываются только изменившиеся строки, одной транзакцией.
+    Методы синхронные и потокобезопасные: бот вызывает их через asyncio.to_thread.
+    Базу могут открывать несколько процессов (реплик): пишущие транзакции
+    начинаются с BEGIN IMMEDIATE и ждут блокировку до timeout секунд.
+    readonly — только чтение (процессы экспорта): схема не создаётся и не мигрирует.
+    """
+
+    def __init__(self, path: str, timeout: float = 30.0, readonly: bool = False):
+        self.path = path
+        self._lock = threading.Lock()
+        if readonly:
+            self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=timeout,
+                                        check_same_thread=False, isolation_level=None)
+            return
+        self.conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._migrate_profiles()
+
+    def _migrate_profiles(self) -> None:
+        """Однократный перенос follower_meta в общую таблицу profiles (дубли схлопываются).
+
+        Подписчики без профиля получают пустую строку, как при записи новых
+        подписчиков. Старая таблица удаляется, в том числе пустая в базах,
+        где перенос уже был.
+        """
+        moved = 0
+        with self._lock, self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            legacy = self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'follower_meta'"
+            ).fetchone()
+            applied = self.conn.execute("SELECT 1 FROM migrations WHERE name = 'profiles'").fetchone()
+            if legacy and not applied:
+                # Время обновления 0: перенесённые профили считаются устаревшими и обновятся.
+                # Вместо неизвестных ника и имени follower_meta хранила ID — переносятся пустыми
+                moved = self.conn.execute(
+                    "INSERT OR IGNORE INTO profiles (follower_id, handle, name, pic_url, verified, is_vip, updated_at) "
+                    "SELECT follower_id, CASE WHEN handle = follower_id THEN '' ELSE handle END, "
+                    "CASE WHEN name = follower_id THEN '' ELSE name END, pic_url, verified, is_vip, 0 "
+                    "FROM follower_meta"
+                ).rowcount
+            if not applied:
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO profiles (follower_id, handle, name, pic_url) "
+                    "SELECT DISTINCT follower_id, '', '', '' FROM followers"
+                )
+            if legacy:
+                self.conn.execute("DROP TABLE follower_meta")
+            if not applied:
+                self.conn.execute("INSERT INTO migrations (name) VALUES ('profiles')")
+        if moved:
+            logger.info(f"Метаданные подписчиков перенесены в общую таблицу профилей: {moved} профилей")
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+    # ───────────────────────────────────────────────
+    # Чтение
+    # ───────────────────────────────────────────────
+    def load_follower_ids(self, account_id: str) -> tuple[array, int]:
+        """Отсортированные числовые ID подписчиков и версия набора, из одного снимка базы"""
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                rows = self.conn.execute(
+                    "SELECT follower_id FROM followers WHERE account_id = ?", (account_id,)
+                )
+                ids = array("Q", sorted(int(fid) for (fid,) in rows if fid.isdigit()))
+                version = self._version(account_id)
+            finally:
+                self.conn.execute("COMMIT")
+        return ids, version
+
+    def follower_version(self, account_id: str) -> int:
+        """Версия набора подписчиков: растёт при каждом его изменении"""
+        with self._lock:
+            return self._version(account_id)
+
+    def _version(self, account_id: str) -> int:
+        row = self.conn.execute(
+            "SELECT version FROM follower_versions WHERE account_id = ?", (account_id,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_profiles(self, follower_ids: Iterable[str]) -> dict[str, dict]:
+        follower_ids = list(follower_ids)
+        result: dict[str, dict] = {}
+        # Не больше 500 параметров в запросе (лимит SQLite — 999 в старых версиях)
+        for i in range(0, len(follower_ids), 500):
+            chunk = follower_ids[i:i + 500]
+            result.update(self._profiles(
+                "SELECT follower_id, handle, name, pic_url, verified, is_vip, updated_at "
+                f"FROM profiles WHERE follower_id IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ))
+        return result
+
+    def _profiles(self, query: str, params) -> dict[str, dict]:
+        with self._lock:
+            rows = self.conn.execute(query, params)
+            return {
+                fid: {
+                    "account_id": fid,
+                    "handle": handle,
+                    "name": name,
+                    "pic_url": pic_url,
+                    "verified": bool(verified),
+                    "is_vip": bool(is_vip),
+                    "updated_at": updated_at,
+                }
+                for fid, handle, name, pic_url, verified, is_vip, updated_at in rows
+            }
+
+    def follower_counts(self, account_ids: Iterable[str] | None = None) -> list[tuple[str, int]]:
+        """Число подписчиков по аккаунтам, по возрастанию ID аккаунта; без account_ids — всех в базе"""
+        if account_ids is None:
+            with self._lock:
+                return self.conn.execute(
+                    "SELECT account_id, COUNT(*) FROM followers GROUP BY account_id ORDER BY account_id"
+                ).fetchall()
+        account_ids = sorted(set(account_ids))
+        counts: dict[str, int] = {}
+        # Только нужные аккаунты (по первичному ключу), не больше 500 параметров в запросе
+        for i in range(0, len(account_ids), 500):
+            chunk = account_ids[i:i + 500]
+            with self._lock:
+                counts.update(self.conn.execute(
+                    "SELECT account_id, COUNT(*) FROM followers "
+                    f"WHERE account_id IN ({','.join('?' * len(chunk))}) GROUP BY account_id",
+                    chunk,
+                ))
+        return [(account_id, counts.get(account_id, 0)) for account_id in account_ids]
+
+    def iter_followers(self, account_id: str, chunk_size: int = 10000) -> Iterator[list[tuple]]:
+        """Подписчики аккаунта с профилями порциями по chunk_size, по возрастанию ID.
+
+        Строка: (ID, ник, имя, аватар, verified, is_vip); без профиля поля пустые.
+        Каждая порция читается отдельным запросом от последнего ID, поэтому
+        блокировка не держится между порциями, а память не зависит от числа подписчиков.
+        """
+        after = ""
+        while True:
+            with self._lock:
+                rows = self.conn.execute(
+                    "SELECT f.follower_id, COALESCE(p.handle, ''), COALESCE(p.name, ''), COALESCE(p.pic_url, ''), "
+                    "COALESCE(p.verified, 0), COALESCE(p.is_vip, 0) "
+                    "FROM followers f LEFT JOIN profiles p ON p.follower_id = f.follower_id "
+                    "WHERE f.account_id = ? AND f.follower_id > ? ORDER BY f.follower_id LIMIT ?",
+                    (account_id, after, chunk_size),
+                ).fetchall()
+            if not rows:
+                return
+            yield rows
+            if len(rows) < chunk_size:
+                return
+            after = rows[-1][0]
+
+    def missing_profiles(self, account_ids: Iterable[str], stale_before: float, limit: int) -> list[str]:
+        """Подписчики аккаунтов с незагруженным профилем или профилем старше stale_before.
+
+        Сначала самые старые. Обходятся только устаревшие профили (индекс
+        по updated_at), а не все подписчики; аккаунты проверяются частями
+        по 500, блокировка не держится между частями.
+        """
+        account_ids = sorted(set(account_ids))
+        result: dict[str, None] = {}
+        for i in range(0, len(account_ids), 500):
+            chunk = account_ids[i:i + 500]
+            with self._lock:
+                rows = self.conn.execute(
+                    "SELECT p.follower_id FROM profiles p WHERE p.updated_at < ? AND EXISTS "
+                    "(SELECT 1 FROM followers f WHERE f.follower_id = p.follower_id "
+                    f"AND f.account_id IN ({','.join('?' * len(chunk))})) "
+                    "ORDER BY p.updated_at LIMIT ?",
+                    (stale_before, *chunk, limit),
+                ).fetchall()
+            result.update(dict.fromkeys(fid for (fid,) in rows))
+            if len(result) >= limit:
+                break
+        return list(result)[:limit]
+
+    # ───────────────────────────────────────────────
+    # Запись
+    # ───────────────────────────────────────────────
+    def apply_changes(self, account_id: str, added: Iterable[str], removed: Iterable[str],
+                      profiles: dict[str, dict], notifications: Iterable[tuple[str, str, str]] = (),
+                      lease: int | None = None) -> int:
+        """Запись изменений одного аккаунта одной транзакцией; возвращает версию набора подписчиков.
+
+        profiles — новые и изменившиеся профили подписчиков (общие для всех аккаунтов).
+        notifications — уведомления (ключ, чат, текст) о записанных изменениях:
+        они попадают в очередь отправки только вместе с изменениями. К ключу
+        добавляется новая версия набора, поэтому совпадает он только у повторов
+        того же изменения, а не у повторной подписки того же пользователя.
+        lease — номер реплики: запись выполняется, только если её аренда
+        аккаунта ещё действует, иначе LeaseLostError.
+        Контрольная точка незавершённой загрузки аккаунта удаляется той же
+        транзакцией: её результат вошёл в записанные изменения.
+        """
+        with self._lock, self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self._check_lease(account_id, lease)
+            self._write_changes(account_id, added, removed, profiles)
+            version = self._version(account_id)
+            self._enqueue((f"{key}:v{version}", chat_id, text) for key, chat_id, text in notifications)
+            self._clear_checkpoint(account_id)
+            return version
+
+    def _check_lease(self, account_id: str, lease: int | None) -> None:
+        if lease is None:
+            return
+        row = self.conn.execute(
+            "SELECT replica, expires_at FROM leases WHERE account_id = ?", (account_id,)
+        ).fetchone()
+        if row is None or row[0] != lease or row[1] <= time.time():
+            raise LeaseLostError(f"Аренда аккаунта {account_id} потеряна")
+
+    def _write_changes(self, account_id: str, added: Iterable[str], removed: Iterable[str],
+                       profiles: dict[str, dict]) -> None:
+        added = list(added)
+        changed = self.conn.executemany(
+            "INSERT OR IGNORE INTO followers (account_id, follower_id) VALUES (?, ?)",
+            ((account_id, fid) for fid in added),
+        ).rowcount
+        changed += self.conn.executemany(
+            "DELETE FROM followers WHERE account_id = ? AND follower_id = ?",
+            ((account_id, fid) for fid in removed),
+        ).rowcount
+        # Версия растёт только при фактическом изменении набора: повторная
+        # запись уже применённого изменения её не меняет
+        if changed > 0:
+            self.conn.execute(
+                "INSERT INTO follower_versions (account_id, version) VALUES (?, 1) "
+                "ON CONFLICT (account_id) DO UPDATE SET version = version + 1",
+                (account_id,),
+            )
+        # Пустой профиль для новых подписчиков, если его ещё нет: его найдёт
+        # фоновая загрузка по индексу updated_at
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO profiles (follower_id, handle, name, pic_url) VALUES (?, '', '', '')",
+            ((fid,) for fid in added),
+        )
+        self._write_profiles(profiles)
+
+    def _write_profiles(self, profiles: dict[str, dict]) -> None:
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO profiles "
+            "(follower_id, handle, name, pic_url, verified, is_vip, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                (fid, info.get("handle") or "", info.get("name") or "", info.get("pic_url") or "",
+                 int(bool(info.get("verified"))), int(bool(info.get("is_vip"))), now)
+                for fid, info in profiles.items()
+            ),
+        )
+
+    def save_profiles(self, profiles: dict[str, dict]) -> None:
+        """Профили из фоновой загрузки"""
+        with self._lock, self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self._write_profiles(profiles)
+
+    def evict_profiles(self, before: float) -> int:
+        """Удаление профилей, не обновлявшихся с before, на которых никто из отслеживаемых не подписан"""
+        with self._lock, self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            return self.conn.execute(
+                "DELETE FROM profiles WHERE updated_at < ? AND NOT EXISTS "
+                "(SELECT 1 FROM followers f WHERE f.follower_id = profiles.follower_id)",
+                (before,),
+            ).rowcount
+
+    # ───────────────────────────────────────────────
+    # Контрольные точки полной загрузки
+    # ───────────────────────────────────────────────
+    def save_checkpoint(self, account_id: str, next_offset: int, page_size: int, ids: array,
+                        profiles: dict[str, dict], started_at: float, lease: int | None = None) -> None:
+        """Продолжение контрольной точки загрузки аккаунта.
+
+        ids — ID, загруженные после предыдущей точки: они дописываются
+        отдельным блоком, поэтому стоимость записи не растёт с прогрессом.
+        profiles — профили, изменившиеся за это время; они записываются сразу,
+        чтобы после перезапуска по сохранённым ID можно было собрать уведомления.
+        """
+        with self._lock, self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self._check_lease(account_id, lease)
+            row = self.conn.execute(
+                "SELECT chunks FROM scan_checkpoints WHERE account_id = ?", (account_id,)
+            ).fetchone()
+            seq = row[0] if row else 0
+            if not row:
+                self.conn.execute("DELETE FROM scan_chunks WHERE account_id = ?", (account_id,))
+            if ids:
+                self.conn.execute(
+                    "INSERT INTO scan_chunks (account_id, seq, ids) VALUES (?, ?, ?)",
+                    (account_id, seq, _ids_to_blob(ids)),
+                )
+                seq += 1
+            self.conn.execute(
+                "INSERT OR REPLACE INTO scan_checkpoints "
+                "(account_id, next_offset, page_size, chunks, started_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (account_id, next_offset, page_size, seq, started_at, time.time()),
+            )
+            self._write_changes(account_id, (), (), profiles)
+
+    def load_checkpoint(self, account_id: str) -> tuple[int, int, float, array] | None:
+        """(следующий offset, размер страницы, начало загрузки, загруженные ID по порядку) или None"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT next_offset, page_size, started_at FROM scan_checkpoints WHERE account_id = ?",
+                (account_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            ids = array("Q")
+            for (blob,) in self.conn.execute(
+                "SELECT ids FROM scan_chunks WHERE account_id = ? ORDER BY seq", (account_id,)
+            ):
+                _blob_to_ids(blob, ids)
+        return row[0], row[1], row[2], ids
+
+    def _clear_checkpoint(self, account_id: str) -> None:
+        self.conn.execute("DELETE FROM scan_checkpoints WHERE account_id = ?", (account_id,))
+        self.conn.execute("DELETE FROM scan_chunks WHERE account_id = ?", (account_id,))
+
+    def clear_checkpoint(self, account_id: str) -> None:
+        with self._lock, self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self._clear_checkpoint(account_id)
+
+    # ───────────────────────────────────────────────
+    # Очередь исходящих уведомлений
+    # ───────────────────────────────────────────────
+    def _enqueue(self, notifications: Iterable[tuple[str, str, str]]) -> None:
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO outbox (dedup_key, chat_id, text, created_at) VALUES (?, ?, ?, ?)",
+            ((key, chat_id, text, now) for key, chat_id, text in notifications),
+        )
+
+    def enqueue(self, notifications: Iterable[tuple[str, str, str]]) -> None:
+        """Постановка уведомлений (ключ, чат, текст) в очередь.
+
+        Уведомление с ключом, который уже есть в очереди или был недавно
+        отправлен, повторно не добавляется.
+        """
+        with self._lock, self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self._enqueue(notifications)
+
+    def due_notifications(self, now: float, limit: int = 50,
+                          claim: float = 0.0) -> list[tuple[int, str, str, int]]:
+        """Неотправленные уведомления, время которых пришло: (id, чат, текст, попыток).
+
+        claim > 0 — выбранные уведомления откладываются на claim секунд, чтобы
+        их не взял воркер другой реплики; если процесс упадёт до mark_sent,
+        уведомление снова станет доступно после этой паузы.
+        """
+        with self._lock, self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            rows = self.conn.execute(
+                "SELECT id, chat_id, text, attempts FROM outbox "
+                "WHERE sent_at IS NULL AND next_attempt <= ? ORDER BY id LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            if claim > 0 and rows:
+                self.conn.executemany(
+                    "UPDATE outbox SET next_attempt = ? WHERE id = ?",
+                    ((now + claim, row[0]) for row in rows),
+                )
+            return rows
+
+    def next_notification_time(self) -> float | None:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT MIN(next_attempt) FROM outbox WHERE sent_at IS NULL"
+            ).fetchone()
+            return row[0]
+
+    def pending_notifications(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM outbox WHERE sent_at IS NULL").fetchone()[0]
+
+    def mark_sent(self, notification_id: int, dedup_ttl: float) -> None:
+        """Отметка об отправке; отправленные ключи хранятся dedup_ttl секунд для дедупликации"""
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute("UPDATE outbox SET sent_at = ? WHERE id = ?", (now, notification_id))
+            self.conn.execute("DELETE FROM outbox WHERE sent_at IS NOT NULL AND sent_at < ?", (now - dedup_ttl,))
+
+    def reschedule(self, notification_id: int, next_attempt: float) -> None:
+        with self._lock, self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute(
+                "UPDATE outbox SET attempts = attempts + 1, next_attempt = ? WHERE id = ?",
+                (next_attempt, notification_id),
+            )
+
+    # ───────────────────────────────────────────────
+    # Аренда аккаунтов репликами
+    # ───────────────────────────────────────────────
+    def heartbeat(self, replica: int, now: float, ttl: float) -> set[int]:
+        """Отметка о работе реплики; возвращает реплики, отмечавшиеся за последние ttl секунд"""
+        with self._lock, self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute(
+                "INSERT INTO replicas (replica, heartbeat_at) VALUES (?, ?) "
+                "ON CONFLICT (replica) DO UPDATE SET heartbeat_at = excluded.heartbeat_at",
+                (replica, now),
+            )
+            rows = self.conn.execute("SELECT replica FROM replicas WHERE heartbeat_at > ?", (now - ttl,))
+            return {r for (r,) in rows}
+
+    def acquire_leases(self, replica: int, account_ids: Iterable[str], now: float, ttl: float) -> set[str]:
+        """Взятие или продление аренды аккаунтов на ttl секунд.
+
+        Чужая аренда перехватывается только после истечения. Возвращает
+        аккаунты, которые после вызова принадлежат реплике.
+        """
+        account_ids = list(account_ids)
+        with self._lock, self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.executemany(
+                "INSERT INTO leases (account_id, replica, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (account_id) DO UPDATE SET replica = excluded.replica, expires_at = excluded.expires_at "
+                "WHERE leases.replica = excluded.replica OR leases.expires_at <= ?",
+                ((account_id, replica, now + ttl, now) for account_id in account_ids),
+            )
+            rows = self.conn.execute("SELECT account_id FROM leases WHERE replica = ?", (replica,))
+            owned = {account_id for (account_id,) in rows}
+        return owned.intersection(account_ids)
+
+    def release_leases(self, replica: int, account_ids: Iterable[str] | None = None) -> None:
+        """Освобождение аренды; без account_ids — всех аккаунтов реплики вместе с её отметкой о работе"""
+        with self._lock, self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            if account_ids is None:
+                self.conn.execute("DELETE FROM leases WHERE replica = ?", (replica,))
+                self.conn.execute("DELETE FROM replicas WHERE replica = ?", (replica,))
+            else:
+                self.conn.executemany(
+                    "DELETE FROM leases WHERE account_id = ? AND replica = ?",
+                    ((account_id, replica) for account_id in account_ids),
+                )
+
+    # ───────────────────────────────────────────────
+    # Миграция со старых JSON-файлов
+    # ───────────────────────────────────────────────
+    def migrate_json(self, data_dir: str) -> None:
+        """Однократный перенос followers_*.json и followers_meta_*.json в базу.
+
+        Перенесённые файлы переименовываются в *.json.migrated и остаются
+        рядом как резервная копия.
+        """
+        for fp in sorted(glob.glob(os.path.join(data_dir, "followers_*.json"))):
+            name = os.path.basename(fp)
+            if name.startswith("followers_meta_"):
+                account_id, kind = name[len("followers_meta_"):-len(".json")], "meta"
+            else:
+                account_id, kind = name[len("followers_"):-len(".json")], "set"
+
+            with self._lock:
+                done = self.conn.execute("SELECT 1 FROM migrations WHERE name = ?", (name,)).fetchone()
+            if done:
+                continue
+
+            try:
+                with open(fp, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except Exception as e:
+                logger.error(f"Ошибка при чтении {name} для миграции: {e}")
+                continue
+
+            added: list[str] = []
+            meta: dict[str, dict] = {}
+            if kind == "set" and isinstance(data, list):
+                added = [str(fid) for fid in data]
+            elif kind == "meta" and isinstance(data, dict):
+                meta = {str(fid): info for fid, info in data.items() if isinstance(info, dict)}
+
+            with self._lock, self.conn:
+                self.conn.execute("BEGIN IMMEDIATE")
+                self._write_changes(account_id, added, (), meta)
+                self.conn.execute("INSERT INTO migrations (name) VALUES (?)", (name,))
+
+            os.replace(fp, fp + ".migrated")
+            logger.info(f"Перенесён {name} в базу: {len(added) or len(meta)} записей")
@@ -1,55 +1,50 @@
 #!/usr/bin/env python3
 """
-Простой healthcheck скрипт для Python приложения
-Проверяет, что Python интерпретатор работает и основные модули доступны
+Healthcheck скрипт: опрашивает HTTP-эндпоинт здоровья работающего бота.
+
+    python healthcheck.py          # liveness: цикл проверки не завис
+    python healthcheck.py ready    # readiness: были недавние успешные проверки
+
+Порт берётся из HEALTH_PORT (по умолчанию 8080). Код выхода 0 — здоров,
+1 — нет ответа или бот сообщает о проблеме.
 """
 
-import sys
+import json
 import os
+import sys
+import urllib.error
+import urllib.request
+
 
 def main():
+    kind = sys.argv[1] if len(sys.argv) > 1 else "live"
+    if kind not in ("live", "ready"):
+        print(f"ERROR: Unknown check {kind!r}, expected live or ready")
+        sys.exit(1)
+
+    port = os.getenv("HEALTH_PORT", "8080")
+    if port == "0":
+        print("ERROR: HEALTH_PORT=0, health endpoint is disabled")
+        sys.exit(1)
+    url = f"http://127.0.0.1:{port}/healthz/{kind}"
+
     try:
-        # Проверяем, что Python работает
-        if sys.version_info < (3, 6):
-            print("ERROR: Python version too old")
-            sys.exit(1)
-        
-        # Проверяем основные модули
-        required_modules = [
-            'asyncio',
-            'aiohttp', 
-            'telegram',
-            'json',
-            'os',
-            'ssl',
-            'logging'
-        ]
-        
-        for module in required_modules:
-            try:
-                __import__(module)
-            except ImportError as e:
-                print(f"ERROR: Module {module} not available: {e}")
-                sys.exit(1)
-        
-        # Проверяем переменные окружения
-        required_env_vars = ['TELEGRAM_TOKEN', 'CHAT_ID', 'SMULE_ACCOUNT_IDS']
-        missing_vars = []
-        
-        for var in required_env_vars:
-            if not os.getenv(var):
-                missing_vars.append(var)
-        
-        if missing_vars:
-            print(f"WARNING: Missing environment variables: {', '.join(missing_vars)}")
-            # Не выходим с ошибкой, так как переменные могут быть загружены позже
-        
-        print("OK: Health check passed")
-        sys.exit(0)
-        
+        with urllib.request.urlopen(url, timeout=5) as resp:
+            body = json.loads(resp.read() or b"{}")
+    except urllib.error.HTTPError as e:
+        try:
+            reason = json.loads(e.read() or b"{}").get("reason", e.reason)
+        except ValueError:
+            reason = e.reason
+        print(f"ERROR: {kind} check failed: {reason}")
+        sys.exit(1)
     except Exception as e:
-        print(f"ERROR: Health check failed: {e}")
+        print(f"ERROR: Health endpoint {url} unavailable: {e}")
         sys.exit(1)
 
+    print(f"OK: {kind} check passed ({body.get('reason', 'ok')})")
+    sys.exit(0)
+
+
 if __name__ == "__main__":
     main()
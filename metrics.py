@@ -0,0 +1,220 @@
+import math
+from bisect import bisect_left
+
+# Границы гистограмм по умолчанию, секунды
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric:
+    """Метрика в текстовом формате Prometheus; значения по кортежам меток"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values: dict[tuple[str, ...], float] = {}
+
+    def remove(self, *labels: str) -> None:
+        self.values.pop(labels, None)
+
+    def clear(self) -> None:
+        self.values.clear()
+
+    def samples(self) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+                for labels, value in self.values.items()]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines += self.samples()
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def set_total(self, value: float, *labels: str) -> None:
+        """Значение накопительного счётчика, который ведётся в другом месте"""
+        self.values[labels] = value
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str) -> None:
+        self.values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # метки -> (счётчики по корзинам, сумма, количество)
+        self.series: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = ([0] * (len(self.buckets) + 1), [0.0, 0.0])
+        counts, totals = series
+        counts[bisect_left(self.buckets, value)] += 1
+        totals[0] += value
+        totals[1] += 1
+
+    def remove(self, *labels: str) -> None:
+        self.series.pop(labels, None)
+
+    def samples(self) -> list[str]:
+        lines = []
+        for labels, (counts, (total, count)) in self.series.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {int(count)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+class BotMetrics:
+    """Все метрики бота в одном реестре.
+
+    Счётчики событий обновляются по ходу работы, а состояние (очередь
+    уведомлений, ожидание ограничителей, возраст последней проверки)
+    снимается в момент запроса /metrics.
+    """
+
+    def __init__(self):
+        r = self.registry = Registry()
+        # Smule
+        self.check_duration = r.register(Histogram(
+            "smule_check_duration_seconds", "Длительность проверки аккаунта (загрузка и сравнение)", ("account",)))
+        self.request_duration = r.register(Histogram(
+            "smule_request_duration_seconds", "Длительность запроса страницы подписчиков",
+            buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)))
+        self.requests = r.register(Counter(
+            "smule_requests_total", "Запросы к Smule по статусу ответа (error — сетевая ошибка)", ("status",)))
+        self.pages = r.register(Counter(
+            "smule_pages_fetched_total", "Загруженные страницы подписчиков, включая ответы 304", ("account",)))
+        self.bytes = r.register(Counter(
+            "smule_bytes_downloaded_total", "Загружено байт тел ответов", ("account",)))
+        self.check_errors = r.register(Counter(
+            "smule_check_errors_total", "Неудачные попытки проверки аккаунта", ("account",)))
+        self.events = r.register(Counter(
+            "smule_follower_events_total", "Найденные подписки (follow) и отписки (unfollow)", ("account", "kind")))
+        self.last_success = r.register(Gauge(
+            "smule_last_success_timestamp_seconds", "Время последней успешной проверки аккаунта", ("account",)))
+        self.last_success_age = r.register(Gauge(
+            "smule_last_success_age_seconds", "Сколько секунд назад аккаунт успешно проверялся", ("account",)))
+        self.pacer_wait = r.register(Counter(
+            "smule_pacer_wait_seconds_total", "Суммарное ожидание темпа запросов к Smule"))
+        self.concurrency_limit = r.register(Gauge(
+            "smule_concurrency_limit", "Текущее окно параллельных запросов к Smule (AIMD)"))
+        self.in_flight = r.register(Gauge(
+            "smule_requests_in_flight", "Запросы к Smule, ожидающие ответа"))
+        self.rate_limit = r.register(Gauge(
+            "smule_rate_limit", "Текущий темп запросов к Smule в секунду (0 — без ограничения)"))
+        self.flow_decreases = r.register(Counter(
+            "smule_flow_decreases_total", "Уменьшения окна и темпа запросов из-за перегрузки Smule"))
+        self.circuit_state = r.register(Gauge(
+            "smule_circuit_state", "Автомат эндпоинта: 0 — включён, 1 — проба, 2 — отключён", ("endpoint",)))
+        self.circuit_trips = r.register(Counter(
+            "smule_circuit_trips_total", "Отключения эндпоинта автоматом", ("endpoint",)))
+        self.connections = r.register(Counter(
+            "smule_http_connections_total", "Соединения с Smule: новые (created) и переиспользованные (reused)",
+            ("state",)))
+        # Цикл проверки
+        self.cycle_lag = r.register(Gauge(
+            "bot_cycle_lag_seconds", "Опоздание последней проверки относительно срока планировщика"))
+        self.cycle_duration = r.register(Gauge(
+            "bot_cycle_duration_seconds", "Длительность последнего прохода цикла проверки"))
+        self.loop_heartbeat = r.register(Gauge(
+            "bot_loop_heartbeat_timestamp_seconds", "Время последнего завершённого прохода цикла"))
+        self.phase_seconds = r.register(Counter(
+            "bot_phase_seconds_total", "Суммарное время по фазам проверки (спаны трассировки)", ("phase",)))
+        self.phase_spans = r.register(Counter(
+            "bot_phase_spans_total", "Число выполненных фаз проверки", ("phase",)))
+        self.loop_failures = r.register(Gauge(
+            "bot_loop_consecutive_failures", "Неудачные проходы цикла подряд"))
+        self.accounts = r.register(Gauge(
+            "bot_accounts_owned", "Аккаунты, которые проверяет эта реплика"))
+        self.state_resident = r.register(Gauge(
+            "bot_account_state_resident", "Аккаунты, состояние которых загружено в память"))
+        self.state_bytes = r.register(Gauge(
+            "bot_account_state_bytes", "Оценка памяти под загруженное состояние аккаунтов с их кэшем страниц"))
+        self.state_loads = r.register(Counter(
+            "bot_account_state_loads_total", "Загрузки состояния аккаунта: из файла (mmap) и из базы (db)",
+            ("source",)))
+        self.state_evictions = r.register(Counter(
+            "bot_account_state_evictions_total", "Вытеснения состояния аккаунтов из памяти"))
+        self.profiles_cached = r.register(Gauge(
+            "bot_profiles_cached", "Профили подписчиков в памяти (общие для всех аккаунтов)"))
+        self.profile_cache_bytes = r.register(Gauge(
+            "bot_profile_cache_bytes", "Оценка памяти под профили подписчиков"))
+        self.profile_cache_requests = r.register(Counter(
+            "bot_profile_cache_requests_total", "Обращения к кэшу профилей: hit, miss", ("result",)))
+        self.profile_lookups = r.register(Counter(
+            "bot_profile_lookups_total", "Профили, запрошенные фоновой загрузкой: found, not_found",
+            ("result",)))
+        self.profiles_evicted = r.register(Counter(
+            "bot_profiles_evicted_total", "Профили, удалённые из базы как ненужные"))
+        # Telegram
+        self.outbox_pending = r.register(Gauge(
+            "telegram_outbox_pending", "Неотправленные уведомления в очереди"))
+        self.telegram_wait = r.register(Counter(
+            "telegram_ratelimit_wait_seconds_total", "Суммарное ожидание ограничителя скорости Telegram"))
+        self.telegram_waiting = r.register(Gauge(
+            "telegram_ratelimit_waiting", "Отправки, ожидающие ограничителя скорости"))
+        self.telegram_sent = r.register(Counter(
+            "telegram_messages_sent_total", "Сообщения, прошедшие ограничитель скорости"))
+
+    def render(self) -> str:
+        return self.registry.render()
+
+    def forget_account(self, account_id: str) -> None:
+        """Удаление рядов аккаунта (пакетная проверка не копит их по всему списку)"""
+        for metric in (self.check_duration, self.pages, self.bytes, self.check_errors,
+                       self.last_success, self.last_success_age):
+            metric.remove(account_id)
+        for kind in ("follow", "unfollow"):
+            self.events.remove(account_id, kind)
@@ -0,0 +1,151 @@
+import heapq
+import math
+from typing import Iterable
+
+# Априорная оценка для аккаунта без истории: одно событие за базовый интервал
+PRIOR_EVENTS = 1.0
+# Сглаживание средней стоимости проверки (запросов к API)
+COST_ALPHA = 0.2
+
+
+class AccountStats:
+    """Наблюдения по одному аккаунту: затухающие суммы событий и времени, стоимость проверки"""
+
+    __slots__ = ("events", "observed", "cost", "interval", "last_check")
+
+    def __init__(self, interval: float):
+        self.events = 0.0
+        self.observed = 0.0
+        self.cost = 1.0
+        self.interval = interval
+        self.last_check = 0.0
+
+
+class AccountScheduler:
+    """Очередь проверок аккаунтов по срокам (heapq) с адаптивными интервалами.
+
+    Для каждого аккаунта оцениваются частота подписок/отписок r (события
+    в секунду, с затуханием за half_life) и стоимость проверки c (запросов
+    к API). Интервал выбирается по правилу квадратного корня
+    t = λ·sqrt(c / r): при бюджете B запросов в секунду такой выбор
+    минимизирует суммарную задержку уведомлений Σ r·t/2 при Σ c/t = B,
+    откуда λ = Σ sqrt(c·r) / B. Интервал ограничен [min_interval, max_interval]:
+    тихий большой аккаунт проверяется реже, активный — чаще. max_interval
+    важнее бюджета: он ограничивает худшую задержку уведомления.
+    """
+
+    def __init__(self, base_interval: float, min_interval: float, max_interval: float,
+                 budget_per_minute: float, half_life: float = 86400.0):
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.budget = max(budget_per_minute, 1e-6) / 60
+        self.half_life = half_life
+        self.stats: dict[str, AccountStats] = {}
+        self._due: dict[str, float] = {}
+        self._heap: list[tuple[float, str]] = []
+        # Σ sqrt(c·r) по всем аккаунтам, обновляется при каждой записи
+        self._weight_sum = 0.0
+        self._weights: dict[str, float] = {}
+        # Насколько позже срока были выбраны аккаунты при последнем due()
+        self.last_lag = 0.0
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    # ───────────────────────────────────────────────
+    # Очередь
+    # ───────────────────────────────────────────────
+    def _push(self, account_id: str, due: float) -> None:
+        self._due[account_id] = due
+        heapq.heappush(self._heap, (due, account_id))
+
+    def sync(self, account_ids: Iterable[str], now: float, busy: Iterable[str] = ()) -> None:
+        """Новые аккаунты ставятся в очередь сразу, исчезнувшие убираются.
+
+        busy — аккаунты, которые сейчас проверяются: их срок выбран due() и
+        будет поставлен record() по завершении проверки.
+        """
+        account_ids = set(account_ids)
+        busy = set(busy)
+        for account_id in list(self._due):
+            if account_id not in account_ids:
+                self.remove(account_id)
+        for account_id in busy - account_ids:
+            self.remove(account_id)
+        for account_id in account_ids:
+            if account_id not in self._due and account_id not in busy:
+                self.stats.setdefault(account_id, AccountStats(self.base_interval))
+                self._push(account_id, now)
+
+    def defer(self, account_id: str, at: float) -> None:
+        """Повтор несостоявшейся проверки в момент at без учёта в статистике"""
+        self.stats.setdefault(account_id, AccountStats(self.base_interval))
+        self._push(account_id, at)
+
+    def remove(self, account_id: str) -> None:
+        self._due.pop(account_id, None)
+        self.stats.pop(account_id, None)
+        self._weight_sum -= self._weights.pop(account_id, 0.0)
+
+    def due(self, now: float) -> list[str]:
+        """Аккаунты, срок проверки которых наступил, в порядке сроков"""
+        result = []
+        while self._heap and self._heap[0][0] <= now:
+            due, account_id = heapq.heappop(self._heap)
+            # Устаревшие записи остаются в куче после переноса срока и пропускаются
+            if self._due.get(account_id) == due:
+                del self._due[account_id]
+                if not result:
+                    self.last_lag = now - due
+                result.append(account_id)
+        return result
+
+    def next_due(self) -> float | None:
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    # ───────────────────────────────────────────────
+    # Адаптивные интервалы
+    # ───────────────────────────────────────────────
+    def rate(self, account_id: str) -> float:
+        st = self.stats[account_id]
+        return (st.events + PRIOR_EVENTS) / (st.observed + self.base_interval)
+
+    def record(self, account_id: str, now: float, events: int, requests: int,
+               not_before: float = 0.0) -> float:
+        """Учёт завершённой проверки и постановка следующей; возвращает новый интервал.
+
+        Первая проверка задаёт исходный список подписчиков, поэтому её
+        события в частоту не идут. not_before — не раньше этого времени
+        (отложенная после ошибок проверка).
+        """
+        st = self.stats.setdefault(account_id, AccountStats(self.base_interval))
+        if st.last_check:
+            elapsed = max(now - st.last_check, 0.0)
+            decay = 0.5 ** (elapsed / self.half_life)
+            st.events = st.events * decay + events
+            st.observed = st.observed * decay + elapsed
+            st.cost += COST_ALPHA * (max(requests, 1) - st.cost)
+        else:
+            st.cost = max(requests, 1)
+        st.last_check = now
+
+        weight = math.sqrt(st.cost * self.rate(account_id))
+        self._weight_sum += weight - self._weights.get(account_id, 0.0)
+        self._weights[account_id] = weight
+
+        st.interval = self.interval(account_id)
+        self._push(account_id, max(now + st.interval, not_before))
+        return st.interval
+
+    def interval(self, account_id: str) -> float:
+        st = self.stats[account_id]
+        scale = self._weight_sum / self.budget
+        interval = scale * math.sqrt(st.cost / self.rate(account_id))
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def planned_rate(self) -> float:
+        """Ожидаемое число запросов в минуту при текущих интервалах"""
+        return 60 * sum(st.cost / st.interval for st in self.stats.values() if st.interval)
@@ -0,0 +1,46 @@
+import hashlib
+import re
+from bisect import bisect_right
+from typing import Collection
+
+
+def _point(key: str) -> int:
+    # hash() случаен между процессами, а реплики должны считать кольцо одинаково
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Консистентное хеширование аккаунтов по репликам 0..count-1.
+
+    Каждая реплика занимает vnodes точек на кольце. Аккаунт принадлежит
+    первой живой реплике по часовой стрелке от его точки, поэтому при
+    падении реплики переезжают только её аккаунты, а остальные остаются
+    на месте.
+    """
+
+    def __init__(self, count: int, vnodes: int = 64):
+        self.count = count
+        ring = sorted((_point(f"replica-{replica}#{i}"), replica)
+                      for replica in range(count) for i in range(vnodes))
+        self._points = [point for point, _ in ring]
+        self._replicas = [replica for _, replica in ring]
+
+    def owner(self, key: str, alive: Collection[int] | None = None) -> int | None:
+        """Реплика-владелец ключа среди живых или None, если живых нет"""
+        if not self._points:
+            return None
+        start = bisect_right(self._points, _point(key))
+        n = len(self._points)
+        for i in range(n):
+            replica = self._replicas[(start + i) % n]
+            if alive is None or replica in alive:
+                return replica
+        return None
+
+
+def replica_index(value: str | None, hostname: str = "") -> int:
+    """Номер реплики из REPLICA_INDEX или из порядкового номера пода StatefulSet (name-3 → 3)"""
+    if value:
+        return int(value)
+    match = re.search(r"-(\d+)$", hostname)
+    return int(match.group(1)) if match else 0
@@ -1,15 +1,39 @@
+import argparse
 import asyncio
 import aiohttp
-import json
+from aiohttp import web
 import os
 import ssl
 import certifi
 from telegram import Bot
 from telegram.error import TelegramError, RetryAfter
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 from dotenv import load_dotenv
+from event_log import EventLog
+from export import FORMATS, diff_snapshots, export
+from follower_decode import TOTAL_COUNT_KEYS, FollowerInfo, make_decoder
+from account_state import AccountStateCache
+from follower_ids import FollowerIdSet, ProfileCache
+from follower_store import FollowerStore, LeaseLostError
+from flow_control import (FAILED, NEUTRAL, OK, STATE_NAMES, THROTTLED, AimdController, CircuitBreaker, CircuitOpenError,
+                          jittered_backoff)
+from metrics import BotMetrics
+from scheduler import AccountScheduler
+from sharding import HashRing, replica_index
+from tracing import CycleProfiler, Tracer
+from urllib.parse import urlsplit
 import time
+import hashlib
+import json
+import signal
+import sys
+import uuid
+from array import array
+from collections import deque
+from contextlib import aclosing, asynccontextmanager
+from typing import AsyncIterator, Iterable, Iterator
 
 # ───────────────────────────────────────────────
 # env + логирование
@@ -31,53 +55,519 @@ ACCOUNT_ALIASES = {
     "3150102762": "lithiumly"
 }
 
+# Параллельная проверка аккаунтов
+ACCOUNT_CONCURRENCY = int(os.getenv("ACCOUNT_CONCURRENCY", "4"))
+SMULE_MAX_CONCURRENT_REQUESTS = int(os.getenv("SMULE_MAX_CONCURRENT_REQUESTS", "8"))
+# Повторы внутри цикла и отложенные повторы для проблемных аккаунтов
+ACCOUNT_RETRY_DELAY = float(os.getenv("ACCOUNT_RETRY_DELAY", "10"))
+ACCOUNT_BACKOFF_BASE = float(os.getenv("ACCOUNT_BACKOFF_BASE", "300"))
+ACCOUNT_BACKOFF_MAX = float(os.getenv("ACCOUNT_BACKOFF_MAX", "3600"))
+
+# Загрузка подписчиков: размеры страниц для пробы (по убыванию),
+# окно параллельных запросов и минимальный интервал между запросами к хосту
+SMULE_API_URL = "https://www.smule.com/api/profile/followers"
+SMULE_PAGE_SIZES = sorted(
+    {int(x) for x in os.getenv("SMULE_PAGE_SIZES", "100,50,20").split(",") if x.strip()},
+    reverse=True,
+)
+SMULE_FETCH_WINDOW = int(os.getenv("SMULE_FETCH_WINDOW", "4"))
+SMULE_MIN_REQUEST_INTERVAL = float(os.getenv("SMULE_MIN_REQUEST_INTERVAL", "0.2"))
+
+# Адаптивное управление нагрузкой на Smule (AIMD): окно параллельных запросов
+# растёт от SMULE_MIN_CONCURRENT_REQUESTS до SMULE_MAX_CONCURRENT_REQUESTS, пока
+# ответы приходят быстрее SMULE_LATENCY_TARGET секунд, а темп — на
+# SMULE_RATE_INCREASE запросов/с за секунду до 1/SMULE_MIN_REQUEST_INTERVAL.
+# Ответ 429 (503 с Retry-After) или заметная доля ошибок сервера и сети
+# умножает окно и темп на SMULE_AIMD_DECREASE (темп не ниже SMULE_MIN_RATE). После
+# SMULE_BREAKER_FAILURES неудач подряд эндпоинт отключается на
+# SMULE_BREAKER_RESET секунд, при повторных отключениях — вдвое дольше, до
+# SMULE_BREAKER_RESET_MAX. Повторы страницы ждут SMULE_RETRY_BASE·2ⁿ секунд
+# (не больше SMULE_RETRY_MAX) с разбросом
+SMULE_MIN_CONCURRENT_REQUESTS = int(os.getenv("SMULE_MIN_CONCURRENT_REQUESTS", "1"))
+SMULE_LATENCY_TARGET = float(os.getenv("SMULE_LATENCY_TARGET", "2"))
+SMULE_AIMD_DECREASE = float(os.getenv("SMULE_AIMD_DECREASE", "0.5"))
+SMULE_RATE_INCREASE = float(os.getenv("SMULE_RATE_INCREASE", "1"))
+SMULE_MIN_RATE = float(os.getenv("SMULE_MIN_RATE", "0.2"))
+SMULE_BREAKER_FAILURES = int(os.getenv("SMULE_BREAKER_FAILURES", "5"))
+SMULE_BREAKER_RESET = float(os.getenv("SMULE_BREAKER_RESET", "30"))
+SMULE_BREAKER_RESET_MAX = float(os.getenv("SMULE_BREAKER_RESET_MAX", "600"))
+SMULE_RETRY_BASE = float(os.getenv("SMULE_RETRY_BASE", "1"))
+SMULE_RETRY_MAX = float(os.getenv("SMULE_RETRY_MAX", "10"))
+# Retry-After больше этого значения не выдерживается целиком: дальше решает автомат отключения
+SMULE_RETRY_AFTER_MAX = 300.0
+
+# Инкрементальная синхронизация: API отдаёт подписчиков от новых к старым,
+# поэтому загрузку можно остановить после серии уже известных ID.
+# Полная сверка (для поиска отписок) выполняется раз в FULL_SYNC_EVERY циклов
+# или раз в FULL_SYNC_INTERVAL секунд.
+INCREMENTAL_SYNC = os.getenv("INCREMENTAL_SYNC", "true").lower() in ("1", "true", "yes")
+INCREMENTAL_KNOWN_RUN = int(os.getenv("INCREMENTAL_KNOWN_RUN", "20"))
+INCREMENTAL_MAX_PAGES = int(os.getenv("INCREMENTAL_MAX_PAGES", "5"))
+FULL_SYNC_EVERY = int(os.getenv("FULL_SYNC_EVERY", "12"))
+FULL_SYNC_INTERVAL = float(os.getenv("FULL_SYNC_INTERVAL", "3600"))
+# Полных проходов за одну проверку: кэш страниц и контрольная точка сбрасываются
+# не больше чем по разу, поэтому третий проход идёт уже без обоих
+FULL_SCAN_ATTEMPTS = 3
+
+# Контрольные точки полной загрузки: каждые SCAN_CHECKPOINT_PAGES страниц
+# (0 — отключено) прогресс сохраняется в базу, и после перезапуска загрузка
+# продолжается с того же места, если точке не больше SCAN_CHECKPOINT_MAX_AGE секунд.
+# Место продолжения уточняется по последним сохранённым ID (CHECKPOINT_ANCHORS),
+# так как за время простоя список мог сдвинуться
+SCAN_CHECKPOINT_PAGES = int(os.getenv("SCAN_CHECKPOINT_PAGES", "50"))
+SCAN_CHECKPOINT_MAX_AGE = float(os.getenv("SCAN_CHECKPOINT_MAX_AGE", "21600"))
+CHECKPOINT_ANCHORS = 16
+
+# Журнал подписок/отписок
+EVENT_LOG_DIR = os.path.join(DATA_DIR, "events")
+EVENT_SEGMENT_RECORDS = int(os.getenv("EVENT_SEGMENT_RECORDS", "65536"))
+
+# Состояние аккаунтов загружается при первой проверке; в памяти держится до
+# ACCOUNT_STATE_CACHE_ACCOUNTS последних проверенных аккаунтов в пределах
+# ACCOUNT_STATE_CACHE_MB (вместе с их кэшем страниц), остальные выгружаются
+# в DATA_DIR/state и при следующей проверке отображаются в память (mmap)
+ACCOUNT_STATE_DIR = os.path.join(DATA_DIR, "state")
+ACCOUNT_STATE_CACHE_ACCOUNTS = int(os.getenv("ACCOUNT_STATE_CACHE_ACCOUNTS", "100"))
+ACCOUNT_STATE_CACHE_MB = float(os.getenv("ACCOUNT_STATE_CACHE_MB", "256"))
+
+# Срок хранения профилей подписчиков, на которых больше никто из отслеживаемых не подписан
+FOLLOWER_META_RETENTION = float(os.getenv("FOLLOWER_META_RETENTION_DAYS", "7")) * 86400
+
+# Профили подписчиков общие для всех аккаунтов: в памяти до PROFILE_CACHE_MB,
+# устаревают через PROFILE_TTL_DAYS. Раз в PROFILE_REFRESH_INTERVAL секунд
+# недостающие и устаревшие профили (до PROFILE_REFRESH_MAX за раз) загружаются
+# пакетами по PROFILE_BATCH_SIZE из SMULE_PROFILE_API_URL; без адреса профили
+# обновляются только со страниц подписчиков
+PROFILE_CACHE_MB = float(os.getenv("PROFILE_CACHE_MB", "64"))
+PROFILE_TTL = float(os.getenv("PROFILE_TTL_DAYS", "7")) * 86400
+PROFILE_REFRESH_INTERVAL = float(os.getenv("PROFILE_REFRESH_INTERVAL", "600"))
+PROFILE_REFRESH_MAX = int(os.getenv("PROFILE_REFRESH_MAX", "500"))
+PROFILE_BATCH_SIZE = int(os.getenv("PROFILE_BATCH_SIZE", "50"))
+SMULE_PROFILE_API_URL = os.getenv("SMULE_PROFILE_API_URL", "")
+
+# Уведомления: несколько событий упаковываются в одно сообщение Telegram,
+# а при большом числе событий аккаунта отправляется сводка
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+NOTIFY_DIGEST_THRESHOLD = int(os.getenv("NOTIFY_DIGEST_THRESHOLD", "20"))
+NOTIFY_DIGEST_MAX_ITEMS = int(os.getenv("NOTIFY_DIGEST_MAX_ITEMS", "50"))
+
+# Очередь исходящих уведомлений: пауза между повторами отправки и срок,
+# в течение которого ключи отправленных уведомлений защищают от дублей
+OUTBOX_RETRY_MAX = float(os.getenv("OUTBOX_RETRY_MAX", "3600"))
+OUTBOX_DEDUP_TTL = float(os.getenv("OUTBOX_DEDUP_TTL", "86400"))
+OUTBOX_IDLE_WAIT = 60.0
+
+# HTTP-клиент: таймауты (секунды), кэш DNS, keep-alive и порог ошибок
+# подряд, после которого сессия пересоздаётся
+SMULE_TIMEOUT_TOTAL = float(os.getenv("SMULE_TIMEOUT_TOTAL", "30"))
+SMULE_TIMEOUT_CONNECT = float(os.getenv("SMULE_TIMEOUT_CONNECT", "5"))
+SMULE_TIMEOUT_READ = float(os.getenv("SMULE_TIMEOUT_READ", "15"))
+SMULE_DNS_CACHE_TTL = int(os.getenv("SMULE_DNS_CACHE_TTL", "300"))
+SMULE_KEEPALIVE_TIMEOUT = float(os.getenv("SMULE_KEEPALIVE_TIMEOUT", "120"))
+SMULE_SESSION_MAX_ERRORS = int(os.getenv("SMULE_SESSION_MAX_ERRORS", "5"))
+
+# Кэш страниц подписчиков (ETag/Last-Modified и хэш содержимого)
+SMULE_PAGE_CACHE = os.getenv("SMULE_PAGE_CACHE", "true").lower() in ("1", "true", "yes")
+
+# Разбор ответов Smule: auto, msgspec, orjson или json
+SMULE_JSON_DECODER = os.getenv("SMULE_JSON_DECODER", "auto")
+
+# Шардирование: аккаунты делятся между REPLICA_COUNT репликами с общим
+# DATA_DIR. Номер реплики берётся из REPLICA_INDEX или из имени пода
+# StatefulSet. Аренда аккаунта действует LEASE_TTL секунд; она и отметка
+# о работе реплики продлеваются фоновой задачей каждые LEASE_TTL / 3 секунд,
+# в том числе во время полной загрузки, которая идёт дольше LEASE_TTL
+REPLICA_COUNT = max(1, int(os.getenv("REPLICA_COUNT", "1")))
+REPLICA_INDEX = replica_index(os.getenv("REPLICA_INDEX"), os.getenv("HOSTNAME", ""))
+SHARDING = REPLICA_COUNT > 1
+LEASE_TTL = float(os.getenv("LEASE_TTL", "900"))
+# На сколько уведомление резервируется за воркером реплики на время отправки
+OUTBOX_CLAIM_TTL = float(os.getenv("OUTBOX_CLAIM_TTL", "900"))
+
+# Планировщик проверок: интервал каждого аккаунта подстраивается под частоту
+# подписок и стоимость проверки в пределах [SCHED_MIN_INTERVAL, SCHED_MAX_INTERVAL]
+# и общего бюджета SMULE_REQUEST_BUDGET запросов к Smule в минуту
+SCHED_MIN_INTERVAL = float(os.getenv("SCHED_MIN_INTERVAL", "60"))
+SCHED_MAX_INTERVAL = float(os.getenv("SCHED_MAX_INTERVAL", "3600"))
+SMULE_REQUEST_BUDGET = float(os.getenv("SMULE_REQUEST_BUDGET", "60"))
+SCHED_HALF_LIFE = float(os.getenv("SCHED_HALF_LIFE_HOURS", "24")) * 3600
+
+# HTTP-сервер метрик Prometheus (/metrics) и проверок здоровья (/healthz/live,
+# /healthz/ready); HEALTH_PORT=0 отключает его. Цикл считается зависшим, если
+# проверки идут, но ни один запрос к Smule и ни одна проверка не завершились
+# за HEALTH_MAX_STALL секунд (длительность прохода не ограничена: полная
+# загрузка большого аккаунта идёт долго), или пробуждение опоздало на
+# HEALTH_GRACE; реплика не готова, если ни один аккаунт не проверялся успешно
+# дольше HEALTH_MAX_STALENESS секунд
+HEALTH_HOST = os.getenv("HEALTH_HOST", "0.0.0.0")
+HEALTH_PORT = int(os.getenv("HEALTH_PORT", "8080"))
+HEALTH_MAX_STALL = float(os.getenv("HEALTH_MAX_STALL", "600"))
+HEALTH_GRACE = float(os.getenv("HEALTH_GRACE", "120"))
+HEALTH_MAX_STALENESS = float(os.getenv("HEALTH_MAX_STALENESS", str(2 * SCHED_MAX_INTERVAL + 600)))
+# Неудачных проходов цикла подряд до длительной паузы (и до отказа liveness);
+# пауза после неудачного прохода растёт от LOOP_BACKOFF_BASE до LOOP_BACKOFF_MAX
+LOOP_MAX_FAILURES = 3
+LOOP_BACKOFF_BASE = 60.0
+LOOP_BACKOFF_MAX = 300.0
+
+# Трассировка фаз проверки: спаны в формате JSON-строк (поля OpenTelemetry)
+# пишутся в TRACE_FILE, если он задан; файл ротируется при TRACE_MAX_MB.
+# Профилирование одного прохода (cProfile и дамп задач asyncio) в PROFILE_DIR
+# по сигналу SIGUSR1 или для первого прохода при PROFILE_FIRST_CYCLE
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+TRACE_MAX_MB = float(os.getenv("TRACE_MAX_MB", "50"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(DATA_DIR, "profiles"))
+PROFILE_FIRST_CYCLE = os.getenv("PROFILE_FIRST_CYCLE", "false").lower() in ("1", "true", "yes")
+PROFILE_TASK_DUMP_DELAY = float(os.getenv("PROFILE_TASK_DUMP_DELAY", "1"))
+
+
+class TokenBucket:
+    """Ограничитель скорости по алгоритму GCRA (эквивалент token bucket).
+
+    Хранит только теоретическое время следующего события, поэтому каждая
+    операция — O(1). Слот резервируется синхронно, без await между проверкой
+    и обновлением, так что параллельные корутины не могут занять один слот.
+    rate <= 0 означает отсутствие ограничения.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.burst = max(1, burst)
+        self.set_rate(rate)
+        self._tat = 0.0
+        # Метрики
+        self.waiting = 0
+        self.total_wait = 0.0
+        self.acquired = 0
+
+    def set_rate(self, rate: float) -> None:
+        """Новый темп; уже зарезервированные слоты не переносятся"""
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.tolerance = self.interval * (self.burst - 1)
+
+    def delay(self, now: float) -> float:
+        """Через сколько секунд освободится слот, если резервировать сейчас"""
+        return max(0.0, self._tat - self.tolerance - now)
+
+    def commit(self, at: float) -> None:
+        """Занять слот в момент at (не раньше, чем delay() от текущего времени)"""
+        self._tat = max(self._tat, at) + self.interval
+        self.acquired += 1
+
+    @property
+    def backlog(self) -> float:
+        return self.delay(time.monotonic())
+
+    async def acquire(self) -> float:
+        return await acquire_all(self)
+
+
+class WindowLimiter:
+    """Не больше limit событий в любом окне длиной window секунд.
+
+    В отличие от TokenBucket с запасом limit (который после паузы пропускает
+    запас и сразу за ним темп, то есть до 2·limit−1 событий за окно), здесь
+    хранятся моменты последних limit событий: следующее разрешено не раньше,
+    чем через window после самого старого из них. Интерфейс тот же, что у
+    TokenBucket, поэтому ограничители резервируются вместе в acquire_all.
+    """
+
+    def __init__(self, limit: int, window: float):
+        self.window = window
+        self._times: deque[float] = deque(maxlen=max(1, limit))
+        # Метрики
+        self.waiting = 0
+        self.total_wait = 0.0
+        self.acquired = 0
+
+    def delay(self, now: float) -> float:
+        if len(self._times) < self._times.maxlen:
+            return 0.0
+        return max(0.0, self._times[0] + self.window - now)
+
+    def commit(self, at: float) -> None:
+        # Моменты идут по возрастанию: самый старый всегда в начале
+        self._times.append(max(at, self._times[-1]) if self._times else at)
+        self.acquired += 1
+
+    @property
+    def backlog(self) -> float:
+        return self.delay(time.monotonic())
+
+
+async def acquire_all(*buckets: TokenBucket | WindowLimiter) -> float:
+    """Одновременное резервирование слота во всех ограничителях; возвращает ожидание"""
+    now = time.monotonic()
+    wait = max(bucket.delay(now) for bucket in buckets)
+    for bucket in buckets:
+        bucket.commit(now + wait)
+        bucket.total_wait += wait
+    if wait > 0:
+        for bucket in buckets:
+            bucket.waiting += 1
+        try:
+            await asyncio.sleep(wait)
+        finally:
+            for bucket in buckets:
+                bucket.waiting -= 1
+    return wait
+
 
 class TelegramRateLimiter:
-    """Класс для контроля частоты отправки сообщений в Telegram"""
-    
-    def __init__(self, max_messages_per_second: float = 1.0, max_messages_per_minute: int = 20):
+    """Класс для контроля частоты отправки сообщений в Telegram.
+
+    Лимиты Telegram: не больше ~1 сообщения в секунду и 20 в минуту в один
+    чат и около 30 сообщений в секунду на бота в целом. Для каждого чата
+    заводятся свои ограничители, глобальный общий для всех чатов. Минутный
+    лимит чата — строгое скользящее окно (WindowLimiter): запас TokenBucket
+    позволил бы почти вдвое больше сообщений за минуту.
+    """
+
+    def __init__(self, max_messages_per_second: float = 1.0, max_messages_per_minute: int = 20,
+                 global_messages_per_second: float = 30.0):
         self.max_messages_per_second = max_messages_per_second
         self.max_messages_per_minute = max_messages_per_minute
-        self.last_send_time = 0.0
-        self.message_times = []
-        
-    async def wait_if_needed(self):
+        self.global_bucket = TokenBucket(global_messages_per_second, burst=int(global_messages_per_second))
+        self.chat_buckets: dict[str, tuple[TokenBucket, WindowLimiter]] = {}
+
+    def _chat_buckets(self, chat_id: str) -> tuple[TokenBucket, WindowLimiter]:
+        buckets = self.chat_buckets.get(chat_id)
+        if buckets is None:
+            buckets = (
+                TokenBucket(self.max_messages_per_second),
+                WindowLimiter(self.max_messages_per_minute, 60.0),
+            )
+            self.chat_buckets[chat_id] = buckets
+        return buckets
+
+    async def wait_if_needed(self, chat_id: str = ""):
         """Ожидание перед отправкой сообщения, если необходимо"""
-        current_time = time.time()
-        
-        # Проверяем лимит по секундам
-        time_since_last = current_time - self.last_send_time
-        min_interval = 1.0 / self.max_messages_per_second
-        if time_since_last < min_interval:
-            wait_time = min_interval - time_since_last
+        wait_time = await acquire_all(self.global_bucket, *self._chat_buckets(chat_id))
+        if wait_time > 0:
             logger.info(f"Ожидание {wait_time:.2f}с для соблюдения лимита скорости")
-            await asyncio.sleep(wait_time)
-            current_time = time.time()
-        
-        # Проверяем лимит по минутам
-        one_minute_ago = current_time - 60
-        self.message_times = [t for t in self.message_times if t > one_minute_ago]
-        
-        if len(self.message_times) >= self.max_messages_per_minute:
-            oldest_message = min(self.message_times)
-            wait_time = oldest_message + 60 - current_time
-            if wait_time > 0:
-                logger.info(f"Ожидание {wait_time:.2f}с для соблюдения минутного лимита")
-                await asyncio.sleep(wait_time)
-                current_time = time.time()
-        
-        # Обновляем времена
-        self.last_send_time = current_time
-        self.message_times.append(current_time)
+
+    def stats(self) -> dict:
+        """Текущее состояние: ожидающие отправки и сколько ждать следующему"""
+        buckets = [self.global_bucket] + [b for pair in self.chat_buckets.values() for b in pair]
+        return {
+            "waiting": max(b.waiting for b in buckets),
+            "backlog_seconds": max(b.backlog for b in buckets),
+            "total_wait_seconds": self.global_bucket.total_wait,
+            "sent": self.global_bucket.acquired,
+        }
+
+
+class HostPacer:
+    """Равномерное распределение запросов к хосту: отдельный TokenBucket на хост"""
+
+    def __init__(self, min_interval: float, burst: int = 1):
+        self.rate = 1.0 / min_interval if min_interval > 0 else 0.0
+        self.burst = burst
+        self.buckets: dict[str, TokenBucket] = {}
+
+    async def wait(self, host: str) -> None:
+        bucket = self.buckets.get(host)
+        if bucket is None:
+            bucket = self.buckets[host] = TokenBucket(self.rate, self.burst)
+        await bucket.acquire()
+
+    def set_rate(self, rate: float) -> None:
+        if rate != self.rate:
+            self.rate = rate
+            for bucket in self.buckets.values():
+                bucket.set_rate(rate)
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Retry-After в секундах (число или HTTP-дата), не больше SMULE_RETRY_AFTER_MAX"""
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), SMULE_RETRY_AFTER_MAX) or None
+
+
+class SmuleCall:
+    """Исход одного запроса к Smule для контроллера нагрузки и автомата эндпоинта"""
+
+    __slots__ = ("outcome", "retry_after", "started")
+
+    def __init__(self):
+        # None — запрос отменён до ответа: контроллер и автомат его не учитывают
+        self.outcome: str | None = None
+        self.retry_after: float | None = None
+        self.started = 0.0
+
+    def classify(self, resp: aiohttp.ClientResponse) -> None:
+        """Исход по ответу с кодом, отличным от 200 и 304"""
+        if resp.status in (429, 503):
+            self.retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+        if resp.status == 429 or (resp.status == 503 and self.retry_after):
+            self.outcome = THROTTLED
+        elif resp.status >= 500:
+            self.outcome = FAILED
+        else:
+            # 4xx (в том числе неподходящий limit при пробе) не говорит о перегрузке
+            self.outcome = NEUTRAL
+
+
+class CachedPage:
+    """Страница без изменений с прошлой проверки: только ID подписчиков"""
+
+    __slots__ = ("ids",)
+
+    def __init__(self, ids: array):
+        self.ids = ids
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class PageCache:
+    """Кэш ответов /api/profile/followers для условных запросов.
+
+    Для каждой страницы (аккаунт, offset, limit) хранятся ETag, Last-Modified,
+    хэш тела и ID подписчиков. Если сервер ответил 304 или тело совпало по
+    хэшу, страница не разбирается и не сравнивается заново.
+
+    Новые записи сначала откладываются и попадают в кэш только после того,
+    как результат проверки аккаунта сохранён: иначе страница могла бы
+    считаться обработанной, хотя её подписчики не записаны.
+
+    Страницы аккаунта живут, пока его состояние в AccountStateCache: их
+    размер (account_bytes) входит в бюджет ACCOUNT_STATE_CACHE_MB, а при
+    вытеснении состояния они сбрасываются (invalidate).
+    """
+
+    def __init__(self):
+        self.pages: dict[str, dict[tuple[int, int], tuple]] = {}
+        self.staged: dict[str, dict[tuple[int, int], tuple]] = {}
+        # account_id -> байт в массивах ID закэшированных страниц
+        self.sizes: dict[str, int] = {}
+        self.stats: dict[str, int] = {}
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self.stats = {
+            "requests": 0,
+            "not_modified": 0,
+            "unchanged_body": 0,
+            "bytes_downloaded": 0,
+            "bytes_avoided": 0,
+        }
+
+    def get(self, account_id: str, offset: int, limit: int) -> tuple | None:
+        """(etag, last_modified, хэш, размер, ID) или None"""
+        return self.pages.get(account_id, {}).get((offset, limit))
+
+    def stage(self, account_id: str, offset: int, limit: int, entry: tuple) -> None:
+        self.staged.setdefault(account_id, {})[(offset, limit)] = entry
+
+    def commit(self, account_id: str, complete: bool) -> None:
+        staged = self.staged.pop(account_id, {})
+        if complete:
+            # В staged попадают все страницы прохода, включая неизменившиеся,
+            # поэтому после полного прохода он целиком заменяет кэш аккаунта
+            self.pages[account_id] = staged
+        else:
+            self.pages.setdefault(account_id, {}).update(staged)
+        pages = self.pages[account_id]
+        self.sizes[account_id] = sum(entry[4].itemsize * len(entry[4]) for entry in pages.values())
+
+    def account_bytes(self, account_id: str) -> int:
+        return self.sizes.get(account_id, 0)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(self.sizes.values())
+
+    def discard(self, account_id: str) -> None:
+        self.staged.pop(account_id, None)
+
+    def invalidate(self, account_id: str) -> None:
+        self.pages.pop(account_id, None)
+        self.staged.pop(account_id, None)
+        self.sizes.pop(account_id, None)
 
 
 class SmuleFollowersBot:
-    def __init__(self, telegram_token: str, chat_id: str, account_ids):
-        self.bot = Bot(token=telegram_token)
+    def __init__(self, telegram_token: str | None, chat_id: str | None, account_ids, notify: bool = True):
+        # Без токена (пакетный режим) сообщения только ставятся в очередь
+        self.bot = Bot(token=telegram_token) if telegram_token else None
         self.chat_id = chat_id
+        # notify=False — изменения записываются без уведомлений (scan без --notify)
+        self.notify = notify
         self.account_ids = account_ids if isinstance(account_ids, list) else [account_ids]
         self.rate_limiter = TelegramRateLimiter()
 
+        # Ограничение параллельно проверяемых аккаунтов; окно и темп запросов
+        # к Smule подстраиваются под ответы API, эндпоинты защищены автоматами
+        self.account_semaphore = asyncio.Semaphore(max(1, ACCOUNT_CONCURRENCY))
+        self.host_pacer = HostPacer(SMULE_MIN_REQUEST_INTERVAL)
+        self.smule_flow = AimdController(
+            SMULE_MIN_CONCURRENT_REQUESTS, SMULE_MAX_CONCURRENT_REQUESTS,
+            max_rate=self.host_pacer.rate, min_rate=SMULE_MIN_RATE, latency_target=SMULE_LATENCY_TARGET,
+            decrease=SMULE_AIMD_DECREASE, rate_increase=SMULE_RATE_INCREASE,
+        )
+        self.breakers: dict[str, CircuitBreaker] = {}
+        # Максимальный размер страницы, который принимает API (определяется пробой)
+        self.page_size: int | None = None
+        # account_id -> (циклов с последней полной сверки, время полной сверки)
+        self.sync_state: dict[str, tuple[int, float]] = {}
+        # Общее число подписчиков, если API сообщает его в ответе
+        self.reported_totals: dict[str, int] = {}
+        self.page_cache = PageCache() if SMULE_PAGE_CACHE else None
+        self.json_backend, self._decode_json = make_decoder(SMULE_JSON_DECODER)
+        logger.info(f"Разбор ответов Smule: {self.json_backend}")
+
+        # Долгоживущая HTTP-сессия и статистика соединений
+        self._session: aiohttp.ClientSession | None = None
+        self._ssl_ctx: ssl.SSLContext | None = None
+        self._session_errors = 0
+        self.http_stats: dict[str, int] = dict.fromkeys(
+            ("sessions_created", "requests", "connections_created", "connections_reused",
+             "dns_resolved", "dns_cache_hits"), 0
+        )
+        # account_id -> (число неудачных циклов подряд, время следующей попытки)
+        self.account_backoff: dict[str, tuple[int, float]] = {}
+        # account_id -> время повтора проверки, прерванной отключённым эндпоинтом
+        # (не ошибка аккаунта: срок переносится на retry_in, а не на интервал)
+        self.account_deferred: dict[str, float] = {}
+        # Сроки проверок аккаунтов и запросы к API за текущую проверку аккаунта
+        self.scheduler = AccountScheduler(300, SCHED_MIN_INTERVAL, SCHED_MAX_INTERVAL,
+                                          SMULE_REQUEST_BUDGET, SCHED_HALF_LIFE)
+        self.account_requests: dict[str, int] = {}
+
+        # Метрики и состояние цикла для проверок здоровья
+        self.metrics = BotMetrics()
+        self.last_success: dict[str, float] = {}
+        self._tick_started: float | None = None
+        # Время последнего завершённого запроса к Smule или проверки аккаунта
+        self._progress_at = time.time()
+        self._wake_at = 0.0
+        self._loop_failures = 0
+        self._loop_running = False
+        self._health_runner: web.AppRunner | None = None
+        # Спаны фаз проверки и профилирование прохода по запросу
+        self.tracer = Tracer(TRACE_FILE, int(TRACE_MAX_MB * 1024 * 1024))
+        self.profiler = CycleProfiler(PROFILE_DIR, PROFILE_TASK_DUMP_DELAY)
+        if PROFILE_FIRST_CYCLE:
+            self.profiler.request()
+        # Фоновая отправка уведомлений из очереди в базе и обновление профилей
+        self._outbox_event = asyncio.Event()
+        self._delivery_task: asyncio.Task | None = None
+        self._profile_task: asyncio.Task | None = None
+        # Продление аренды при шардировании; _lease_lock не даёт продлить
+        # аренду, которую _refresh_ownership как раз освобождает
+        self._lease_task: asyncio.Task | None = None
+        self._lease_lock = asyncio.Lock()
+        # ID, которых API профилей не вернул, и время запроса
+        self._profiles_not_found: dict[str, float] = {}
+
         # Заголовки к Smule API
         self.headers = {
             "User-Agent": ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
@@ -85,99 +575,490 @@ class SmuleFollowersBot:
                            "Chrome/123.0.0.0 Safari/537.36"),
             "Accept": "application/json, text/plain, */*",
             "Accept-Language": "en-US,en;q=0.9",
-            "Cache-Control": "no-cache",
-            "Pragma": "no-cache",
             "Connection": "keep-alive",
         }
 
-        # Известные подписчики и кэш метаданных
-        self.known_followers: dict[str, set[str]] = {}
-        self.followers_meta: dict[str, dict[str, dict]] = {}
+        # Известные подписчики и общий кэш профилей
+        self.store = FollowerStore(os.path.join(DATA_DIR, "followers.db"))
+        self.store.migrate_json(DATA_DIR)
+        self.event_log = EventLog(EVENT_LOG_DIR, EVENT_SEGMENT_RECORDS)
+        self.profiles = ProfileCache(int(PROFILE_CACHE_MB * 1024 * 1024), PROFILE_TTL)
+        self.profile_stats = dict.fromkeys(("requested", "found", "not_found", "evicted"), 0)
+        # Состояние загружается при первой проверке аккаунта, а не при запуске;
+        # кэш страниц аккаунта входит в его бюджет и вытесняется вместе с ним
+        self.states = AccountStateCache(self.store, ACCOUNT_STATE_DIR,
+                                        max(ACCOUNT_STATE_CACHE_ACCOUNTS, ACCOUNT_CONCURRENCY),
+                                        int(ACCOUNT_STATE_CACHE_MB * 1024 * 1024),
+                                        self.page_cache.account_bytes if self.page_cache else None,
+                                        self.page_cache.invalidate if self.page_cache else None)
+
+        # Аккаунты, которыми владеет эта реплика: без шардирования — все,
+        # иначе определяются арендой в _refresh_ownership
+        self.replica = REPLICA_INDEX if SHARDING else None
+        self.ring = HashRing(REPLICA_COUNT) if SHARDING else None
+        self.owned: set[str] = set() if SHARDING else set(self.account_ids)
+
+    def _drop_account(self, account_id: str, keep_state: bool = False) -> None:
+        """Забыть состояние аккаунта, перешедшего к другой реплике.
 
-        for account_id in self.account_ids:
-            self.known_followers[account_id] = self._load_followers_set(account_id)
-            self.followers_meta[account_id] = self._load_followers_meta(account_id)
+        keep_state — набор подписчиков остаётся в AccountStateCache и
+        вытесняется оттуда как обычно (пакетная проверка).
+        """
+        self.last_success.pop(account_id, None)
+        if not keep_state:
+            self.states.discard(account_id)
+        self.sync_state.pop(account_id, None)
+        self.reported_totals.pop(account_id, None)
+        self.account_backoff.pop(account_id, None)
+        self.account_deferred.pop(account_id, None)
+        if self.page_cache:
+            self.page_cache.invalidate(account_id)
+        self.owned.discard(account_id)
 
     # ───────────────────────────────────────────────
-    # Работа с файлами
+    # Шардирование
     # ───────────────────────────────────────────────
-    def _followers_file(self, account_id: str) -> str:
-        return os.path.join(DATA_DIR, f"followers_{account_id}.json")
+    async def _refresh_ownership(self) -> list[str]:
+        """Аккаунты, которые эта реплика проверяет в текущем цикле.
 
-    def _followers_meta_file(self, account_id: str) -> str:
-        return os.path.join(DATA_DIR, f"followers_meta_{account_id}.json")
+        Аккаунт принадлежит первой живой реплике на кольце консистентного
+        хеширования. Владение закрепляется арендой в общей базе: чужая
+        аренда перехватывается только после истечения, поэтому аккаунты
+        упавшей реплики переходят к живым через LEASE_TTL, а аккаунты, для
+        которых появилась более подходящая реплика, отдаются ей.
+        """
+        if not SHARDING:
+            return self.account_ids
 
-    def _load_followers_set(self, account_id: str) -> set:
-        fp = self._followers_file(account_id)
-        try:
-            if os.path.exists(fp):
-                with open(fp, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    return set(data) if isinstance(data, list) else set()
-            return set()
-        except Exception as e:
-            logger.error(f"Ошибка при загрузке подписчиков ({account_id}): {e}")
-            return set()
+        async with self._lease_lock:
+            now = time.time()
+            alive = await asyncio.to_thread(self.store.heartbeat, self.replica, now, LEASE_TTL)
+            preferred = [a for a in self.account_ids if self.ring.owner(a, alive) == self.replica]
+            handed_over = [a for a in self.owned if a not in preferred]
+            if handed_over:
+                await asyncio.to_thread(self.store.release_leases, self.replica, handed_over)
+                for account_id in handed_over:
+                    self._drop_account(account_id)
+                logger.info(f"Реплика {self.replica}: передано другим репликам {len(handed_over)} аккаунтов")
 
-    def _save_followers_set(self, account_id: str) -> None:
-        fp = self._followers_file(account_id)
-        try:
-            with open(fp, "w", encoding="utf-8") as f:
-                json.dump(sorted(self.known_followers[account_id]), f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            logger.error(f"Ошибка при сохранении подписчиков ({account_id}): {e}")
+            acquired = await asyncio.to_thread(self.store.acquire_leases, self.replica, preferred, now, LEASE_TTL)
+            for account_id in self.owned - acquired:
+                self._drop_account(account_id)
+            self.owned = acquired
 
-    def _load_followers_meta(self, account_id: str) -> dict:
-        fp = self._followers_meta_file(account_id)
-        try:
-            if os.path.exists(fp):
-                with open(fp, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    return data if isinstance(data, dict) else {}
-            return {}
-        except Exception as e:
-            logger.error(f"Ошибка при загрузке метаданных подписчиков ({account_id}): {e}")
-            return {}
+        waiting = len(preferred) - len(acquired)
+        logger.info(f"Реплика {self.replica}/{REPLICA_COUNT} (живых: {len(alive)}): аккаунтов {len(acquired)}"
+                    + (f", ожидают освобождения аренды: {waiting}" if waiting else ""))
+        return [a for a in self.account_ids if a in acquired]
+
+    def start_lease_renewal(self, heartbeat: bool = True) -> None:
+        """Запуск фонового продления аренды, если шардирование включено и оно ещё не запущено"""
+        if SHARDING and (self._lease_task is None or self._lease_task.done()):
+            self._lease_task = asyncio.create_task(self._lease_worker(heartbeat))
+
+    async def _lease_worker(self, heartbeat: bool) -> None:
+        """Продление аренды аккаунтов реплики каждые LEASE_TTL / 3 секунд.
+
+        Работает независимо от проверок: полная загрузка большого аккаунта
+        может идти дольше LEASE_TTL, и без продления другие реплики сочли бы
+        эту упавшей, а запись её результата закончилась бы LeaseLostError.
+        heartbeat=False — без отметки о работе (разовая проверка scan не
+        участвует в распределении аккаунтов).
+        """
+        while True:
+            await asyncio.sleep(LEASE_TTL / 3)
+            try:
+                async with self._lease_lock:
+                    now = time.time()
+                    if heartbeat:
+                        await asyncio.to_thread(self.store.heartbeat, self.replica, now, LEASE_TTL)
+                    owned = list(self.owned)
+                    if not owned:
+                        continue
+                    kept = await asyncio.to_thread(self.store.acquire_leases, self.replica, owned, now, LEASE_TTL)
+                if len(kept) < len(owned):
+                    # Аккаунт уже у другой реплики: его проверка получит LeaseLostError при записи
+                    logger.warning(f"Реплика {self.replica}: аренда {len(owned) - len(kept)} аккаунтов потеряна")
+            except Exception as e:
+                logger.error(f"Ошибка продления аренды аккаунтов: {e}")
 
-    def _save_followers_meta(self, account_id: str) -> None:
-        fp = self._followers_meta_file(account_id)
+    # ───────────────────────────────────────────────
+    # Хранилище
+    # ───────────────────────────────────────────────
+    async def _save_changes(self, account_id: str, added: list[str], removed: list[str],
+                            profiles: dict[str, dict], notifications: list[tuple[str, str, str]]) -> int:
+        """Запись в базу только изменившихся подписчиков аккаунта и событий в журнал.
+
+        Уведомления ставятся в очередь той же транзакцией, что и изменения:
+        если запись не удалась, исключение пробрасывается и ни состояние,
+        ни уведомления не считаются сохранёнными. Возвращает версию набора
+        подписчиков в базе.
+        """
         try:
-            with open(fp, "w", encoding="utf-8") as f:
-                json.dump(self.followers_meta[account_id], f, ensure_ascii=False, indent=2)
+            with self.tracer.span("store.save", account=account_id, added=len(added), removed=len(removed),
+                                  notifications=len(notifications)):
+                version = await asyncio.to_thread(self.store.apply_changes, account_id, added, removed, profiles,
+                                                  notifications, self.replica)
+        except LeaseLostError:
+            raise
         except Exception as e:
-            logger.error(f"Ошибка при сохранении метаданных подписчиков ({account_id}): {e}")
+            logger.error(f"Ошибка при сохранении подписчиков ({account_id}): {e}")
+            raise
+        if notifications:
+            self._outbox_event.set()
+
+        if added or removed:
+            try:
+                with self.tracer.span("event_log.append", account=account_id):
+                    await asyncio.to_thread(self.event_log.append, account_id, added, removed)
+            except Exception as e:
+                logger.error(f"Ошибка при записи журнала событий ({account_id}): {e}")
+        return version
 
     # ───────────────────────────────────────────────
     # HTTP-сессия с валидным CA (certifi)
     # ───────────────────────────────────────────────
     def _build_session(self) -> aiohttp.ClientSession:
-        ssl_ctx = ssl.create_default_context(cafile=certifi.where())
-        timeout = aiohttp.ClientTimeout(total=10, connect=2, sock_read=15)
-        connector = aiohttp.TCPConnector(ssl=ssl_ctx, limit=10)
-        return aiohttp.ClientSession(connector=connector, timeout=timeout)
+        if self._ssl_ctx is None:
+            self._ssl_ctx = ssl.create_default_context(cafile=certifi.where())
+        timeout = aiohttp.ClientTimeout(total=SMULE_TIMEOUT_TOTAL, connect=SMULE_TIMEOUT_CONNECT,
+                                        sock_read=SMULE_TIMEOUT_READ)
+        connector = aiohttp.TCPConnector(
+            ssl=self._ssl_ctx,
+            limit=max(1, SMULE_MAX_CONCURRENT_REQUESTS),
+            ttl_dns_cache=SMULE_DNS_CACHE_TTL,
+            keepalive_timeout=SMULE_KEEPALIVE_TIMEOUT,
+        )
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(self._trace_counter("requests"))
+        trace.on_connection_create_end.append(self._trace_counter("connections_created"))
+        trace.on_connection_reuseconn.append(self._trace_counter("connections_reused"))
+        trace.on_dns_resolvehost_end.append(self._trace_counter("dns_resolved"))
+        trace.on_dns_cache_hit.append(self._trace_counter("dns_cache_hits"))
+        self.http_stats["sessions_created"] += 1
+        return aiohttp.ClientSession(connector=connector, timeout=timeout, trace_configs=[trace])
+
+    def _trace_counter(self, name: str):
+        async def on_event(session, ctx, params) -> None:
+            self.http_stats[name] += 1
+        return on_event
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Одна сессия на всё время работы бота.
+
+        Соединения, TLS-сессии и DNS-кэш переиспользуются между циклами.
+        Сессия пересоздаётся, если подряд накопилось SMULE_SESSION_MAX_ERRORS
+        сетевых ошибок: так сбрасываются «залипшие» соединения.
+        """
+        if self._session is not None and not self._session.closed:
+            if self._session_errors < SMULE_SESSION_MAX_ERRORS:
+                return self._session
+            logger.warning(f"{self._session_errors} сетевых ошибок подряд, пересоздаём HTTP-сессию")
+            await self._session.close()
+        self._session = self._build_session()
+        self._session_errors = 0
+        return self._session
+
+    async def close(self) -> None:
+        for task in (self._profile_task, self._lease_task):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        if self._health_runner is not None:
+            await self._health_runner.cleanup()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        if SHARDING:
+            # Аккаунты сразу достанутся другим репликам, без ожидания LEASE_TTL
+            await asyncio.to_thread(self.store.release_leases, self.replica)
+        # Следующий запуск отобразит наборы подписчиков из файлов, а не прочитает из базы
+        await asyncio.to_thread(self.states.spill_all)
+        self.store.close()
+        self.tracer.close()
+
+    # ───────────────────────────────────────────────
+    # Метрики и проверки здоровья
+    # ───────────────────────────────────────────────
+    async def start_health_server(self, host: str = HEALTH_HOST, port: int = HEALTH_PORT) -> None:
+        """HTTP-сервер с /metrics, /healthz/live и /healthz/ready"""
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle_metrics)
+        app.router.add_get("/healthz/live", self._handle_live)
+        app.router.add_get("/healthz/ready", self._handle_ready)
+        self._health_runner = web.AppRunner(app, access_log=None)
+        await self._health_runner.setup()
+        await web.TCPSite(self._health_runner, host, port).start()
+        logger.info(f"Метрики и проверки здоровья: http://{host}:{port}/metrics, /healthz/live, /healthz/ready")
+
+    async def _collect_metrics(self) -> None:
+        """Снимок состояния, которое не считается по ходу работы"""
+        m = self.metrics
+        now = time.time()
+        m.accounts.set(len(self.owned))
+        m.loop_failures.set(self._loop_failures)
+        m.last_success.clear()
+        m.last_success_age.clear()
+        for account_id, at in self.last_success.items():
+            m.last_success.set(at, account_id)
+            m.last_success_age.set(now - at, account_id)
+        m.outbox_pending.set(await asyncio.to_thread(self.store.pending_notifications))
+        telegram = self.rate_limiter.stats()
+        m.telegram_wait.set_total(telegram["total_wait_seconds"])
+        m.telegram_waiting.set(telegram["waiting"])
+        m.telegram_sent.set_total(telegram["sent"])
+        m.pacer_wait.set_total(sum(b.total_wait for b in self.host_pacer.buckets.values()))
+        flow = self.smule_flow.state()
+        m.concurrency_limit.set(flow["limit"])
+        m.in_flight.set(flow["in_flight"])
+        m.rate_limit.set(flow["rate"])
+        m.flow_decreases.set_total(flow["decreases"])
+        for endpoint, breaker in self.breakers.items():
+            m.circuit_state.set(breaker.state, endpoint)
+            m.circuit_trips.set_total(breaker.trips, endpoint)
+        m.connections.set_total(self.http_stats["connections_created"], "created")
+        m.connections.set_total(self.http_stats["connections_reused"], "reused")
+        m.state_resident.set(len(self.states.hot))
+        m.state_bytes.set(self.states.nbytes)
+        m.state_loads.set_total(self.states.stats["loads_mmap"], "mmap")
+        m.state_loads.set_total(self.states.stats["loads_db"], "db")
+        m.state_evictions.set_total(self.states.stats["evictions"])
+        m.profiles_cached.set(len(self.profiles))
+        m.profile_cache_bytes.set(self.profiles.nbytes)
+        m.profile_cache_requests.set_total(self.profiles.stats["hits"], "hit")
+        m.profile_cache_requests.set_total(self.profiles.stats["misses"], "miss")
+        m.profile_lookups.set_total(self.profile_stats["found"], "found")
+        m.profile_lookups.set_total(self.profile_stats["not_found"], "not_found")
+        m.profiles_evicted.set_total(self.profile_stats["evicted"])
+        for phase, (seconds, count) in self.tracer.cumulative.items():
+            m.phase_seconds.set_total(seconds, phase)
+            m.phase_spans.set_total(count, phase)
+
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        await self._collect_metrics()
+        return web.Response(text=self.metrics.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    def liveness(self) -> tuple[bool, str]:
+        """Цикл проверки жив: проверки продвигаются, пробуждение не опоздало, нет серии ошибок"""
+        now = time.time()
+        if not self._loop_running:
+            return False, "цикл проверки не запущен"
+        if self._delivery_task is None or self._delivery_task.done():
+            return False, "отправка уведомлений остановлена"
+        if self._tick_started is not None and now - self._progress_at > HEALTH_MAX_STALL:
+            return False, f"проверки идут, но {now - self._progress_at:.0f} секунд нет продвижения"
+        if self._tick_started is None and now > self._wake_at + HEALTH_GRACE:
+            return False, f"цикл не проснулся вовремя (опоздание {now - self._wake_at:.0f} секунд)"
+        if self._loop_failures >= LOOP_MAX_FAILURES:
+            return False, f"{self._loop_failures} неудачных проходов цикла подряд"
+        return True, "ok"
+
+    def readiness(self) -> tuple[bool, str]:
+        """Реплика готова: цикл жив и недавно была хотя бы одна успешная проверка"""
+        live, reason = self.liveness()
+        if not live:
+            return live, reason
+        if not self.owned:
+            return True, "ok (нет аккаунтов)"
+        if not self.last_success:
+            return False, "ещё нет успешных проверок"
+        age = time.time() - max(self.last_success.values())
+        if age > HEALTH_MAX_STALENESS:
+            return False, f"последняя успешная проверка {age:.0f} секунд назад"
+        return True, "ok"
+
+    @staticmethod
+    def _health_response(state: tuple[bool, str]) -> web.Response:
+        ok, reason = state
+        return web.json_response({"status": "ok" if ok else "fail", "reason": reason},
+                                 status=200 if ok else 503,
+                                 dumps=lambda data: json.dumps(data, ensure_ascii=False))
+
+    async def _handle_live(self, request: web.Request) -> web.Response:
+        return self._health_response(self.liveness())
+
+    async def _handle_ready(self, request: web.Request) -> web.Response:
+        return self._health_response(self.readiness())
 
     # ───────────────────────────────────────────────
     # Smule API
     # ───────────────────────────────────────────────
     async def _get_followers_page(self, session: aiohttp.ClientSession,
                                   account_id: str, offset: int = 0, limit: int = 20) -> dict | None:
-        url = "https://www.smule.com/api/profile/followers"
+        url = SMULE_API_URL
         params = {"accountId": account_id, "offset": offset, "limit": limit}
+        cache = self.page_cache
+        cached = cache.get(account_id, offset, limit) if cache else None
+        headers = self.headers
+        if cached:
+            etag, last_modified = cached[0], cached[1]
+            headers = dict(headers)
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
 
-        try:
-            async with session.get(url, params=params, headers=self.headers) as resp:
-                if resp.status == 200:
-                    return await resp.json()
-                text = await resp.text()
-                logger.error(f"HTTP {resp.status} {url} {params} → {text[:300]}")
+        async with self._smule_call(url) as call:
+            try:
+                self.account_requests[account_id] = self.account_requests.get(account_id, 0) + 1
+                with self.tracer.span("smule.request", account=account_id, offset=offset, limit=limit) as span:
+                    async with session.get(url, params=params, headers=headers) as resp:
+                        span.set(status=resp.status)
+                        self._session_errors = 0
+                        self.metrics.requests.inc(str(resp.status))
+                        if cache:
+                            cache.stats["requests"] += 1
+                        if resp.status == 304 and cached:
+                            call.outcome = OK
+                            self.metrics.request_duration.observe(time.monotonic() - call.started)
+                            self.metrics.pages.inc(account_id)
+                            cache.stats["not_modified"] += 1
+                            cache.stats["bytes_avoided"] += cached[3]
+                            cache.stage(account_id, offset, limit, cached)
+                            return {"list": CachedPage(cached[4])}
+                        if resp.status == 200:
+                            body = await resp.read()
+                            call.outcome = OK
+                            self.metrics.request_duration.observe(time.monotonic() - call.started)
+                            self.metrics.pages.inc(account_id)
+                            self.metrics.bytes.inc(account_id, amount=len(body))
+                            if not cache:
+                                with self.tracer.span("decode", account=account_id, bytes=len(body)):
+                                    data = self._decode_json(body)
+                                self._remember_total(account_id, data)
+                                return data
+                            with self.tracer.span("decode", account=account_id, bytes=len(body)):
+                                return self._decode_page(resp, body, account_id, offset, limit, cached)
+                        call.classify(resp)
+                        text = await resp.text()
+                        logger.error(f"HTTP {resp.status} {url} {params} → {text[:300]}")
+                        return None
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                call.outcome = FAILED
+                self._session_errors += 1
+                self.metrics.requests.inc("error")
+                logger.error(f"Ошибка сети ({account_id}): {e!r}")
                 return None
-        except Exception as e:
-            logger.error(f"Ошибка сети ({account_id}): {e}")
-            return None
+            except Exception as e:
+                if call.outcome is None:
+                    call.outcome = NEUTRAL
+                logger.error(f"Ошибка сети ({account_id}): {e}")
+                return None
+
+    async def _fetch_profiles(self, session: aiohttp.ClientSession,
+                              follower_ids: list[str]) -> dict[str, dict] | None:
+        """Профили пакета подписчиков из SMULE_PROFILE_API_URL: {ID: профиль} или None при ошибке.
+
+        Ответ разбирается так же, как страница подписчиков: профили в "list".
+        """
+        url = SMULE_PROFILE_API_URL
+        params = {"accountIds": ",".join(follower_ids)}
+        async with self._smule_call(url) as call:
+            try:
+                with self.tracer.span("smule.profiles", profiles=len(follower_ids)) as span:
+                    async with session.get(url, params=params, headers=self.headers) as resp:
+                        span.set(status=resp.status)
+                        self._session_errors = 0
+                        self.metrics.requests.inc(str(resp.status))
+                        if resp.status != 200:
+                            call.classify(resp)
+                            text = await resp.text()
+                            logger.error(f"HTTP {resp.status} {url} ({len(follower_ids)} профилей) → {text[:300]}")
+                            return None
+                        body = await resp.read()
+                        call.outcome = OK
+                        with self.tracer.span("decode", bytes=len(body)):
+                            data = self._decode_json(body)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                call.outcome = FAILED
+                self._session_errors += 1
+                self.metrics.requests.inc("error")
+                logger.error(f"Ошибка сети при загрузке профилей: {e!r}")
+                return None
+            except Exception as e:
+                if call.outcome is None:
+                    call.outcome = NEUTRAL
+                logger.error(f"Ошибка загрузки профилей: {e}")
+                return None
+        batch = data.get("list") if isinstance(data, dict) else None
+        return {info["account_id"]: info for info in batch or () if info["account_id"].isdigit()}
+
+    @asynccontextmanager
+    async def _smule_call(self, url: str) -> AsyncIterator[SmuleCall]:
+        """Место для запроса к Smule.
+
+        Проверяет автомат эндпоинта (CircuitOpenError, если он отключён),
+        ждёт окна контроллера и темпа хоста. Исход, записанный в SmuleCall,
+        после запроса передаётся контроллеру и автомату.
+        """
+        endpoint = urlsplit(url).path
+        breaker = self.breakers.get(endpoint)
+        if breaker is None:
+            breaker = self.breakers[endpoint] = CircuitBreaker(
+                endpoint, SMULE_BREAKER_FAILURES, SMULE_BREAKER_RESET, SMULE_BREAKER_RESET_MAX)
+        breaker.before_request(time.monotonic())
+        call = SmuleCall()
+        try:
+            granted = await self.smule_flow.acquire()
+        except BaseException:
+            breaker.abandon()
+            raise
+        try:
+            await self.host_pacer.wait(urlsplit(url).netloc)
+            call.started = time.monotonic()
+            yield call
+        finally:
+            now = time.monotonic()
+            outcome = call.outcome
+            if outcome is not None:
+                self._progress_at = time.time()
+            latency = now - call.started if outcome == OK else 0.0
+            self.smule_flow.release(outcome or NEUTRAL, latency, call.retry_after, granted=granted)
+            self.host_pacer.set_rate(self.smule_flow.rate)
+            if outcome is None or outcome == THROTTLED:
+                # 429/503 — сигнал темпа для контроллера, а не отказ эндпоинта
+                breaker.abandon()
+            else:
+                breaker.record(outcome != FAILED, now)
+
+    def _decode_page(self, resp: aiohttp.ClientResponse, body: bytes, account_id: str,
+                     offset: int, limit: int, cached: tuple | None) -> dict:
+        """Разбор страницы с учётом кэша: тело с прежним хэшем не декодируется"""
+        cache = self.page_cache
+        cache.stats["bytes_downloaded"] += len(body)
+        digest = hashlib.sha1(body).digest()
+        if cached and cached[2] == digest:
+            cache.stats["unchanged_body"] += 1
+            cache.stage(account_id, offset, limit, cached)
+            return {"list": CachedPage(cached[4])}
+
+        data = self._decode_json(body)
+        self._remember_total(account_id, data)
+        batch = data.get("list") if isinstance(data, dict) else None
+        if batch:
+            ids = [f["account_id"] for f in batch]
+            if all(fid.isdigit() for fid in ids):
+                entry = (resp.headers.get("ETag"), resp.headers.get("Last-Modified"), digest, len(body),
+                         array("Q", map(int, ids)))
+                cache.stage(account_id, offset, limit, entry)
+        return data
+
+    def _remember_total(self, account_id: str, data) -> None:
+        if not isinstance(data, dict):
+            return
+        for key in TOTAL_COUNT_KEYS:
+            value = data.get(key)
+            if isinstance(value, int) and not isinstance(value, bool):
+                self.reported_totals[account_id] = value
+                return
 
-    async def _get_all_followers(self, session: aiohttp.ClientSession, account_id: str) -> list[dict]:
-        all_followers: list[dict] = []
-        offset, limit = 0, 20
+    async def _fetch_page(self, session: aiohttp.ClientSession, account_id: str,
+                          offset: int, limit: int) -> list[dict] | None:
+        """Загрузка одной страницы с повторами.
+
+        Возвращает None, если API несколько раз подряд отдал пустой ответ,
+        и выбрасывает исключение после нескольких ошибок подряд.
+        """
         consecutive_errors = 0
         max_consecutive_errors = 3
 
@@ -189,58 +1070,158 @@ class SmuleFollowersBot:
                     consecutive_errors += 1
                     if consecutive_errors >= max_consecutive_errors:
                         logger.error(f"Слишком много ошибок подряд для аккаунта {account_id}, прерываем загрузку")
-                        break
-                    await asyncio.sleep(2.0)  # Увеличиваем задержку при ошибках
+                        return None
+                    await asyncio.sleep(jittered_backoff(consecutive_errors - 1, SMULE_RETRY_BASE, SMULE_RETRY_MAX))
                     continue
+                return data["list"] or []
 
-                consecutive_errors = 0  # Сбрасываем счетчик ошибок при успехе
-                batch = data["list"] or []
-                
-                if not batch:
-                    logger.info(f"Получен пустой список подписчиков для аккаунта {account_id}")
-                    break
-                
-                all_followers.extend(batch)
-                logger.debug(f"Загружено {len(batch)} подписчиков для аккаунта {account_id}, всего: {len(all_followers)}")
-                
-                if len(batch) < limit:
-                    logger.info(f"Завершена загрузка подписчиков для аккаунта {account_id}, всего: {len(all_followers)}")
-                    break
-
-                offset += limit
-                await asyncio.sleep(0.5)
-                
+            except CircuitOpenError:
+                # Эндпоинт отключён: повторять страницу бессмысленно
+                raise
             except Exception as e:
                 consecutive_errors += 1
                 logger.error(f"Ошибка при загрузке страницы {offset} для аккаунта {account_id}: {e}")
-                
+
                 if consecutive_errors >= max_consecutive_errors:
                     logger.error(f"Слишком много ошибок подряд для аккаунта {account_id}, прерываем загрузку")
                     raise Exception(f"Не удалось загрузить данные для аккаунта {account_id} после {consecutive_errors} ошибок")
-                
-                # Увеличиваем задержку при ошибках
-                wait_time = min(2.0 * consecutive_errors, 10.0)
-                logger.info(f"Ожидание {wait_time} секунд перед повтором")
+
+                wait_time = jittered_backoff(consecutive_errors - 1, SMULE_RETRY_BASE, SMULE_RETRY_MAX)
+                logger.info(f"Ожидание {wait_time:.1f} секунд перед повтором")
                 await asyncio.sleep(wait_time)
 
-        if not all_followers:
+    async def _fetch_first_page(self, session: aiohttp.ClientSession,
+                                account_id: str) -> tuple[int, list[dict] | None]:
+        """Первая страница с пробой максимального размера страницы.
+
+        Пока размер не определён, пробуем кандидатов из SMULE_PAGE_SIZES по
+        убыванию: ошибка на большом limit означает, что API его не принимает.
+        Возвращает использованный limit и список подписчиков.
+        """
+        if self.page_size is not None:
+            return self.page_size, await self._fetch_page(session, account_id, 0, self.page_size)
+
+        for size in SMULE_PAGE_SIZES[:-1]:
+            data = await self._get_followers_page(session, account_id, 0, size)
+            if data and "list" in data:
+                batch = data["list"] or []
+                if len(batch) == size:
+                    self.page_size = size
+                    logger.info(f"Размер страницы Smule API: {size}")
+                return size, batch
+            logger.info(f"API не принял limit={size} для аккаунта {account_id}, пробуем меньше")
+
+        size = SMULE_PAGE_SIZES[-1]
+        batch = await self._fetch_page(session, account_id, 0, size)
+        if batch and len(batch) == size:
+            self.page_size = size
+            logger.info(f"Размер страницы Smule API: {size}")
+        return size, batch
+
+    async def _iter_followers(self, session: aiohttp.ClientSession, account_id: str,
+                              window: int = SMULE_FETCH_WINDOW, start: int = 0) -> AsyncIterator[list[dict]]:
+        """Постраничная загрузка подписчиков аккаунта.
+
+        После первой страницы следующие окна offset запрашиваются параллельно
+        (до window запросов в полёте), а страницы отдаются строго по порядку
+        по мере готовности. Загрузка заканчивается на первой неполной странице.
+        start — продолжение прерванной загрузки с этого offset (размер страницы
+        уже известен).
+        """
+        if start:
+            async with aclosing(self._iter_remaining(session, account_id, start, self.page_size, window)) as pages:
+                async for page in pages:
+                    yield page
+            logger.info(f"Завершена продолженная загрузка подписчиков для аккаунта {account_id}")
+            return
+
+        limit, batch = await self._fetch_first_page(session, account_id)
+        if not batch:
             raise Exception(f"Не удалось загрузить ни одного подписчика для аккаунта {account_id}")
-            
-        return all_followers
+        total = len(batch)
+        yield batch
+
+        if len(batch) < limit and self.page_size is None:
+            # Неполная первая страница: либо подписчиков мало, либо API урезал limit.
+            # Проверяем следующей страницей с фактическим размером.
+            limit = len(batch)
+            probe = await self._fetch_page(session, account_id, limit, limit)
+            if probe is None:
+                raise Exception(f"Не удалось загрузить страницу {limit} для аккаунта {account_id}: "
+                                f"список подписчиков неполный")
+            if probe:
+                self.page_size = limit
+                logger.info(f"Размер страницы Smule API: {limit}")
+                total += len(probe)
+                yield probe
+            batch = probe if probe and len(probe) == limit else None
+
+        if batch and len(batch) == limit:
+            async with aclosing(self._iter_remaining(session, account_id, total, limit, window)) as pages:
+                async for page in pages:
+                    total += len(page)
+                    logger.debug(f"Загружено {len(page)} подписчиков для аккаунта {account_id}, всего: {total}")
+                    yield page
+
+        logger.info(f"Завершена загрузка подписчиков для аккаунта {account_id}, всего: {total}")
+
+    async def _iter_remaining(self, session: aiohttp.ClientSession, account_id: str,
+                              offset: int, limit: int, window: int) -> AsyncIterator[list[dict]]:
+        """Параллельная загрузка страниц начиная с offset со скользящим окном"""
+        window = max(1, window)
+        pending: dict[int, asyncio.Task] = {}
+        next_offset = offset
+
+        try:
+            while True:
+                while len(pending) < window:
+                    pending[next_offset] = asyncio.create_task(
+                        self._fetch_page(session, account_id, next_offset, limit)
+                    )
+                    next_offset += limit
+
+                batch = await pending.pop(offset)
+                if batch is None:
+                    # Страница не загрузилась и после повторов: конец списка здесь
+                    # не известен, неполная загрузка не должна сойти за полную
+                    raise Exception(f"Не удалось загрузить страницу {offset} для аккаунта {account_id}: "
+                                    f"список подписчиков неполный")
+                if batch:
+                    yield batch
+                if len(batch) < limit:
+                    break
+                offset += limit
+        finally:
+            for task in pending.values():
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending.values(), return_exceptions=True)
 
     # ───────────────────────────────────────────────
     # Обработка и уведомления
     # ───────────────────────────────────────────────
     @staticmethod
-    def _extract_info(f: dict) -> dict:
-        return {
-            "account_id": str(f.get("account_id") or ""),
-            "handle": f.get("handle") or "Unknown",
-            "name": f.get("name") or f.get("handle") or "Unknown",
-            "pic_url": f.get("pic_url") or "",
-            "verified": bool(f.get("verified", False)),
-            "is_vip": bool(f.get("is_vip", False)),
-        }
+    def _extract_info(f: FollowerInfo) -> FollowerInfo:
+        """Подписчик из элемента страницы.
+
+        Разбор ответа (follower_decode) уже оставил только нужные поля
+        с подставленными значениями по умолчанию, поэтому копия не нужна.
+        """
+        return f
+
+    @staticmethod
+    def _unknown_profile(follower_id: int) -> dict:
+        """Заглушка для подписчика, профиль которого ещё не загружен"""
+        return {"account_id": str(follower_id), "handle": "", "name": "", "pic_url": "",
+                "verified": False, "is_vip": False}
+
+    @staticmethod
+    def _profile_lines(info: dict) -> list[str]:
+        """Имя и ник подписчика; без загруженного профиля — только ID"""
+        handle = info.get("handle")
+        if not handle:
+            return [f"🆔 ID: {info['account_id']} (профиль ещё не загружен)"]
+        return [f"👤 Имя: {info.get('name') or handle}", f"📝 Ник: @{handle}"]
 
     def _format_follow_message(self, info: dict, account_id: str) -> str:
         alias = ACCOUNT_ALIASES.get(account_id, account_id)
@@ -248,8 +1229,7 @@ class SmuleFollowersBot:
             "🎵 Новый подписчик!",
             "",
             f"📊 Аккаунт Smule: {alias}",
-            f"👤 Имя: {info['name']}",
-            f"📝 Ник: @{info['handle']}",
+            *self._profile_lines(info),
         ]
         if info["verified"]:
             lines.append("✅ Верифицированный аккаунт")
@@ -257,7 +1237,8 @@ class SmuleFollowersBot:
             lines.append("⭐ VIP аккаунт")
         if info["pic_url"]:
             lines.append(f"🖼 Аватар: {info['pic_url']}")
-        lines.append(f"🔗 Профиль: https://www.smule.com/{info['handle']}")
+        if info["handle"]:
+            lines.append(f"🔗 Профиль: https://www.smule.com/{info['handle']}")
         lines.append(f"🕐 Время: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         return "\n".join(lines)
 
@@ -267,22 +1248,241 @@ class SmuleFollowersBot:
             "❌ Подписчик отписался!",
             "",
             f"📊 Аккаунт Smule: {alias}",
-            f"👤 Имя: {info.get('name', 'Unknown')}",
-            f"📝 Ник: @{info.get('handle', 'Unknown')}",
-            f"🔗 Профиль: https://www.smule.com/{info.get('handle', 'Unknown')}",
-            f"🕐 Время: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+            *self._profile_lines(info),
         ]
+        if info.get("handle"):
+            lines.append(f"🔗 Профиль: https://www.smule.com/{info['handle']}")
+        lines.append(f"🕐 Время: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         return "\n".join(lines)
 
-    async def _send_text(self, text: str, max_retries: int = 5) -> bool:
+    def _format_digest(self, infos: list[dict], account_id: str, followed: bool) -> str:
+        """Сводка по аккаунту вместо отдельных сообщений о каждом событии"""
+        alias = ACCOUNT_ALIASES.get(account_id, account_id)
+        title = f"🎵 Новых подписчиков: {len(infos)}" if followed else f"❌ Отписались: {len(infos)}"
+        head = "\n".join([title, "", f"📊 Аккаунт Smule: {alias}", ""])
+        tail = f"🕐 Время: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+        # Запас под строку «… и ещё N»
+        budget = TELEGRAM_MAX_MESSAGE_LENGTH - len(head) - len(tail) - 32
+
+        lines: list[str] = []
+        for info in infos[:NOTIFY_DIGEST_MAX_ITEMS]:
+            handle = info.get("handle")
+            line = f"• {info.get('name') or handle} (@{handle})" if handle else f"• ID {info['account_id']}"
+            if len(line) + 1 > budget:
+                break
+            budget -= len(line) + 1
+            lines.append(line)
+        if len(infos) > len(lines):
+            lines.append(f"… и ещё {len(infos) - len(lines)}")
+        return head + "\n".join(lines) + "\n" + tail
+
+    @staticmethod
+    def _pack_messages(messages: list[str]) -> list[str]:
+        """Упаковка сообщений в минимальное число сообщений Telegram"""
+        separator = "\n\n"
+        packed: list[str] = []
+        current = ""
+        for message in messages:
+            message = message[:TELEGRAM_MAX_MESSAGE_LENGTH]
+            if current and len(current) + len(separator) + len(message) <= TELEGRAM_MAX_MESSAGE_LENGTH:
+                current += separator + message
+                continue
+            if current:
+                packed.append(current)
+            current = message
+        if current:
+            packed.append(current)
+        return packed
+
+    def _build_notifications(self, infos: list[dict], account_id: str, followed: bool) -> list[str]:
+        """Сообщения о подписках или отписках аккаунта"""
+        if not infos:
+            return []
+        if len(infos) > NOTIFY_DIGEST_THRESHOLD:
+            return [self._format_digest(infos, account_id, followed)]
+        fmt = self._format_follow_message if followed else self._format_unfollow_message
+        return self._pack_messages([fmt(info, account_id) for info in infos])
+
+    def _keyed_notifications(self, infos: list[dict], account_id: str,
+                             followed: bool) -> list[tuple[str, str, str]]:
+        """Уведомления для очереди: (ключ дедупликации, чат, текст).
+
+        Ключ зависит от аккаунта, типа события и набора подписчиков; версию
+        набора к нему добавляет FollowerStore.apply_changes. Повторная запись
+        того же изменения не создаёт второе уведомление, а повторная подписка
+        после отписки — создаёт.
+        """
+        texts = self._build_notifications(infos, account_id, followed)
+        if not texts:
+            return []
+        kind = "follow" if followed else "unfollow"
+        digest = hashlib.sha1(",".join(info["account_id"] for info in infos).encode()).hexdigest()[:16]
+        return [(f"{account_id}:{kind}:{digest}:{i}", self.chat_id, text) for i, text in enumerate(texts)]
+
+    # ───────────────────────────────────────────────
+    # Профили подписчиков
+    # ───────────────────────────────────────────────
+    async def _known_profiles(self, follower_ids: list[int]) -> list[dict]:
+        """Профили для уведомлений без обращения к сети: из кэша, затем из базы.
+
+        Отсутствующие и ещё не загруженные (пустые) заменяются заглушкой
+        с ID и ставятся в очередь фоновой загрузки (см. _profile_worker).
+        """
+        infos = {fid: self.profiles.get(fid) for fid in follower_ids}
+        missing = [str(fid) for fid, info in infos.items() if info is None]
+        if missing:
+            stored = await asyncio.to_thread(self.store.get_profiles, missing)
+            self.profiles.warm(stored)
+            for fid in missing:
+                infos[int(fid)] = stored.get(fid) or self._unknown_profile(int(fid))
+        for fid, info in infos.items():
+            if not info["handle"]:
+                self.profiles.want(fid)
+        return [infos[fid] for fid in follower_ids]
+
+    def start_profile_refresh(self) -> None:
+        """Запуск фонового обслуживания профилей, если оно ещё не запущено"""
+        if self._profile_task is None or self._profile_task.done():
+            self._profile_task = asyncio.create_task(self._profile_worker())
+
+    async def _profile_worker(self) -> None:
+        """Удаление ненужных профилей и загрузка недостающих раз в PROFILE_REFRESH_INTERVAL.
+
+        Уведомления берут профили только из кэша и базы и никогда не ждут
+        сети: эта задача заранее дополняет то, чего там нет, с тем же
+        ограничением нагрузки, что и загрузка подписчиков.
+        """
+        while True:
+            await asyncio.sleep(PROFILE_REFRESH_INTERVAL)
+            try:
+                with self.tracer.span("profiles.refresh") as span:
+                    evicted = await asyncio.to_thread(self.store.evict_profiles,
+                                                      time.time() - FOLLOWER_META_RETENTION)
+                    self.profile_stats["evicted"] += evicted
+                    span.set(evicted=evicted)
+                    if SMULE_PROFILE_API_URL:
+                        span.set(found=await self._refresh_profiles())
+            except CircuitOpenError as e:
+                logger.warning(f"Загрузка профилей отложена: {e}")
+            except Exception as e:
+                logger.error(f"Ошибка обновления профилей подписчиков: {e}")
+
+    async def _refresh_profiles(self) -> int:
+        """Загрузка пакетами нужных для уведомлений, затем недостающих и устаревших профилей.
+
+        Возвращает число загруженных профилей. ID, которых API не вернул,
+        повторно запрашиваются не раньше чем через PROFILE_TTL.
+        """
+        now = time.time()
+        self._profiles_not_found = {fid: at for fid, at in self._profiles_not_found.items() if at > now - PROFILE_TTL}
+        wanted = [fid for fid in map(str, self.profiles.wanted) if fid not in self._profiles_not_found]
+        wanted = wanted[:PROFILE_REFRESH_MAX]
+        if len(wanted) < PROFILE_REFRESH_MAX and self.owned:
+            stale = await asyncio.to_thread(self.store.missing_profiles, sorted(self.owned), now - PROFILE_TTL,
+                                            PROFILE_REFRESH_MAX + len(self._profiles_not_found))
+            queued = set(wanted)
+            wanted += [fid for fid in stale if fid not in queued and fid not in self._profiles_not_found]
+            wanted = wanted[:PROFILE_REFRESH_MAX]
+        if not wanted:
+            return 0
+
+        found = 0
+        for i in range(0, len(wanted), PROFILE_BATCH_SIZE):
+            # Сессию создаёт и пересоздаёт только цикл проверки, между проходами;
+            # фоновая задача берёт текущую и никогда её не закрывает
+            session = self._session
+            if session is None or session.closed:
+                logger.info("HTTP-сессия не готова, загрузка профилей отложена до следующего раза")
+                break
+            batch = wanted[i:i + PROFILE_BATCH_SIZE]
+            self.profile_stats["requested"] += len(batch)
+            profiles = await self._fetch_profiles(session, batch)
+            if profiles is None:
+                continue
+            if profiles:
+                await asyncio.to_thread(self.store.save_profiles, profiles)
+            now = time.time()
+            for fid in batch:
+                info = profiles.get(fid)
+                if info is not None:
+                    self.profiles.update(int(fid), info, now)
+                else:
+                    self._profiles_not_found[fid] = now
+                self.profiles.wanted.discard(int(fid))
+            found += len(profiles)
+            self.profile_stats["found"] += len(profiles)
+            self.profile_stats["not_found"] += len(batch) - len(profiles)
+        if found:
+            logger.info(f"Загружено профилей подписчиков: {found} из {len(wanted)}")
+        return found
+
+    # ───────────────────────────────────────────────
+    # Очередь уведомлений
+    # ───────────────────────────────────────────────
+    async def _notify(self, text: str, dedup_key: str | None = None) -> None:
+        """Постановка уведомления в очередь; отправляет его фоновый воркер"""
+        if not self.notify:
+            return
+        key = dedup_key or f"msg:{uuid.uuid4().hex}"
+        try:
+            await asyncio.to_thread(self.store.enqueue, [(key, self.chat_id, text)])
+        except Exception as e:
+            logger.error(f"Ошибка постановки уведомления в очередь: {e}")
+            return
+        self._outbox_event.set()
+
+    def start_delivery(self) -> None:
+        """Запуск фоновой отправки уведомлений, если она ещё не запущена"""
+        if self._delivery_task is None or self._delivery_task.done():
+            self._delivery_task = asyncio.create_task(self._delivery_worker())
+
+    async def _delivery_worker(self) -> None:
+        """Отправка уведомлений из очереди (доставка «хотя бы один раз»).
+
+        Работает независимо от опроса Smule: ожидание лимитов Telegram
+        не задерживает проверку аккаунтов. Уведомление удаляется из очереди
+        только после успешной отправки, неудачные откладываются с растущей паузой.
+        """
+        while True:
+            try:
+                self._outbox_event.clear()
+                due = await asyncio.to_thread(self.store.due_notifications, time.time(), 50,
+                                              OUTBOX_CLAIM_TTL if SHARDING else 0.0)
+                for notification_id, chat_id, text, attempts in due:
+                    if await self._send_text(text, chat_id=chat_id):
+                        await asyncio.to_thread(self.store.mark_sent, notification_id, OUTBOX_DEDUP_TTL)
+                    else:
+                        delay = min(60 * 2 ** attempts, OUTBOX_RETRY_MAX)
+                        logger.warning(f"Уведомление {notification_id} отложено на {delay:.0f} секунд")
+                        await asyncio.to_thread(self.store.reschedule, notification_id, time.time() + delay)
+                if due:
+                    continue
+
+                next_time = await asyncio.to_thread(self.store.next_notification_time)
+                timeout = OUTBOX_IDLE_WAIT
+                if next_time is not None:
+                    timeout = max(0.0, min(next_time - time.time(), OUTBOX_IDLE_WAIT))
+                try:
+                    await asyncio.wait_for(self._outbox_event.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка отправки уведомлений из очереди: {e}")
+                await asyncio.sleep(5)
+
+    async def _send_text(self, text: str, max_retries: int = 5, chat_id: str | None = None) -> bool:
         """Отправка текстового сообщения с улучшенной обработкой ошибок и rate limiting"""
         
         for attempt in range(max_retries):
             try:
                 # Применяем rate limiting перед каждой попыткой
-                await self.rate_limiter.wait_if_needed()
-                
-                await self.bot.send_message(chat_id=self.chat_id, text=text)
+                with self.tracer.span("telegram.wait"):
+                    await self.rate_limiter.wait_if_needed(chat_id or self.chat_id)
+
+                with self.tracer.span("telegram.send", attempt=attempt + 1, length=len(text)):
+                    await self.bot.send_message(chat_id=chat_id or self.chat_id, text=text)
                 logger.info("Уведомление отправлено в Telegram")
                 return True
                 
@@ -311,175 +1511,589 @@ class SmuleFollowersBot:
         logger.error(f"Не удалось отправить сообщение после {max_retries} попыток")
         return False
 
-    async def _send_batch_messages(self, messages: list[str]) -> None:
-        """Отправка пакета сообщений с контролем скорости"""
-        if not messages:
-            return
-            
-        logger.info(f"Отправка пакета из {len(messages)} сообщений")
-        
-        for i, message in enumerate(messages):
-            success = await self._send_text(message)
-            if not success:
-                logger.warning(f"Не удалось отправить сообщение {i + 1}/{len(messages)}")
-            
-            # Дополнительная задержка между сообщениями в пакете
-            if i < len(messages) - 1:
-                await asyncio.sleep(0.5)
-
-    async def _check_account_with_retry(self, session: aiohttp.ClientSession, account_id: str, max_retries: int = 3) -> tuple[int, int]:
-        """Проверка аккаунта с повторными попытками при ошибках"""
+    async def _check_account_with_retry(self, session: aiohttp.ClientSession, account_id: str,
+                                        max_retries: int = 3) -> tuple[int, int] | None:
+        """Проверка аккаунта с повторными попытками при ошибках.
+
+        Пауза между попытками выдерживается вне семафора, поэтому проблемный
+        аккаунт не занимает слот и не задерживает проверку остальных.
+        Если все попытки неудачны, аккаунт откладывается на следующие циклы
+        с экспоненциально растущей паузой. Возвращает None при неудаче.
+        """
         for attempt in range(max_retries):
             try:
-                return await self._check_account(session, account_id)
+                async with self.account_semaphore:
+                    started = time.monotonic()
+                    with self.tracer.span("account.check", account=account_id, attempt=attempt + 1) as span:
+                        await self.states.acquire(account_id)
+                        try:
+                            result = await self._check_account(session, account_id)
+                        finally:
+                            await self.states.release(account_id)
+                        span.set(follows=result[0], unfollows=result[1])
+                    self.metrics.check_duration.observe(time.monotonic() - started, account_id)
+                self.last_success[account_id] = time.time()
+                self.metrics.events.inc(account_id, "follow", amount=result[0])
+                self.metrics.events.inc(account_id, "unfollow", amount=result[1])
+                if self.account_backoff.pop(account_id, None):
+                    logger.info(f"Аккаунт {account_id} снова проверяется успешно")
+                return result
+            except LeaseLostError as e:
+                # Аккаунт уже проверяет другая реплика: её уведомления не дублируем
+                logger.warning(f"{e}, аккаунт передан другой реплике")
+                self._drop_account(account_id)
+                return None
+            except CircuitOpenError as e:
+                # Smule недоступен целиком: аккаунт не виноват, попытки и
+                # уведомление об ошибке не тратим, повторяем, когда эндпоинт
+                # снова примет запрос (в HALF_OPEN — примерно через секунду)
+                self.account_deferred[account_id] = time.time() + e.retry_in
+                logger.warning(f"Проверка аккаунта {account_id} отложена: {e}")
+                return None
             except Exception as e:
+                self.metrics.check_errors.inc(account_id)
                 logger.error(f"Ошибка при проверке аккаунта {account_id} (попытка {attempt + 1}/{max_retries}): {e}")
                 if attempt < max_retries - 1:
-                    wait_time = 5 * 60  # 5 минут
-                    logger.info(f"Повторная попытка через {wait_time} секунд")
+                    wait_time = jittered_backoff(attempt, ACCOUNT_RETRY_DELAY, ACCOUNT_BACKOFF_BASE)
+                    logger.info(f"Повторная попытка для аккаунта {account_id} через {wait_time:.0f} секунд")
                     await asyncio.sleep(wait_time)
                 else:
-                    logger.error(f"Не удалось проверить аккаунт {account_id} после {max_retries} попыток")
+                    failures = self.account_backoff.get(account_id, (0, 0.0))[0] + 1
+                    backoff = jittered_backoff(failures - 1, ACCOUNT_BACKOFF_BASE, ACCOUNT_BACKOFF_MAX)
+                    self.account_backoff[account_id] = (failures, time.time() + backoff)
+                    logger.error(f"Не удалось проверить аккаунт {account_id} после {max_retries} попыток, "
+                                 f"следующая попытка через {backoff:.0f} секунд")
                     # Отправляем уведомление об ошибке
                     error_msg = f"❌ Ошибка при проверке аккаунта {ACCOUNT_ALIASES.get(account_id, account_id)}: {str(e)[:200]}"
-                    await self._send_text(error_msg)
-                    return (0, 0)
+                    await self._notify(error_msg)
         
-        return (0, 0)
+        return None
 
-    async def _check_account(self, session: aiohttp.ClientSession, account_id: str) -> tuple[int, int]:
-        followers = await self._get_all_followers(session, account_id)
-        if not followers:
+    def _is_account_due(self, account_id: str, now: float) -> bool:
+        """Аккаунт не находится в отложенном режиме после серии ошибок или отключения эндпоинта"""
+        _, retry_at = self.account_backoff.get(account_id, (0, 0.0))
+        return max(retry_at, self.account_deferred.get(account_id, 0.0)) <= now
+
+    def _needs_full_sync(self, account_id: str) -> bool:
+        """Нужна ли полная сверка списка подписчиков в этом цикле"""
+        if not INCREMENTAL_SYNC or not self.states[account_id].known:
+            return True
+        if account_id not in self.sync_state:
+            # Первая проверка после запуска: за время простоя могли быть отписки
+            return True
+        cycles, last_full = self.sync_state[account_id]
+        return cycles >= FULL_SYNC_EVERY or time.time() - last_full >= FULL_SYNC_INTERVAL
+
+    async def _scan_account(self, session: aiohttp.ClientSession, account_id: str,
+                            incremental: bool) -> tuple[FollowerIdSet, list[dict], dict[str, dict], bool] | None:
+        """Загрузка подписчиков с потоковым сравнением.
+
+        Сравнение с известными подписчиками идёт по мере загрузки страниц,
+        поэтому в памяти одновременно находятся только страница и набор ID.
+        В инкрементальном режиме загрузка останавливается после
+        INCREMENTAL_KNOWN_RUN известных подписчиков подряд.
+
+        Полная загрузка сохраняет контрольные точки и продолжает прерванную
+        (см. SCAN_CHECKPOINT_PAGES).
+
+        Возвращает (загруженные ID, новые подписчики, изменившиеся профили,
+        полный ли список) или None, если инкрементальный результат не прошёл проверку
+        или прерванную загрузку не удалось продолжить.
+        """
+        state = self.states[account_id]
+        known, profiles = state.known, self.profiles
+        current_ids = array("Q")
+        new_ids: set[int] = set()
+        new_followers: list[dict] = []
+        changed_profiles: dict[str, dict] = {}
+        known_run = 0
+        pages_seen = 0
+        complete = True
+        window = 1 if incremental else SMULE_FETCH_WINDOW
+        if self.page_cache:
+            self.page_cache.discard(account_id)
+
+        checkpointing = not incremental and SCAN_CHECKPOINT_PAGES > 0
+        start, anchors, started_at = 0, None, time.time()
+        if checkpointing:
+            checkpoint = await self._restore_checkpoint(account_id)
+            if checkpoint:
+                start, started_at, current_ids = checkpoint
+                anchors = set(current_ids[-CHECKPOINT_ANCHORS:])
+                # Новые подписчики, найденные до перезапуска: профили сохранены с точкой
+                fresh = [key for key in dict.fromkeys(current_ids) if key not in known]
+                new_ids.update(fresh)
+                new_followers = await self._known_profiles(fresh)
+        api_offset = start
+        flushed = len(current_ids)
+
+        async with aclosing(self._iter_followers(session, account_id, window, start)) as pages:
+            async for page in pages:
+                pages_seen += 1
+                api_offset += len(page)
+                if anchors is not None:
+                    # Продолжение после перезапуска: пропускаем уже учтённое до последнего
+                    # сохранённого ID, который нашёлся в первых страницах
+                    hits = [i for i, f in enumerate(page)
+                            if f["account_id"].isdigit() and int(f["account_id"]) in anchors]
+                    if hits:
+                        page = page[hits[-1] + 1:]
+                        anchors = None
+                    elif pages_seen >= 2:
+                        break
+                    else:
+                        continue
+                if isinstance(page, CachedPage):
+                    # Страница не изменилась: все её подписчики уже учтены
+                    if not all(key in known for key in page.ids):
+                        logger.warning(f"Кэш страниц аккаунта {account_id} расходится с сохранёнными "
+                                       f"подписчиками, повторяем без кэша")
+                        self.page_cache.invalidate(account_id)
+                        return None
+                    current_ids.extend(page.ids)
+                    known_run += len(page)
+                    page = ()
+                # Профили, вытесненные из кэша, сравниваются с записью в базе, а не
+                # считаются изменёнными: иначе при кэше меньше числа подписчиков
+                # каждая полная сверка переписывала бы все профили
+                missing = [f["account_id"] for f in page
+                           if f["account_id"].isdigit() and int(f["account_id"]) not in profiles]
+                if missing:
+                    with self.tracer.span("store.profiles", account=account_id, profiles=len(missing)):
+                        profiles.warm(await asyncio.to_thread(self.store.get_profiles, missing))
+                with self.tracer.span("diff", account=account_id, followers=len(page)):
+                    seen_at = time.time()
+                    for f in page:
+                        info = self._extract_info(f)
+                        fid = info["account_id"]
+                        if not fid.isdigit():
+                            continue
+
+                        key = int(fid)
+                        current_ids.append(key)
+                        if profiles.update(key, info, seen_at):
+                            changed_profiles[fid] = info
+
+                        if key in known:
+                            known_run += 1
+                            continue
+                        if incremental and known_run:
+                            # Новый подписчик после уже известных: порядок «от новых
+                            # к старым» не соблюдается, инкрементальному результату верить нельзя
+                            logger.warning(f"Нарушен порядок подписчиков для аккаунта {account_id}, нужна полная сверка")
+                            return None
+                        if key not in new_ids:
+                            new_ids.add(key)
+                            new_followers.append(info)
+
+                if incremental and known_run >= INCREMENTAL_KNOWN_RUN:
+                    complete = False
+                    break
+                if incremental and pages_seen >= INCREMENTAL_MAX_PAGES:
+                    logger.info(f"Инкрементальная загрузка аккаунта {account_id} не нашла известных подписчиков "
+                                f"за {pages_seen} страниц, нужна полная сверка")
+                    return None
+                if checkpointing and pages_seen % SCAN_CHECKPOINT_PAGES == 0 and self.page_size:
+                    with self.tracer.span("checkpoint.save", account=account_id, offset=api_offset):
+                        await asyncio.to_thread(self.store.save_checkpoint, account_id, api_offset, self.page_size,
+                                                current_ids[flushed:], changed_profiles, started_at, self.replica)
+                    flushed = len(current_ids)
+                    changed_profiles = {}
+
+        if anchors is not None:
+            logger.warning(f"Не удалось продолжить загрузку аккаунта {account_id} с сохранённого места: "
+                           f"список подписчиков сильно изменился, загружаем заново")
+            await asyncio.to_thread(self.store.clear_checkpoint, account_id)
+            return None
+
+        if not current_ids:
             raise Exception(f"Не удалось получить список подписчиков для аккаунта {account_id}")
 
-        current_ids: set[str] = set()
-        current_map: dict[str, dict] = {}
-        new_followers_messages: list[str] = []
-        unfollow_messages: list[str] = []
+        if not complete:
+            # Проверка по общему числу подписчиков, если API его сообщает
+            total = self.reported_totals.get(account_id)
+            expected = len(known) + len(new_followers)
+            if total is not None and total != expected:
+                logger.warning(f"Число подписчиков аккаунта {account_id} не сходится "
+                               f"(API: {total}, ожидалось: {expected}), нужна полная сверка")
+                return None
+            logger.info(f"Инкрементальная проверка аккаунта {account_id}: {pages_seen} стр., "
+                        f"новых: {len(new_followers)}")
+
+        return FollowerIdSet.from_unsorted(current_ids), new_followers, changed_profiles, complete
+
+    async def _restore_checkpoint(self, account_id: str) -> tuple[int, float, array] | None:
+        """Прогресс прерванной полной загрузки: (offset продолжения, начало загрузки, загруженные ID)"""
+        checkpoint = await asyncio.to_thread(self.store.load_checkpoint, account_id)
+        if checkpoint is None:
+            return None
+        next_offset, page_size, started_at, ids = checkpoint
+        if not ids or time.time() - started_at > SCAN_CHECKPOINT_MAX_AGE:
+            logger.info(f"Контрольная точка загрузки аккаунта {account_id} устарела, загружаем заново")
+            await asyncio.to_thread(self.store.clear_checkpoint, account_id)
+            return None
+        if self.page_size is None:
+            self.page_size = page_size
+        if self.page_cache:
+            # Выравнивание по сохранённым ID требует полных страниц, а не ответов 304
+            self.page_cache.invalidate(account_id)
+        # Перекрытие на страницу: за время простоя список мог сдвинуться
+        start = max(next_offset - self.page_size, 0)
+        logger.info(f"Продолжаем загрузку аккаунта {account_id} с offset {start}: "
+                    f"сохранено {len(ids)} подписчиков")
+        return start, started_at, ids
+
+    async def _check_account(self, session: aiohttp.ClientSession, account_id: str) -> tuple[int, int]:
+        known = self.states[account_id].known
+        unfollowed_ids: list[int] = []
 
         # Обрабатываем новых подписчиков
-        for f in followers:
-            info = self._extract_info(f)
-            fid = info["account_id"]
-            if not fid:
-                continue
+        result = None
+        if not self._needs_full_sync(account_id):
+            result = await self._scan_account(session, account_id, incremental=True)
+        # Полный проход возвращает None, сбросив кэш страниц или контрольную
+        # точку, поэтому каждый следующий идёт без того, что ему помешало
+        for _ in range(FULL_SCAN_ATTEMPTS):
+            if result is not None:
+                break
+            result = await self._scan_account(session, account_id, incremental=False)
+        if result is None:
+            raise Exception(f"Не удалось согласованно загрузить подписчиков аккаунта {account_id} "
+                            f"за {FULL_SCAN_ATTEMPTS} полных прохода")
+        current_ids, new_followers, changed_profiles, complete = result
 
-            current_ids.add(fid)
-            current_map[fid] = info
+        unfollowed: list[dict] = []
 
-            self.followers_meta.setdefault(account_id, {})
-            self.followers_meta[account_id][fid] = info
+        # Обрабатываем отписавшихся (только по полному списку)
+        if complete:
+            with self.tracer.span("diff", account=account_id, known=len(known), current=len(current_ids)):
+                unfollowed_ids = known.difference(current_ids)
+            if unfollowed_ids and self.notify:
+                unfollowed = await self._known_profiles(unfollowed_ids)
 
-            if fid not in self.known_followers[account_id]:
-                msg = self._format_follow_message(info, account_id)
-                new_followers_messages.append(msg)
+        notifications = []
+        if self.notify:
+            notifications = (self._keyed_notifications(new_followers, account_id, followed=True)
+                             + self._keyed_notifications(unfollowed, account_id, followed=False))
 
-        # Обрабатываем отписавшихся
-        unfollowed_ids = self.known_followers[account_id] - current_ids
+        # Сохраняем данные вместе с уведомлениями, затем обновляем состояние в памяти
+        now = time.time()
+        added = [info["account_id"] for info in new_followers]
+        version = await self._save_changes(account_id, added, [str(fid) for fid in unfollowed_ids],
+                                           changed_profiles, notifications)
+        if self.page_cache:
+            self.page_cache.commit(account_id, complete)
 
-        for fid in sorted(unfollowed_ids):
-            info = self.followers_meta.get(account_id, {}).get(fid, {
-                "account_id": fid, "handle": fid, "name": fid
-            })
-            msg = self._format_unfollow_message(info, account_id)
-            unfollow_messages.append(msg)
+        if complete:
+            self.states.update(account_id, current_ids, version)
+            self.sync_state[account_id] = (0, now)
+        else:
+            self.states.update(account_id, known.union(current_ids), version)
+            cycles, last_full = self.sync_state[account_id]
+            self.sync_state[account_id] = (cycles + 1, last_full)
 
-        # Отправляем сообщения пакетами
-        await self._send_batch_messages(new_followers_messages)
-        await self._send_batch_messages(unfollow_messages)
+        return (len(new_followers), len(unfollowed_ids))
 
-        # Сохраняем данные
-        self.known_followers[account_id] = current_ids
-        self._save_followers_set(account_id)
-        self._save_followers_meta(account_id)
+    async def check_new_followers(self) -> int:
+        """Однократная проверка всех аккаунтов этой реплики, кроме отложенных после ошибок.
 
-        return (len(new_followers_messages), len(unfollow_messages))
+        Возвращает число проверенных аккаунтов. Непрерывный режим проверяет
+        аккаунты по срокам планировщика (см. run_continuous).
+        """
+        session = await self._get_session()
+        accounts = await self._refresh_ownership()
+        now = time.time()
+        self.scheduler.sync(accounts, now)
+        due_accounts = [a for a in accounts if self._is_account_due(a, now)]
+        if len(due_accounts) < len(accounts):
+            logger.info(f"Отложено после ошибок: {len(accounts) - len(due_accounts)} аккаунтов")
+        logger.info(f"Проверяем {len(due_accounts)} из {len(accounts)} аккаунтов, параллельно до {ACCOUNT_CONCURRENCY}")
+        if self.page_cache:
+            self.page_cache.reset_stats()
 
-    async def check_new_followers(self) -> None:
-        async with self._build_session() as session:
-            total_new = 0
-            total_left = 0
-            successful_checks = 0
+        results = await asyncio.gather(
+            *(self._check_account_with_retry(session, account_id) for account_id in due_accounts),
+            return_exceptions=True,
+        )
+        self._reschedule(due_accounts, results)
+        await self._report(due_accounts, results)
+        return len(due_accounts)
 
-            for idx, account_id in enumerate(self.account_ids):
-                try:
-                    logger.info(f"Проверяем аккаунт {account_id} ({idx + 1}/{len(self.account_ids)})")
-                    new_count, left_count = await self._check_account_with_retry(session, account_id)
-                    total_new += new_count
-                    total_left += left_count
-                    successful_checks += 1
-                    
-                    if idx < len(self.account_ids) - 1:
-                        await asyncio.sleep(2.0)  # Увеличенная пауза между аккаунтами
-                        
-                except Exception as e:
-                    logger.error(f"Критическая ошибка при проверке аккаунта {account_id}: {e}")
-                    error_msg = f"❌ Критическая ошибка при проверке аккаунта {ACCOUNT_ALIASES.get(account_id, account_id)}: {str(e)[:200]}"
-                    await self._send_text(error_msg)
-
-            # Отправляем сводку только если есть изменения или если все проверки прошли успешно
-            if total_new or total_left or successful_checks == len(self.account_ids):
-                parts = []
-                if total_new:
-                    parts.append(f"🔔 Новых: {total_new}")
-                if total_left:
-                    parts.append(f"❌ Отписок: {total_left}")
-                if successful_checks < len(self.account_ids):
-                    parts.append(f"⚠️ Проверено: {successful_checks}/{len(self.account_ids)}")
-                
-                if parts:
-                    summary = f"📊 Сводка: " + ", ".join(parts)
-                    await self._send_text(summary)
+    async def _report(self, accounts: list[str], results: list) -> None:
+        """Итоги проверенных аккаунтов: журнал, сводка в Telegram и уведомления о критических ошибках"""
+        total_new = 0
+        total_left = 0
+        successful_checks = 0
+        for account_id, result in zip(accounts, results):
+            if isinstance(result, Exception):
+                logger.error(f"Критическая ошибка при проверке аккаунта {account_id}: {result}")
+                error_msg = f"❌ Критическая ошибка при проверке аккаунта {ACCOUNT_ALIASES.get(account_id, account_id)}: {str(result)[:200]}"
+                await self._notify(error_msg)
+                continue
+            if result is None:
+                continue
+            new_count, left_count = result
+            total_new += new_count
+            total_left += left_count
+            successful_checks += 1
+
+        if self.page_cache:
+            st = self.page_cache.stats
+            logger.info(f"Кэш страниц: запросов {st['requests']}, без изменений {st['not_modified']} (304) "
+                        f"+ {st['unchanged_body']} (по хэшу), загружено {st['bytes_downloaded']} байт, "
+                        f"сэкономлено {st['bytes_avoided']} байт")
+
+        st = self.http_stats
+        logger.info(f"HTTP с запуска: запросов {st['requests']}, новых соединений {st['connections_created']}, "
+                    f"переиспользовано {st['connections_reused']}, DNS-запросов {st['dns_resolved']} "
+                    f"(из кэша {st['dns_cache_hits']}), сессий {st['sessions_created']}")
+        flow = self.smule_flow.state()
+        breakers = ", ".join(f"{b.endpoint} {STATE_NAMES[b.state]}" for b in self.breakers.values())
+        rate = f"{flow['rate']:.1f}/с" if flow["rate"] else "без ограничения"
+        logger.info(f"Нагрузка на Smule: окно {flow['limit']:.1f}, темп {rate}, "
+                    f"время ответа {flow['latency']:.2f}с, ответов 429/503 {flow['throttled']}, "
+                    f"ошибок {flow['failed']}, снижений {flow['decreases']}; автоматы: {breakers or 'нет'}")
+        st = self.profiles.stats
+        logger.info(f"Профили подписчиков: в памяти {len(self.profiles)}, попаданий {st['hits']}, "
+                    f"промахов {st['misses']}, ждут загрузки {len(self.profiles.wanted)}, "
+                    f"загружено {self.profile_stats['found']} из {self.profile_stats['requested']}")
+
+        # Отправляем сводку только если есть изменения или если все проверки прошли успешно
+        if total_new or total_left or successful_checks == len(accounts):
+            parts = []
+            if total_new:
+                parts.append(f"🔔 Новых: {total_new}")
+            if total_left:
+                parts.append(f"❌ Отписок: {total_left}")
+            if successful_checks < len(accounts):
+                parts.append(f"⚠️ Проверено: {successful_checks}/{len(accounts)}")
+
+            if parts:
+                summary = f"📊 Сводка: " + ", ".join(parts)
+                if SHARDING:
+                    summary += f" (реплика {self.replica})"
+                await self._notify(summary)
+
+    def _reschedule(self, accounts: list[str], results: list) -> None:
+        """Следующие сроки проверенных аккаунтов с учётом найденных изменений и числа запросов"""
+        now = time.time()
+        for account_id, result in zip(accounts, results):
+            requests = self.account_requests.pop(account_id, 0)
+            if account_id not in self.owned:
+                continue
+            deferred = self.account_deferred.pop(account_id, None)
+            if deferred is not None:
+                # Проверка не состоялась: статистику не трогаем, срок — к включению эндпоинта
+                self.scheduler.defer(account_id, deferred)
+                logger.debug(f"Аккаунт {account_id}: проверка отложена на {max(deferred - now, 0):.0f} секунд")
+                continue
+            events = sum(result) if isinstance(result, tuple) else 0
+            _, retry_at = self.account_backoff.get(account_id, (0, 0.0))
+            interval = self.scheduler.record(account_id, now, events, requests, retry_at)
+            logger.debug(f"Аккаунт {account_id}: событий {events}, запросов {requests}, "
+                         f"следующая проверка через {max(interval, retry_at - now):.0f} секунд")
 
     async def run_continuous(self, check_interval: int = 300) -> None:
-        logger.info(f"Запуск непрерывного мониторинга с интервалом {check_interval} секунд")
+        """Непрерывная проверка по срокам планировщика.
+
+        check_interval — исходный интервал для аккаунтов без истории;
+        дальше интервал каждого аккаунта подстраивается планировщиком.
+
+        Каждый аккаунт, срок которого наступил, проверяется отдельной задачей
+        (параллельность ограничивает account_semaphore), а цикл продолжает
+        следить за сроками, пока проверки идут: долгая полная загрузка или
+        пауза перед повтором одного аккаунта не сдвигает сроки остальных.
+        Проход — время от запуска первой проверки до завершения всех: за него
+        пишутся сводка, фазы и профиль по запросу.
+        """
+        logger.info(f"Запуск непрерывного мониторинга: исходный интервал {check_interval} секунд, "
+                    f"от {SCHED_MIN_INTERVAL:.0f} до {SCHED_MAX_INTERVAL:.0f} секунд по аккаунту, "
+                    f"бюджет {SMULE_REQUEST_BUDGET:.0f} запросов/мин")
+        self.scheduler.base_interval = check_interval
+        self.start_delivery()
+        self.start_profile_refresh()
+        self.start_lease_renewal()
+        self._loop_running = True
+
+        # Проверки в работе и итоги текущего прохода
+        running: dict[asyncio.Task, str] = {}
+        checked: list[str] = []
+        results: list = []
+        session: aiohttp.ClientSession | None = None
+        profiling = False
+        next_ownership = 0.0
         
         consecutive_failures = 0
-        max_consecutive_failures = 3
+        max_consecutive_failures = LOOP_MAX_FAILURES
         
-        while True:
-            try:
-                start_time = time.time()
-                await self.check_new_followers()
-                end_time = time.time()
-                
-                check_duration = end_time - start_time
-                consecutive_failures = 0  # Сбрасываем счетчик ошибок при успехе
-                logger.info(f"Проверка завершена за {check_duration:.2f} секунд")
-                
-                # Адаптивная задержка - если проверка заняла много времени, уменьшаем интервал ожидания
-                actual_interval = max(check_interval - check_duration, 60)  # Минимум 60 секунд
-                logger.info(f"Следующая проверка через {actual_interval:.0f} секунд")
-                
-                await asyncio.sleep(actual_interval)
+        try:
+            while True:
+                try:
+                    now = time.time()
+                    if now >= next_ownership:
+                        # Без шардирования список аккаунтов не меняется; при шардировании
+                        # владение пересматривается, чтобы отдать аккаунты новым репликам
+                        accounts = await self._refresh_ownership()
+                        self.scheduler.sync(accounts, now, busy=running.values())
+                        next_ownership = now + LEASE_TTL / 3 if SHARDING else float("inf")
+                    if not running:
+                        # Сессия пересоздаётся только между проходами, чтобы не закрыть её под проверками
+                        session = await self._get_session()
+
+                    due = self.scheduler.due(now)
+                    if due:
+                        if not running:
+                            self._tick_started = self._progress_at = now
+                            profiling = self.profiler.start()
+                            if self.page_cache:
+                                self.page_cache.reset_stats()
+                        self.metrics.cycle_lag.set(self.scheduler.last_lag)
+                        for account_id in due:
+                            running[asyncio.create_task(self._check_account_with_retry(session, account_id))] = account_id
+                        logger.info(f"Запущена проверка {len(due)} аккаунтов, в работе {len(running)}, "
+                                    f"параллельно до {ACCOUNT_CONCURRENCY}")
+
+                    # Ждём ближайшего срока или завершения проверки;
+                    # при шардировании просыпаемся и для пересмотра владения
+                    next_due = self.scheduler.next_due()
+                    wait = SCHED_MAX_INTERVAL if next_due is None else next_due - time.time()
+                    wait = max(min(wait, next_ownership - time.time()), 1.0)
+                    self._wake_at = time.time() + wait
+                    if running:
+                        done, _ = await asyncio.wait(running, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                    else:
+                        done = set()
+                        await asyncio.sleep(wait)
+
+                    if done:
+                        self._progress_at = time.time()
+                    for task in done:
+                        account_id = running.pop(task)
+                        result = task.exception() or task.result()
+                        self._reschedule([account_id], [result])
+                        checked.append(account_id)
+                        results.append(result)
+
+                    if checked and not running:
+                        end_time = time.time()
+                        check_duration = end_time - self._tick_started
+                        self._tick_started = None
+                        if profiling:
+                            self.profiler.stop()
+                            profiling = False
+                        await self._report(checked, results)
+                        self.metrics.cycle_duration.set(check_duration)
+                        next_due = self.scheduler.next_due()
+                        logger.info(f"Проверка {len(checked)} аккаунтов завершена за {check_duration:.2f} секунд, "
+                                    f"план: {self.scheduler.planned_rate():.1f} из {SMULE_REQUEST_BUDGET:.0f} запросов/мин"
+                                    + (f", следующая через {max(next_due - end_time, 0):.0f} секунд" if next_due else ""))
+                        logger.info(f"Фазы (сумма по параллельным задачам): {Tracer.format_totals(self.tracer.take_totals())}")
+                        checked, results = [], []
+
+                    consecutive_failures = 0  # Сбрасываем счетчик ошибок при успехе
+                    self._loop_failures = 0
+                    self.metrics.loop_heartbeat.set(time.time())
                 
-            except KeyboardInterrupt:
-                logger.info("Получен сигнал остановки")
-                break
-            except Exception as e:
-                consecutive_failures += 1
-                logger.error(f"Неожиданная ошибка цикла (попытка {consecutive_failures}): {e}")
+                except KeyboardInterrupt:
+                    logger.info("Получен сигнал остановки")
+                    break
+                except Exception as e:
+                    consecutive_failures += 1
+                    self._loop_failures = consecutive_failures
+                    logger.error(f"Неожиданная ошибка цикла (попытка {consecutive_failures}): {e}")
                 
-                # Отправляем уведомление о критической ошибке
-                if consecutive_failures == 1:
-                    error_msg = f"❌ Критическая ошибка в цикле мониторинга: {str(e)[:200]}"
-                    await self._send_text(error_msg)
-                elif consecutive_failures >= max_consecutive_failures:
-                    error_msg = f"❌ Критическая ошибка: {consecutive_failures} неудачных попыток подряд. Перезапуск через 5 минут."
-                    await self._send_text(error_msg)
-                    await asyncio.sleep(5 * 60)  # 5 минут при множественных ошибках
-                    consecutive_failures = 0  # Сбрасываем счетчик после длительной паузы
-                else:
-                    # Увеличиваем задержку при повторных ошибках
-                    wait_time = min(60 * consecutive_failures, 5 * 60)  # Максимум 5 минут
-                    logger.info(f"Ожидание {wait_time} секунд перед повтором")
-                    await asyncio.sleep(wait_time)
+                    # Отправляем уведомление о критической ошибке
+                    if consecutive_failures == 1:
+                        error_msg = f"❌ Критическая ошибка в цикле мониторинга: {str(e)[:200]}"
+                        await self._notify(error_msg)
+                    elif consecutive_failures >= max_consecutive_failures:
+                        wait_time = jittered_backoff(consecutive_failures, LOOP_BACKOFF_BASE, LOOP_BACKOFF_MAX)
+                        error_msg = (f"❌ Критическая ошибка: {consecutive_failures} неудачных попыток подряд. "
+                                     f"Перезапуск через {wait_time / 60:.0f} мин.")
+                        await self._notify(error_msg)
+                        self._wake_at = time.time() + wait_time
+                        await asyncio.sleep(wait_time)  # Длительная пауза при множественных ошибках
+                        consecutive_failures = 0  # Сбрасываем счетчик после длительной паузы
+                    else:
+                        # Увеличиваем задержку при повторных ошибках
+                        wait_time = jittered_backoff(consecutive_failures - 1, LOOP_BACKOFF_BASE, LOOP_BACKOFF_MAX)
+                        logger.info(f"Ожидание {wait_time:.0f} секунд перед повтором")
+                        self._wake_at = time.time() + wait_time
+                        await asyncio.sleep(wait_time)
+        finally:
+            # Остановка: незавершённые проверки не записаны и повторятся после запуска
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+
+    # ───────────────────────────────────────────────
+    # Пакетный режим
+    # ───────────────────────────────────────────────
+    async def scan_accounts(self, account_ids: Iterable[str]) -> AsyncIterator[tuple[str, tuple[int, int, int] | None]]:
+        """Однократная полная проверка аккаунтов: (аккаунт, (подписчиков, новых, отписок) или None при ошибке).
+
+        Аккаунты берутся из итератора по мере освобождения мест (в работе не
+        больше 2 × ACCOUNT_CONCURRENCY), результаты отдаются по мере готовности.
+        После проверки аккаунт забывается везде, кроме LRU AccountStateCache,
+        поэтому память не растёт с длиной списка. При шардировании аккаунт
+        проверяется под арендой; аккаунт, арендованный работающей репликой,
+        пропускается.
+        """
+        session = await self._get_session()
+        self.start_lease_renewal(heartbeat=False)
+        accounts = iter(account_ids)
+        pending: set[asyncio.Task] = set()
+
+        def start() -> bool:
+            account_id = next(accounts, None)
+            if account_id is None:
+                return False
+            pending.add(asyncio.create_task(self._scan_once(session, account_id)))
+            return True
+
+        try:
+            while len(pending) < 2 * max(1, ACCOUNT_CONCURRENCY) and start():
+                pass
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    start()
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _scan_once(self, session: aiohttp.ClientSession,
+                         account_id: str) -> tuple[str, tuple[int, int, int] | None]:
+        if SHARDING:
+            acquired = await asyncio.to_thread(self.store.acquire_leases, self.replica, [account_id],
+                                               time.time(), LEASE_TTL)
+            if not acquired:
+                logger.warning(f"Аккаунт {account_id} арендован работающей репликой, пропускаем")
+                return account_id, None
+        self.owned.add(account_id)
+        try:
+            result = await self._check_account_with_retry(session, account_id)
+            if result is None:
+                return account_id, None
+            [(_, followers)] = await asyncio.to_thread(self.store.follower_counts, [account_id])
+            return account_id, (followers, *result)
+        finally:
+            self._drop_account(account_id, keep_state=True)
+            if SHARDING:
+                # Под _lease_lock: фоновое продление не вернёт только что освобождённую аренду
+                async with self._lease_lock:
+                    await asyncio.to_thread(self.store.release_leases, self.replica, [account_id])
+            self.account_requests.pop(account_id, None)
+            self.metrics.forget_account(account_id)
 
 
 # ───────────────────────────────────────────────
 # main
 # ───────────────────────────────────────────────
-async def main():
+async def run_bot() -> None:
+    """Непрерывный мониторинг с уведомлениями в Telegram (команда run)"""
     TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
     CHAT_ID = os.getenv("CHAT_ID")
     ACCOUNT_IDS_STR = os.getenv("SMULE_ACCOUNT_IDS")
@@ -497,6 +2111,10 @@ async def main():
         logger.error("❌ ОШИБКА: Не все обязательные переменные настроены!")
         return
 
+    if SHARDING and not 0 <= REPLICA_INDEX < REPLICA_COUNT:
+        logger.error(f"❌ ОШИБКА: REPLICA_INDEX={REPLICA_INDEX} вне диапазона 0..{REPLICA_COUNT - 1}")
+        return
+
     bot = SmuleFollowersBot(TELEGRAM_TOKEN, CHAT_ID, ACCOUNT_IDS)
 
     startup = [
@@ -504,17 +2122,177 @@ async def main():
         f"📊 Отслеживается {len(ACCOUNT_IDS)} аккаунтов:"
     ]
     startup += [f"{i+1}. {ACCOUNT_ALIASES.get(acc, acc)}" for i, acc in enumerate(ACCOUNT_IDS)]
-    startup.append(f"⏱ Интервал проверки: {CHECK_INTERVAL} секунд")
+    startup.append(f"⏱ Интервал проверки: {CHECK_INTERVAL} секунд, "
+                   f"подстраивается от {SCHED_MIN_INTERVAL:.0f} до {SCHED_MAX_INTERVAL:.0f} секунд по аккаунту")
     startup.append("🚦 Rate limiting активирован")
+    if SHARDING:
+        startup.append(f"🧩 Реплика {REPLICA_INDEX} из {REPLICA_COUNT}, аккаунты делятся между репликами")
     
-    await bot._send_text("\n".join(startup))
+    await bot._notify("\n".join(startup))
+
+    if hasattr(signal, "SIGUSR1"):
+        def on_profile_signal():
+            # Стеки задач сразу (если цикл завис — видно где), профиль — за следующий проход
+            bot.profiler.dump_tasks_now()
+            bot.profiler.request()
+            logger.info("SIGUSR1: следующий проход будет профилирован")
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, on_profile_signal)
+
+    if HEALTH_PORT:
+        try:
+            await bot.start_health_server()
+        except OSError as e:
+            logger.error(f"Не удалось запустить сервер метрик на порту {HEALTH_PORT}: {e}")
+
+    try:
+        await bot.run_continuous(CHECK_INTERVAL)
+    finally:
+        await bot.close()
+
+
+def _account_ids(values: list[str], path: str | None) -> Iterator[str]:
+    """ID аккаунтов из аргументов (можно через запятую) и файла по одному в строке ('-' — stdin).
+
+    Файл читается лениво, поэтому длинный список не загружается в память целиком.
+    """
+    for value in values:
+        yield from (x.strip() for x in value.split(",") if x.strip())
+    if path:
+        with (open(sys.stdin.fileno(), encoding="utf-8", closefd=False) if path == "-"
+              else open(path, encoding="utf-8")) as f:
+            for line in f:
+                line = line.split("#", 1)[0].strip()
+                if line:
+                    yield line
 
-    await bot.run_continuous(CHECK_INTERVAL)
+
+def _parse_time(value: str) -> float:
+    """Время для --since/--until: YYYY-MM-DD, ISO 8601 (без зоны — UTC) или unix-время"""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"не время: {value}") from None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+async def scan_command(args: argparse.Namespace) -> int:
+    """Однократная проверка аккаунтов без Telegram; результат по аккаунту в stdout"""
+    if args.accounts or args.accounts_file:
+        account_ids = _account_ids(args.accounts, args.accounts_file)
+    else:
+        account_ids = _account_ids([os.getenv("SMULE_ACCOUNT_IDS", "")], None)
+    chat_id = os.getenv("CHAT_ID")
+    if args.notify and not chat_id:
+        logger.error("❌ Для --notify нужен CHAT_ID")
+        return 2
+
+    bot = SmuleFollowersBot(None, chat_id, [], notify=args.notify)
+    if SHARDING:
+        # Разовый номер реплики: не входит в кольцо и не перехватывает живую аренду
+        bot.replica = -os.getpid()
+    checked = failed = total_new = total_left = 0
+    try:
+        async with aclosing(bot.scan_accounts(account_ids)) as results:
+            async for account_id, result in results:
+                if result is None:
+                    failed += 1
+                    row = {"account_id": account_id, "ok": False}
+                    line = f"{account_id}\tошибка"
+                else:
+                    checked += 1
+                    followers, new, left = result
+                    total_new += new
+                    total_left += left
+                    row = {"account_id": account_id, "ok": True, "followers": followers,
+                           "followed": new, "unfollowed": left}
+                    line = f"{account_id}\t{followers}\t+{new}\t-{left}"
+                print(json.dumps(row) if args.json else line, flush=True)
+    finally:
+        await bot.close()
+    logger.info(f"Проверено аккаунтов: {checked}, с ошибкой: {failed}, "
+                f"новых подписчиков: {total_new}, отписок: {total_left}")
+    return 1 if failed else 0
+
+
+def export_command(args: argparse.Namespace) -> int:
+    fmt = args.format or ("parquet" if args.output.endswith(".parquet") else "csv")
+    source = os.path.join(DATA_DIR, "followers.db") if args.what == "followers" else EVENT_LOG_DIR
+    account_ids = None
+    if args.accounts or args.accounts_file:
+        account_ids = list(_account_ids(args.accounts, args.accounts_file))
+    export(args.what, fmt, args.output, source, account_ids, args.since, args.until, args.jobs)
+    return 0
+
+
+def diff_command(args: argparse.Namespace) -> int:
+    with (open(sys.stdout.fileno(), "w", encoding="utf-8", newline="", closefd=False) if args.output == "-"
+          else open(args.output, "w", encoding="utf-8", newline="")) as out:
+        followed, unfollowed = diff_snapshots(args.old, args.new, out)
+    logger.info(f"Между снимками: подписок {followed}, отписок {unfollowed}")
+    return 0
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="smule_bot.py",
+        description="Уведомления о подписчиках Smule. Без команды — непрерывный мониторинг (run). "
+                    "Команды scan, export и diff работают с той же базой в DATA_DIR и без Telegram.")
+    commands = parser.add_subparsers(dest="command", metavar="команда")
+    commands.add_parser("run", help="непрерывный мониторинг с уведомлениями в Telegram (по умолчанию)")
+
+    scan = commands.add_parser("scan", help="однократная полная проверка аккаунтов")
+    scan.add_argument("accounts", nargs="*", help="ID аккаунтов, можно через запятую (по умолчанию SMULE_ACCOUNT_IDS)")
+    scan.add_argument("-f", "--accounts-file", help="файл с ID аккаунтов по одному в строке, '-' — stdin")
+    scan.add_argument("--notify", action="store_true",
+                      help="поставить уведомления в очередь, их отправит работающий бот (нужен CHAT_ID)")
+    scan.add_argument("--json", action="store_true", help="результаты JSON-строками")
+
+    exporting = commands.add_parser("export", help="выгрузка подписчиков или журнала событий в CSV или Parquet")
+    exporting.add_argument("what", choices=("followers", "events"), help="текущие подписчики или журнал событий")
+    exporting.add_argument("accounts", nargs="*", help="ID аккаунтов, можно через запятую (по умолчанию все)")
+    exporting.add_argument("-f", "--accounts-file", help="файл с ID аккаунтов по одному в строке, '-' — stdin")
+    exporting.add_argument("-o", "--output", required=True, help="файл CSV ('-' — stdout) или каталог Parquet")
+    exporting.add_argument("--format", choices=FORMATS,
+                           help="по умолчанию parquet, если output оканчивается на .parquet, иначе csv")
+    exporting.add_argument("--since", type=_parse_time, default=0.0,
+                           help="начало интервала событий: YYYY-MM-DD, ISO 8601 или unix-время")
+    exporting.add_argument("--until", type=_parse_time, default=float("inf"), help="конец интервала событий")
+    exporting.add_argument("-j", "--jobs", type=int, default=0,
+                           help="процессов чтения и кодирования (0 — по числу ядер)")
+
+    diff = commands.add_parser("diff", help="подписки и отписки между двумя снимками export followers")
+    diff.add_argument("old", help="прежний снимок: CSV или Parquet")
+    diff.add_argument("new", help="новый снимок: CSV или Parquet")
+    diff.add_argument("-o", "--output", default="-", help="файл CSV, '-' — stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    logging.getLogger().setLevel(getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO))
+    try:
+        if args.command == "scan":
+            return asyncio.run(scan_command(args))
+        if args.command == "export":
+            return export_command(args)
+        if args.command == "diff":
+            return diff_command(args)
+    except (OSError, ValueError, RuntimeError) as e:
+        logger.error(f"❌ {e}")
+        return 2
+    asyncio.run(run_bot())
+    return 0
 
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        sys.exit(main())
     except KeyboardInterrupt:
         logger.info("Бот остановлен пользователем")
     except Exception as e:
@@ -0,0 +1,212 @@
+import asyncio
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
+
+# Текущий спан задачи: дочерние задачи asyncio наследуют его через контекст
+_current: ContextVar["Span | None"] = ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes", "status")
+
+    def __init__(self, name: str, trace_id: str, span_id: str, parent_id: str, attributes: dict):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.status = "OK"
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+
+class Tracer:
+    """Спаны фаз проверки: суммарное время по фазам и, если задан файл, JSON-строки.
+
+    Запись в файле повторяет поля спана OpenTelemetry (trace_id, span_id,
+    parent_span_id, start/end_time_unix_nano, attributes, status), поэтому
+    её можно загрузить в коллектор или разобрать jq. Спаны вложены:
+    время smule.request включает decode, account.check — все фазы аккаунта.
+    Аккаунты проверяются параллельно, поэтому сумма по фазе может быть
+    больше длительности прохода.
+    """
+
+    def __init__(self, path: str = "", max_bytes: int = 50 * 1024 * 1024,
+                 service: str = "smule-followers-bot"):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.service = service
+        self._file = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._file = open(path, "a", encoding="utf-8")
+        # фаза -> [секунд, спанов]: за текущий проход и с запуска
+        self.totals: dict[str, list[float]] = {}
+        self.cumulative: dict[str, list[float]] = {}
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        parent = _current.get()
+        if self._file:
+            trace_id = parent.trace_id if parent else os.urandom(16).hex()
+            span = Span(name, trace_id, os.urandom(8).hex(), parent.span_id if parent else "", attributes)
+        else:
+            span = Span(name, "", "", "", attributes)
+        token = _current.set(span)
+        start_ns = time.time_ns()
+        started = time.perf_counter()
+        try:
+            yield span
+        except Exception as e:
+            span.status = "ERROR"
+            span.attributes["error"] = repr(e)[:200]
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+            for totals in (self.totals, self.cumulative):
+                entry = totals.get(name)
+                if entry is None:
+                    totals[name] = [elapsed, 1]
+                else:
+                    entry[0] += elapsed
+                    entry[1] += 1
+            if self._file:
+                self._write(span, start_ns, start_ns + int(elapsed * 1e9), parent is None)
+
+    def _write(self, span: Span, start_ns: int, end_ns: int, root: bool) -> None:
+        record = {
+            "name": span.name,
+            "trace_id": span.trace_id,
+            "span_id": span.span_id,
+            "parent_span_id": span.parent_id,
+            "start_time_unix_nano": start_ns,
+            "end_time_unix_nano": end_ns,
+            "duration_ms": round((end_ns - start_ns) / 1e6, 3),
+            "status": span.status,
+            "attributes": span.attributes,
+            "service.name": self.service,
+        }
+        try:
+            self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            if root:
+                self._file.flush()
+                if self._file.tell() > self.max_bytes:
+                    self._rotate()
+        except OSError as e:
+            logger.error(f"Ошибка записи трассировки в {self.path}: {e}")
+
+    def _rotate(self) -> None:
+        self._file.close()
+        os.replace(self.path, self.path + ".1")
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def take_totals(self) -> dict[str, list[float]]:
+        """Время по фазам с прошлого вызова"""
+        totals, self.totals = self.totals, {}
+        return totals
+
+    @staticmethod
+    def format_totals(totals: dict[str, list[float]]) -> str:
+        ordered = sorted(totals.items(), key=lambda item: -item[1][0])
+        return ", ".join(f"{name} {seconds:.2f}с×{int(count)}" for name, (seconds, count) in ordered)
+
+    def close(self) -> None:
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+def dump_tasks(path: str) -> int:
+    """Стек каждой задачи asyncio в текстовый файл; возвращает число задач"""
+    tasks = sorted(asyncio.all_tasks(), key=lambda t: t.get_name())
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')}, задач: {len(tasks)}\n")
+        for task in tasks:
+            f.write(f"\n── {task.get_name()} ({'done' if task.done() else 'pending'}): {task.get_coro()!r}\n")
+            task.print_stack(file=f)
+    return len(tasks)
+
+
+class CycleProfiler:
+    """cProfile и дамп задач asyncio для одного прохода по запросу.
+
+    request() (сигнал или переменная окружения) помечает следующий проход.
+    За проход пишутся cycle-<время>.prof (для snakeviz/pstats), .txt с
+    функциями по суммарному времени и .tasks.txt со стеками задач через
+    task_dump_delay секунд после начала прохода, пока проверки ещё идут.
+    """
+
+    def __init__(self, directory: str, task_dump_delay: float = 1.0):
+        self.directory = directory
+        self.task_dump_delay = task_dump_delay
+        self.requested = False
+        self._profile: cProfile.Profile | None = None
+        self._dump_task: asyncio.Task | None = None
+        self._prefix = ""
+
+    def request(self) -> None:
+        self.requested = True
+
+    def dump_tasks_now(self) -> str | None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"tasks-{time.strftime('%Y%m%d-%H%M%S')}.txt")
+        try:
+            count = dump_tasks(path)
+        except OSError as e:
+            logger.error(f"Ошибка записи дампа задач: {e}")
+            return None
+        logger.info(f"Дамп {count} задач asyncio: {path}")
+        return path
+
+    def start(self) -> bool:
+        """Начало профилирования, если оно запрошено"""
+        if not self.requested or self._profile is not None:
+            return False
+        os.makedirs(self.directory, exist_ok=True)
+        self._prefix = os.path.join(self.directory, f"cycle-{time.strftime('%Y%m%d-%H%M%S')}")
+        self._dump_task = asyncio.create_task(self._dump_later(self._prefix + ".tasks.txt"))
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        return True
+
+    async def _dump_later(self, path: str) -> None:
+        await asyncio.sleep(self.task_dump_delay)
+        dump_tasks(path)
+
+    def stop(self, discard: bool = False) -> None:
+        """Сохранение профиля; discard — проход не показателен, профилируется следующий"""
+        profile, self._profile = self._profile, None
+        if profile is None:
+            return
+        profile.disable()
+        dump_task, self._dump_task = self._dump_task, None
+        if discard:
+            dump_task.cancel()
+            return
+        self.requested = False
+        try:
+            if not dump_task.done():
+                # Проход завершился раньше отложенного дампа
+                dump_task.cancel()
+                dump_tasks(self._prefix + ".tasks.txt")
+            profile.dump_stats(self._prefix + ".prof")
+            text = io.StringIO()
+            pstats.Stats(profile, stream=text).sort_stats("cumulative").print_stats(40)
+            with open(self._prefix + ".txt", "w", encoding="utf-8") as f:
+                f.write(text.getvalue())
+        except OSError as e:
+            logger.error(f"Ошибка записи профиля прохода: {e}")
+            return
+        logger.info(f"Профиль прохода: {self._prefix}.prof, .txt, .tasks.txt")